@@ -61,7 +61,18 @@ def get_calendar_color(calendar, default_color, collection):
 
 def get_color_list(calendars, default_color, collection):
     """Get the list of possible colors for the day, taking into account priority
+
+    Memoized per collection (see `collection._color_lists`), as there are only
+    few distinct sets of calendars on the days of a month.
     """
+    key = (frozenset(calendars), default_color)
+    if key not in collection._color_lists:
+        collection._color_lists[key] = _get_color_list(key[0], default_color, collection)
+    return list(collection._color_lists[key])
+
+
+def _get_color_list(calendars, default_color, collection):
+    """see get_color_list"""
     dcolors = list(
         map(lambda x: (get_calendar_color(x, default_color, collection),
                        collection._calendars[x]['priority']), calendars)
@@ -78,9 +89,7 @@ def get_color_list(calendars, default_color, collection):
         map(lambda x: x[0], dcolors)
     )
 
-    dcolors = list(set(dcolors))
-
-    return dcolors
+    return tuple(set(dcolors))
 
 
 def str_highlight_day(
@@ -194,6 +203,13 @@ def vertical_month(month=None,
     month_abbr_len = get_month_abbr_len()
     khal.append(style(' ' * month_abbr_len + weekheaders + ' ' + w_number, bold=True))
     _calendar = calendar.Calendar(firstweekday)
+    if highlight_event_days:
+        # fetch the calendars of all days shown at once
+        last_year, last_month = divmod(year * 12 + month + count - 2, 12)
+        collection.get_calendars_in(
+            _calendar.monthdatescalendar(year, month)[0][0],
+            _calendar.monthdatescalendar(last_year, last_month + 1)[-1][-1],
+        )
     for _ in range(count):
         for week in _calendar.monthdatescalendar(year, month):
             if monthdisplay == 'firstday':
@@ -25,6 +25,7 @@ import os
 import stat
 import sys
 import textwrap
+from operator import attrgetter
 from shutil import get_terminal_size
 
 import click
@@ -171,6 +172,8 @@ def build_collection(conf, selection):
             color=conf['highlight_days']['color'],
             locale=conf['locale'],
             dbpath=conf['sqlite']['path'],
+            journal_mode=conf['sqlite']['journal_mode'],
+            processes=conf['sqlite']['update_processes'],
             hmethod=conf['highlight_days']['method'],
             default_color=conf['highlight_days']['default_color'],
             multiple=conf['highlight_days']['multiple'],
@@ -284,7 +287,8 @@ def _get_cli():
                 bold_for_light_color=ctx.obj['conf']['view']['bold_for_light_color'],
                 env={"calendars": ctx.obj['conf']['calendars']}
             )
-            click.echo('\n'.join(rows))
+            for row in rows:
+                click.echo(row)
         except FatalError as error:
             logger.debug(error, exc_info=True)
             logger.fatal(error)
@@ -323,7 +327,8 @@ def _get_cli():
                 conf=ctx.obj['conf'],
                 env={"calendars": ctx.obj['conf']['calendars']}
             )
-            click.echo('\n'.join(event_column))
+            for line in event_column:
+                click.echo(line)
         except FatalError as error:
             logger.debug(error, exc_info=True)
             logger.fatal(error)
@@ -561,7 +566,7 @@ def _get_cli():
                 ctx.obj['conf'],
                 multi_calendar_select(ctx, include_calendar, exclude_calendar)
             )
-            events = sorted(collection.search(search_string))
+            events = sorted(collection.search(search_string), key=attrgetter('sort_key'))
             event_column = list()
             term_width, _ = get_terminal_size()
             now = dt.datetime.now()
@@ -634,7 +639,8 @@ def _get_cli():
                 conf=ctx.obj['conf'],
                 env={"calendars": ctx.obj['conf']['calendars']}
             )
-            click.echo('\n'.join(rows))
+            for row in rows:
+                click.echo(row)
         except FatalError as error:
             logger.debug(error, exc_info=True)
             logger.fatal(error)
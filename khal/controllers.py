@@ -25,6 +25,7 @@ import logging
 import os
 import textwrap
 from collections import OrderedDict, defaultdict
+from operator import attrgetter
 from shutil import get_terminal_size
 
 import pytz
@@ -39,7 +40,7 @@ from .exceptions import ConfigurationError
 from .icalendar import (cal_from_ics, new_event as new_vevent, split_ics,
                         sort_key as sort_vevent_key)
 from .khalendar.vdir import Item
-from .terminal import merge_columns
+from .terminal import iter_merge_columns
 
 logger = logging.getLogger('khal')
 
@@ -118,7 +119,7 @@ def calendar(collection, agenda_format=None, notstarted=False, once=False, dater
         highlight_event_days=highlight_event_days,
         locale=locale,
         bold_for_light_color=bold_for_light_color)
-    return merge_columns(calendar_column, event_column, width=lwidth)
+    return iter_merge_columns(calendar_column, event_column, width=lwidth)
 
 
 def start_end_from_daterange(daterange, locale,
@@ -147,7 +148,7 @@ def start_end_from_daterange(daterange, locale,
 
 def get_events_between(
         collection, locale, start, end, agenda_format=None, notstarted=False,
-        env=None, width=None, seen=None, original_start=None):
+        env=None, width=None, seen=None, original_start=None, events=None):
     """returns a list of events scheduled between start and end. Start and end
     are strings or datetimes (of some kind).
 
@@ -164,6 +165,9 @@ def get_events_between(
     :type nostarted: bool
     :param original_start: start datetime to compare against of notstarted is set
     :type original_start: datetime.datetime
+    :param events: the events between start and end, if already known (they
+        are fetched from `collection` otherwise)
+    :type events: list(khal.khalendar.event.Event)
     :returns: a list to be printed as the agenda for the given days
     :rtype: list(str)
     """
@@ -174,15 +178,11 @@ def get_events_between(
         env = {}
     assert start
     assert end
-    start_local = locale['local_timezone'].localize(start)
-    end_local = locale['local_timezone'].localize(end)
+    start = start.replace(tzinfo=None)
+    end = end.replace(tzinfo=None)
 
-    start = start_local.replace(tzinfo=None)
-    end = end_local.replace(tzinfo=None)
-
-    events = sorted(collection.get_localized(start_local, end_local))
-    events_float = sorted(collection.get_floating(start, end))
-    events = sorted(events + events_float)
+    if events is None:
+        events = collection.get_range(start, end)
     for event in events:
         # yes the logic could be simplified, but I believe it's easier
         # to understand what's going on here this way
@@ -212,8 +212,12 @@ def get_events_between(
 def khal_list(collection, daterange=None, conf=None, agenda_format=None,
               day_format=None, once=False, notstarted=False, width=False,
               env=None, datepoint=None):
+    """returns the lines of the agenda of all events in `daterange`
+
+    The lines are generated lazily, a day at a time, invalid arguments are
+    reported right away, though.
+    """
     assert daterange is not None or datepoint is not None
-    """returns a list of all events in `daterange`"""
     # because empty strings are also Falsish
     if agenda_format is None:
         agenda_format = conf['view']['agenda_event_format']
@@ -248,32 +252,44 @@ def khal_list(collection, daterange=None, conf=None, agenda_format=None,
             )
         logger.debug('Getting all events between {} and {}'.format(start, end))
 
-    event_column = []
+    return _khal_list(collection, start, end, conf, agenda_format, day_format,
+                      once, notstarted, width, env)
+
+
+def _khal_list(collection, start, end, conf, agenda_format, day_format,
+               once, notstarted, width, env):
+    """yields the lines of khal_list"""
+    empty = True
     once = set() if once else None
     if env is None:
         env = {}
 
     original_start = conf['locale']['local_timezone'].localize(start)
+    events_per_day = collection.get_events_per_day(start, end)
     while start < end:
         if start.date() == end.date():
             day_end = end
         else:
             day_end = dt.datetime.combine(start.date(), dt.time.max)
+        _, events = next(events_per_day)
         current_events = get_events_between(
             collection, locale=conf['locale'], agenda_format=agenda_format, start=start,
             end=day_end, notstarted=notstarted, original_start=original_start,
             env=env,
             seen=once,
             width=width,
+            events=events,
         )
         if day_format and (conf['default']['show_all_days'] or current_events):
-            event_column.append(format_day(start.date(), day_format, conf['locale']))
-        event_column.extend(current_events)
+            yield format_day(start.date(), day_format, conf['locale'])
+            empty = False
+        if current_events:
+            yield from current_events
+            empty = False
         start = dt.datetime(*start.date().timetuple()[:3]) + dt.timedelta(days=1)
 
-    if event_column == []:
-        event_column = [style('No events', bold=True)]
-    return event_column
+    if empty:
+        yield style('No events', bold=True)
 
 
 def new_interactive(collection, calendar_name, conf, info, location=None,
@@ -523,9 +539,11 @@ def edit(collection, search_string, locale, format=None, allow_past=False, conf=
     term_width, _ = get_terminal_size()
     now = conf['locale']['local_timezone'].localize(dt.datetime.now())
 
-    events = sorted(collection.search(search_string))
+    events = sorted(collection.search(search_string), key=attrgetter('sort_key'))
     for event in events:
-        if not allow_past:
+        # recurring events are only found once (with their first instance),
+        # later instances might still lie in the future
+        if not allow_past and not event.recurpattern:
             if event.allday and event.end < now.date():
                 continue
             elif not event.allday and event.end_local < now:
@@ -34,6 +34,9 @@ from .utils import generate_random_uid, localize_strip_tz, to_unix_time
 
 logger = logging.getLogger('khal')
 
+# seconds by which the time range given to `expand` is widened in each direction
+WINDOW_SLACK = 24 * 60 * 60
+
 
 def split_ics(ics, random_uid=False, default_timezone=None):
     """split an ics string into several according to VEVENT's UIDs
@@ -183,7 +186,15 @@ def ics_from_list(events, tzs, random_uid=False, default_timezone=None):
     return calendar.to_ical().decode('utf-8')
 
 
-def expand(vevent, href=''):
+def _shift(datetime_, delta):
+    """return `datetime_` + `delta`, limited to what datetime can represent"""
+    try:
+        return datetime_ + delta
+    except OverflowError:
+        return dt.datetime.max if delta > dt.timedelta(0) else dt.datetime.min
+
+
+def expand(vevent, href='', start=None, end=None):
     """
     Constructs a list of start and end dates for all recurring instances of the
     event defined in vevent.
@@ -199,6 +210,13 @@ def expand(vevent, href=''):
     :param href: the href of the vevent, used for more informative logging and
                  nothing else
     :type href: str
+    :param start: if given (together with `end`), only recurring instances
+                  overlapping the time range from `start` to `end` are
+                  returned (and calculated), otherwise all instances (but at
+                  most until 2037) are returned
+    :type start: datetime.datetime (timezone aware)
+    :param end: end of that time range
+    :type end: datetime.datetime (timezone aware)
     :returns: list of start and end (date)times of the expanded event
     :rtype: list(tuple(datetime, datetime))
     """
@@ -223,6 +241,19 @@ def expand(vevent, href=''):
         return date
 
     rrule_param = vevent.get('RRULE')
+    # only events with an RRULE can have (nearly) endless recurrences
+    windowed = expand and rrule_param is not None and start is not None
+    if windowed:
+        # we are generous with the window's borders, a few instances too many
+        # do not hurt, but DST transitions and the like might otherwise make
+        # us miss one
+        start_u = to_unix_time(start) - WINDOW_SLACK
+        end_u = to_unix_time(end) + WINDOW_SLACK
+
+    def in_window(date):
+        return not windowed or (
+            to_unix_time(date) <= end_u and to_unix_time(date + duration) >= start_u)
+
     if expand and rrule_param is not None:
         vevent = sanitize_rrule(vevent)
 
@@ -253,15 +284,29 @@ def expand(vevent, href=''):
         )
 
         if rrule._until is None:
-            # rrule really doesn't like to calculate all recurrences until
-            # eternity, so we only do it until 2037, because a) I'm not sure
-            # if python can deal with larger datetime values yet and b) pytz
-            # doesn't know any larger transition times
-            rrule._until = dt.datetime(2037, 12, 31)
+            if not windowed:
+                # rrule really doesn't like to calculate all recurrences until
+                # eternity, so we only do it until 2037, because a) I'm not
+                # sure if python can deal with larger datetime values yet and
+                # b) pytz doesn't know any larger transition times
+                rrule._until = dt.datetime(2037, 12, 31)
         elif events_tz and 'Z' in rrule_param.to_ical().decode():
             rrule._until = pytz.UTC.localize(
                 rrule._until).astimezone(events_tz).replace(tzinfo=None)
 
+        if windowed:
+            if events_tz:
+                window_tz = events_tz
+            else:
+                # floating events are stored as if they were in UTC
+                window_tz = pytz.UTC
+            slack = dt.timedelta(seconds=2 * WINDOW_SLACK)
+            rrule = rrule.between(
+                _shift(start.astimezone(window_tz).replace(tzinfo=None), -abs(duration) - slack),
+                _shift(end.astimezone(window_tz).replace(tzinfo=None), slack),
+                inc=True,
+            )
+
         rrule = map(sanitize_datetime, rrule)
 
         logger.debug('calculating recurrence dates for {}, this might take some time.'.format(href))
@@ -269,7 +314,7 @@ def expand(vevent, href=''):
         # RRULE and RDATE may specify the same date twice, it is recommended by
         # the RFC to consider this as only one instance
         dtstartl = set(rrule)
-        if not dtstartl:
+        if not dtstartl and not windowed:
             raise UnsupportedRecurrence()
     else:
         dtstartl = {vevent['DTSTART'].dt}
@@ -289,6 +334,7 @@ def expand(vevent, href=''):
     # include explicitly specified recursion dates
     if expand:
         dtstartl.update(get_dates(vevent, 'RDATE') or ())
+    dtstartl = {date for date in dtstartl if in_window(date)}
 
     # remove excluded dates
     if expand:
@@ -296,6 +342,9 @@ def expand(vevent, href=''):
             try:
                 dtstartl.remove(date)
             except KeyError:
+                if not in_window(date):
+                    # not an error, the instance might exist outside the window
+                    continue
                 logger.warning(
                     'In event {}, excluded instance starting at {} not found, '
                     'event might be invalid.'.format(href, date))
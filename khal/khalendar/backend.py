@@ -22,13 +22,15 @@
 The SQLite backend implementation.
 """
 
+import bisect
 import contextlib
 import datetime as dt
+from collections import namedtuple
 from enum import IntEnum
 import logging
 import sqlite3
 from os import makedirs, path
-from typing import Any, Dict, Iterable, List, Optional, Tuple, Union
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple, Union
 
 import icalendar
 import pytz
@@ -43,7 +45,46 @@ from .exceptions import (CouldNotCreateDbDir, OutdatedDbVersionError,
 
 logger = logging.getLogger('khal')
 
-DB_VERSION = 5  # The current db layout version
+DB_VERSION = 10  # The current db layout version
+
+# functions upgrading the db layout by one version, keyed by the version they
+# upgrade from (see `migration()`)
+MIGRATIONS = dict()  # type: Dict[int, Callable[[SQLiteDb], None]]
+
+# instances of recurring events are only calculated and stored for a window
+# around now, queries outside of this window extend it (by at least
+# EXPANSION_STEP in the respective direction)
+EXPANSION_PAST = dt.timedelta(days=365)
+EXPANSION_FUTURE = dt.timedelta(days=2 * 365)
+EXPANSION_STEP = dt.timedelta(days=365)
+# the window can't be extended beyond what datetime can represent (see
+# get_instances()), with a day to spare for converting it to other timezones
+MIN_TIMESTAMP = int(utils.to_unix_time(dt.datetime.min + dt.timedelta(days=1)))
+MAX_TIMESTAMP = int(utils.to_unix_time(dt.datetime.max - dt.timedelta(days=1)))
+
+# an event parsed and expanded by `parse_event()`, ready to be inserted into the
+# db, `vevents` holds the result of `get_instances()` and `get_search_row()` for
+# each of the event's VEVENTs
+ParsedEvent = namedtuple('ParsedEvent', [
+    'vevent_str', 'href', 'calendar', 'window', 'properties', 'recurring', 'sequence', 'vevents',
+])
+
+# item, href, start, end, ref, etag, calendar and the stored properties
+EventTuple = Tuple[str, str, Optional[dt.date], Optional[dt.date], str, str, str,
+                   Optional[Dict[str, Any]]]
+
+# properties of the master VEVENT which are stored in the events table, so
+# that events can be displayed without parsing them
+PROPERTY_COLUMNS = [
+    'uid', 'summary', 'location', 'description', 'status', 'categories', 'organizer',
+    'rrule', 'recurring',
+]
+
+# the properties of each VEVENT which are indexed for searching
+SEARCH_COLUMNS = ['summary', 'description', 'location', 'categories', 'attendee']
+
+# seconds to wait for another khal instance to finish writing to the db
+BUSY_TIMEOUT = 30
 
 RECURRENCE_ID = 'RECURRENCE-ID'
 THISANDFUTURE = 'THISANDFUTURE'
@@ -68,12 +109,19 @@ class SQLiteDb(object):
         combination should be unique.
     :param db_path: path where this sqlite database will be saved, if this is
         None, a place according to the XDG specifications will be chosen
+    :param journal_mode: sqlite's journal mode, with `wal` readers never wait
+        for writers
+
+    All writes happen in transactions which take the database's write lock
+    right away (see `at_once()`), so that several khal instances can update
+    the db concurrently, one after the other.
     """
 
     def __init__(self,
                  calendars: Iterable[str],
                  db_path: Optional[str],
-                 locale: Dict[str, str],
+                 locale: Dict[str, Any],
+                 journal_mode: str='wal',
                  ) -> None:
         assert db_path is not None
         self.calendars = list(calendars)
@@ -81,25 +129,65 @@ class SQLiteDb(object):
         self._create_dbdir()
         self.locale = locale
         self._at_once = False
-        self.conn = sqlite3.connect(self.db_path)
+        self._calendar_ids = dict()  # type: Dict[str, int]
+        self._calendar_names = dict()  # type: Dict[int, str]
+        # transactions are handled explicitly (see at_once()), outside of them
+        # every statement is committed on its own
+        self.conn = sqlite3.connect(self.db_path, timeout=BUSY_TIMEOUT, isolation_level=None)
         self.cursor = self.conn.cursor()
+        if self.db_path != ':memory:':
+            self.cursor.execute('PRAGMA journal_mode = {0}'.format(journal_mode))
+        # INSERT OR REPLACE into the recs tables needs to fire the delete
+        # triggers which keep the interval indexes in sync
+        self.cursor.execute('PRAGMA recursive_triggers = ON')
+        self._rtree = has_module(self.conn, 'rtree')
+        self._fts = has_module(self.conn, 'fts5')
+        self._check_table_version()
         self._create_default_tables()
         self._check_calendars_exists()
-        self._check_table_version()
 
     @contextlib.contextmanager
     def at_once(self):
+        """run all statements inside this context in one transaction
+
+        The transaction takes the write lock immediately, if another process
+        is already writing to the database, we wait (up to BUSY_TIMEOUT) for
+        it to finish. Taking the lock only on the first write could fail
+        without waiting, if another process commits in the mean time.
+        """
         assert not self._at_once
+        self.cursor.execute('BEGIN IMMEDIATE')
         self._at_once = True
         try:
             yield self
         except:  # noqa
+            self.conn.rollback()
             raise
         else:
             self.conn.commit()
         finally:
             self._at_once = False
 
+    @contextlib.contextmanager
+    def released(self):
+        """commit the transaction of at_once() and start a new one afterwards,
+        other connections can write to the db while inside this context"""
+        assert self._at_once
+        self.conn.commit()
+        try:
+            yield self
+        finally:
+            self.cursor.execute('BEGIN IMMEDIATE')
+
+    @contextlib.contextmanager
+    def _transaction(self):
+        """like at_once(), but does nothing if already inside at_once()"""
+        if self._at_once:
+            yield self
+        else:
+            with self.at_once():
+                yield self
+
     def _create_dbdir(self) -> None:
         """create the dbdir if it doesn't exist"""
         if self.db_path == ':memory:':
@@ -116,8 +204,11 @@ class SQLiteDb(object):
 
     def _check_table_version(self) -> None:
         """tests for current db Version
-        if the table is still empty, insert db_version
+        if the table is still empty, insert db_version, if the db is outdated,
+        migrate it to the current version
         """
+        self.cursor.execute('CREATE TABLE IF NOT EXISTS '
+                            'version (version INTEGER)')
         self.cursor.execute('SELECT version FROM version')
         result = self.cursor.fetchone()
         if result is None:
@@ -125,67 +216,256 @@ class SQLiteDb(object):
                                 (DB_VERSION, ))
             self.conn.commit()
         elif not result[0] == DB_VERSION:
+            self._migrate(result[0])
+
+    def _migrate(self, version: int) -> None:
+        """upgrade the db from `version` to DB_VERSION, all in one transaction
+
+        Tables and indexes new in DB_VERSION are created afterwards by
+        `_create_default_tables()`.
+        """
+        steps = range(version, DB_VERSION)
+        if not steps or any(step not in MIGRATIONS for step in steps):
             raise OutdatedDbVersionError(
                 str(self.db_path) +
                 " is probably an invalid or outdated database.\n"
                 "You should consider removing it and running khal again.")
+        with self.at_once():
+            # another process might have migrated the db in the mean time
+            if self.sql_ex('SELECT version FROM version', ())[0][0] == DB_VERSION:
+                return
+            for step in steps:
+                logger.info('migrating {0} from version {1} to {2}'.format(
+                    self.db_path, step, step + 1))
+                MIGRATIONS[step](self)
+            self.sql_ex('UPDATE version SET version = ?;', (DB_VERSION, ))
 
     def _create_default_tables(self) -> None:
-        """creates version and calendar tables and inserts table version number
+        """creates calendar, event and index tables
         """
-        self.cursor.execute('CREATE TABLE IF NOT EXISTS '
-                            'version (version INTEGER)')
-        logger.debug("created version table")
-
         self.cursor.execute('''CREATE TABLE IF NOT EXISTS calendars (
+            id INTEGER PRIMARY KEY,
             calendar TEXT NOT NULL UNIQUE,
             resource TEXT NOT NULL,
-            ctag TEXT
+            ctag TEXT,
+            window_start INT NOT NULL,
+            window_end INT NOT NULL
             )''')
         self.cursor.execute('''CREATE TABLE IF NOT EXISTS events (
+                id INTEGER PRIMARY KEY,
                 href TEXT NOT NULL,
-                calendar TEXT NOT NULL,
+                calendar_id INT NOT NULL REFERENCES calendars( id ),
                 sequence INT,
                 etag TEXT,
                 item TEXT,
-                primary key (href, calendar)
+                uid TEXT,
+                summary TEXT,
+                location TEXT,
+                description TEXT,
+                status TEXT,
+                categories TEXT,
+                organizer TEXT,
+                rrule TEXT,
+                recurring INT NOT NULL DEFAULT 0,
+                UNIQUE (href, calendar_id)
                 );''')
-        self.cursor.execute('''CREATE TABLE IF NOT EXISTS recs_loc (
+        # floating instances are stored as if they were in UTC
+        self.cursor.execute('''CREATE TABLE IF NOT EXISTS recs (
             dtstart INT NOT NULL,
             dtend INT NOT NULL,
-            href TEXT NOT NULL REFERENCES events( href ),
-            rec_inst TEXT NOT NULL,
+            event_id INT NOT NULL REFERENCES events( id ),
+            rec_inst INT NOT NULL,
             ref TEXT NOT NULL,
             dtype INT NOT NULL,
-            calendar TEXT NOT NULL,
-            primary key (href, rec_inst, calendar)
+            floating INT NOT NULL,
+            primary key (event_id, rec_inst)
             );''')
-        self.cursor.execute('''CREATE TABLE IF NOT EXISTS recs_float (
-            dtstart INT NOT NULL,
-            dtend INT NOT NULL,
-            href TEXT NOT NULL REFERENCES events( href ),
-            rec_inst TEXT NOT NULL,
+        self._create_interval_index('recs')
+        self.cursor.execute('''CREATE TABLE IF NOT EXISTS search (
+            id INTEGER PRIMARY KEY,
+            event_id INT NOT NULL REFERENCES events( id ),
             ref TEXT NOT NULL,
-            dtype INT NOT NULL,
-            calendar TEXT NOT NULL,
-            primary key (href, rec_inst, calendar)
+            summary TEXT NOT NULL,
+            description TEXT NOT NULL,
+            location TEXT NOT NULL,
+            categories TEXT NOT NULL,
+            attendee TEXT NOT NULL
             );''')
+        self.cursor.execute(
+            'CREATE INDEX IF NOT EXISTS search_event ON search (event_id);')
+        self._create_search_index()
         self.conn.commit()
 
+    def _create_search_index(self) -> None:
+        """create a full text index over the `search` table
+
+        The index is an FTS5 table using `search` as its external content,
+        kept in sync by triggers. If sqlite's FTS5 module is not available,
+        `search` is searched with LIKE instead.
+        """
+        if not self._fts:
+            return
+        self.cursor.execute(
+            "SELECT count(*) FROM sqlite_master WHERE type = 'table' AND name = 'search_fts';")
+        if self.cursor.fetchone()[0]:
+            return
+        columns = ', '.join(SEARCH_COLUMNS)
+        old_columns = ', '.join('old.' + column for column in SEARCH_COLUMNS)
+        new_columns = ', '.join('new.' + column for column in SEARCH_COLUMNS)
+        self.cursor.execute(
+            "CREATE VIRTUAL TABLE search_fts USING fts5({0}, content='search', "
+            "content_rowid='id');".format(columns))
+        self.cursor.execute("INSERT INTO search_fts (search_fts) VALUES ('rebuild');")
+        self.cursor.execute('''CREATE TRIGGER IF NOT EXISTS search_fts_insert
+            AFTER INSERT ON search BEGIN
+                INSERT INTO search_fts (rowid, {0}) VALUES (new.id, {1});
+            END;'''.format(columns, new_columns))
+        self.cursor.execute('''CREATE TRIGGER IF NOT EXISTS search_fts_delete
+            AFTER DELETE ON search BEGIN
+                INSERT INTO search_fts (search_fts, rowid, {0}) VALUES ('delete', old.id, {1});
+            END;'''.format(columns, old_columns))
+
+    def _create_interval_index(self, table: str) -> None:
+        """create an index on `table`'s (dtstart, dtend) intervals
+
+        If sqlite's R*Tree module is available, the index is an R*Tree
+        (`table`_index) kept in sync with `table` by triggers, otherwise we
+        fall back to an ordinary index on dtstart.
+        """
+        if not self._rtree:
+            self.cursor.execute(
+                'CREATE INDEX IF NOT EXISTS {0}_dtstart ON {0} (dtstart, dtend);'.format(table))
+            return
+        self.cursor.execute(
+            "SELECT count(*) FROM sqlite_master WHERE type = 'table' AND name = ?;",
+            (table + '_index', ))
+        if self.cursor.fetchone()[0]:
+            return
+        self.cursor.execute(
+            'CREATE VIRTUAL TABLE {0}_index USING rtree(id, dtstart, dtend);'.format(table))
+        self.cursor.execute(
+            'INSERT INTO {0}_index (id, dtstart, dtend) '
+            'SELECT rowid, min(dtstart, dtend), max(dtstart, dtend) FROM {0};'.format(table))
+        # R*Tree coordinates are stored as 32-bit floats and are therefore
+        # rounded outwards, the index can only be used for preselecting
+        # candidates, the exact comparison is done on `table` itself
+        self.cursor.execute('''CREATE TRIGGER IF NOT EXISTS {0}_index_insert
+            AFTER INSERT ON {0} BEGIN
+                INSERT INTO {0}_index (id, dtstart, dtend) VALUES
+                    (new.rowid, min(new.dtstart, new.dtend), max(new.dtstart, new.dtend));
+            END;'''.format(table))
+        self.cursor.execute('''CREATE TRIGGER IF NOT EXISTS {0}_index_update
+            AFTER UPDATE OF dtstart, dtend ON {0} BEGIN
+                UPDATE {0}_index SET
+                    dtstart = min(new.dtstart, new.dtend),
+                    dtend = max(new.dtstart, new.dtend)
+                WHERE id = new.rowid;
+            END;'''.format(table))
+        self.cursor.execute('''CREATE TRIGGER IF NOT EXISTS {0}_index_delete
+            AFTER DELETE ON {0} BEGIN
+                DELETE FROM {0}_index WHERE id = old.rowid;
+            END;'''.format(table))
+
+    def _recs_source(self, table: str) -> str:
+        """return a FROM clause for `table` which allows preselecting all rows
+        that might overlap a time range via `_recs_overlap`
+        """
+        if self._rtree:
+            return '{0}_index CROSS JOIN {0} ON {0}.rowid = {0}_index.id'.format(table)
+        return table
+
+    def _recs_overlap(self, table: str) -> str:
+        """return a (loose) WHERE condition, that selects all rows from `table`
+        which (might) overlap a time range given as (end, start)
+        """
+        if self._rtree:
+            return '{0}_index.dtstart <= ? AND {0}_index.dtend >= ?'.format(table)
+        return '{0}.dtstart <= ? AND {0}.dtend >= ?'.format(table)
+
     def _check_calendars_exists(self) -> None:
         """make sure an entry for the current calendar exists in `calendar`
         table
         """
         for cal in self.calendars:
-            self.cursor.execute('''SELECT count(*) FROM calendars WHERE calendar = ?;''', (cal,))
-            result = self.cursor.fetchone()
+            self._calendar_id(cal)
+
+    def _calendar_id(self, calendar: str) -> int:
+        """return the id of `calendar` in the `calendars` table (inserting it,
+        if necessary)"""
+        if calendar not in self._calendar_ids:
+            sql_s = 'SELECT id FROM calendars WHERE calendar = ?;'
+            result = self.sql_ex(sql_s, (calendar, ))
+            if not result:
+                self._insert_calendar(calendar)
+                result = self.sql_ex(sql_s, (calendar, ))
+            self._calendar_ids[calendar] = result[0][0]
+            self._calendar_names[result[0][0]] = calendar
+        return self._calendar_ids[calendar]
+
+    def _calendars_ids(self) -> List[int]:
+        """return the ids of all calendars in `self.calendars`"""
+        return [self._calendar_id(calendar) for calendar in self.calendars]
+
+    def _insert_calendar(self, calendar: str) -> None:
+        """insert `calendar` into the `calendars` table, with the default
+        expansion window around now"""
+        now = dt.datetime.now(pytz.UTC)
+        sql_s = ('INSERT INTO calendars (calendar, resource, window_start, window_end) '
+                 'VALUES (?, ?, ?, ?);')
+        stuple = (calendar, '', utils.to_unix_time(now - EXPANSION_PAST),
+                  utils.to_unix_time(now + EXPANSION_FUTURE))
+        self.sql_ex(sql_s, stuple)
 
-            if result[0] != 0:
-                logger.debug("tables for calendar {0} exist".format(cal))
-            else:
-                sql_s = 'INSERT INTO calendars (calendar, resource) VALUES (?, ?);'
-                stuple = (cal, '')
-                self.sql_ex(sql_s, stuple)
+    def get_window(self, calendar: str) -> Tuple[int, int]:
+        """return the time range (as unix timestamps) for which the instances
+        of `calendar`'s recurring events are stored
+        """
+        sql_s = 'SELECT window_start, window_end FROM calendars WHERE id = ?;'
+        return tuple(self.sql_ex(sql_s, (self._calendar_id(calendar), ))[0])
+
+    def _ensure_window(self, start: int, end: int) -> None:
+        """make sure all instances of recurring events between `start` and
+        `end` (unix timestamps) are stored, for all calendars in
+        `self.calendars`
+        """
+        for calendar in self.calendars:
+            if not self._missing_ranges(calendar, start, end):
+                continue
+            with self.at_once():
+                # another process might have extended the window while we
+                # were waiting for the write lock
+                ranges = self._missing_ranges(calendar, start, end)
+                if not ranges:
+                    continue
+                logger.debug('extending the expansion window of calendar {}'.format(calendar))
+                self._expand_recurring(calendar, ranges)
+                sql_s = ('UPDATE calendars SET window_start = min(window_start, ?), '
+                         'window_end = max(window_end, ?) WHERE id = ?;')
+                self.sql_ex(sql_s, (ranges[0][0], ranges[-1][1], self._calendar_id(calendar)))
+
+    def _missing_ranges(self, calendar: str, start: int, end: int) -> List[Tuple[int, int]]:
+        """return the ranges by which `calendar`'s expansion window needs to be
+        extended to cover `start` to `end`"""
+        step = int(EXPANSION_STEP.total_seconds())
+        window_start, window_end = self.get_window(calendar)
+        ranges = []
+        if start < window_start:
+            ranges.append((max(start - step, MIN_TIMESTAMP), window_start))
+        if end > window_end:
+            ranges.append((window_end, min(end + step, MAX_TIMESTAMP)))
+        return ranges
+
+    def _expand_recurring(self, calendar: str, ranges: List[Tuple[int, int]]) -> None:
+        """store all instances of `calendar`'s recurring events in `ranges`"""
+        sql_s = 'SELECT id, href, item FROM events WHERE calendar_id = ? AND recurring = 1;'
+        for event_id, href, item in self.sql_ex(sql_s, (self._calendar_id(calendar), )):
+            ical = cal_from_ics(item)
+            vevents = [sanitize_vevent(c, self.locale['default_timezone'], href, calendar) for
+                       c in ical.walk() if c.name == 'VEVENT']
+            vevents.sort(key=sort_vevent_key)
+            for start, end in ranges:
+                for vevent in vevents:
+                    self._update_impl(vevent, event_id, href, window=(start, end))
 
     def sql_ex(self, statement: str, stuple: tuple=Union[tuple, str]) -> List:
         """wrapper for sql statements, does a "fetchall" """
@@ -195,7 +475,14 @@ class SQLiteDb(object):
             self.conn.commit()
         return result
 
-    def update(self, vevent_str: str, href: str, etag: str='', calendar: str=None) -> None:
+    def sql_many(self, statement: str, stuples: List[tuple]) -> None:
+        """wrapper for executing sql statements with many parameter tuples"""
+        self.cursor.executemany(statement, stuples)
+        if not self._at_once:
+            self.conn.commit()
+
+    def update(self, vevent_str: str, href: str, etag: str='',
+               calendar: Optional[str]=None) -> Set[dt.date]:
         """insert a new or update an existing event into the db
 
         This is mostly a wrapper around two SQL statements, doing some cleanup
@@ -211,37 +498,51 @@ class SQLiteDb(object):
         :param etag: the etag of the vcard, if this etag does not match the
             remote etag on next sync, this card will be updated from the server.
             For locally created vcards this should not be set
+        :returns: the (local) days on which instances of the old or the new
+            version of the event are shown, i.e. the days that changed
         """
         assert calendar is not None
         assert href is not None
-        ical = cal_from_ics(vevent_str)
-        check_for_errors(ical, calendar, href)
-        if not assert_only_one_uid(ical):
-            logger.warning(
-                "The .ics file at {}/{} contains multiple UIDs.\n"
-                "This should not occur in vdir .ics files.\n"
-                "If you didn't edit the file by hand, please report a bug "
-                "at https://github.com/pimutils/khal/issues .\n"
-                "If you want to import it, please use `khal import FILE`."
-                "".format(calendar, href)
-            )
-            raise NonUniqueUID
-        vevents = (sanitize_vevent(c, self.locale['default_timezone'], href, calendar) for
-                   c in ical.walk() if c.name == 'VEVENT')
-        # Need to delete the whole event in case we are updating a
-        # recurring event with an event which is either not recurring any
-        # more or has EXDATEs, as those would be left in the recursion
-        # tables. There are obviously better ways to achieve the same
-        # result.
-        self.delete(href, calendar=calendar)
-        for vevent in sorted(vevents, key=sort_vevent_key):
-            check_for_errors(vevent, calendar, href)
-            check_support(vevent, href, calendar)
-            self._update_impl(vevent, href, calendar)
-
-        sql_s = ('INSERT INTO events (item, etag, href, calendar) VALUES (?, ?, ?, ?);')
-        stuple = (vevent_str, etag, href, calendar)
-        self.sql_ex(sql_s, stuple)
+        event = parse_event(
+            vevent_str, href, calendar, self.locale['default_timezone'], self.get_window(calendar))
+        return self.update_parsed(event, etag=etag)
+
+    def update_parsed(self, event: ParsedEvent, etag: str='') -> Set[dt.date]:
+        """insert an event returned by `parse_event()` into the db
+
+        see update()
+        """
+        with self._transaction():
+            window = self.get_window(event.calendar)
+            if window != event.window:
+                # the expansion window was extended since the event was parsed
+                event = parse_event(event.vevent_str, event.href, event.calendar,
+                                    self.locale['default_timezone'], window)
+            # Need to delete the whole event in case we are updating a
+            # recurring event with an event which is either not recurring any
+            # more or has EXDATEs, as those would be left in the recursion
+            # tables. There are obviously better ways to achieve the same
+            # result.
+            days = self.delete(event.href, calendar=event.calendar)
+
+            sql_s = ('INSERT INTO events (item, etag, href, calendar_id, sequence, recurring, '
+                     '{0}) VALUES (?, ?, ?, ?, ?, ?, {1});'.format(
+                         ', '.join(PROPERTY_COLUMNS[:-1]),
+                         ', '.join(['?'] * (len(PROPERTY_COLUMNS) - 1))))
+            if event.properties is None:
+                values = (None, ) * (len(PROPERTY_COLUMNS) - 1)
+            else:
+                values = tuple(event.properties[column] for column in PROPERTY_COLUMNS[:-1])
+            stuple = (event.vevent_str, etag, event.href, self._calendar_id(event.calendar),
+                      event.sequence, event.recurring) + values
+            self.sql_ex(sql_s, stuple)
+            event_id = self.cursor.lastrowid
+            assert event_id is not None
+            for instances, shift, search_row in event.vevents:
+                self._insert_instances(event_id, instances, shift)
+                self._insert_search(event_id, search_row)
+            days.update(self._instance_days('id = ?', (event_id, )))
+        return days
 
     def update_vcf_dates(self, vevent_str: str, href: str, etag: str='',
                          calendar: str=None) -> None:
@@ -262,138 +563,116 @@ class SQLiteDb(object):
         """
         assert calendar is not None
         assert href is not None
-        # Delete all event entries for this contact
-        self.deletelike(href + '%', calendar=calendar)
-        ical = cal_from_ics(vevent_str)
-        vcard = ical.walk()[0]
-        for key in vcard.keys():
-            if key in ['BDAY', 'X-ANNIVERSARY', 'ANNIVERSARY'] or key.endswith('X-ABDATE'):
-                date = vcard[key]
-                if isinstance(date, list):
-                    logger.warning(
-                        'Vcard {0} in collection {1} has more than one '
-                        '{2}, will be skipped and not be available '
-                        'in khal.'.format(href, calendar, key)
-                    )
-                    continue
-                try:
-                    if date[0:2] == '--' and date[3] != '-':
-                        date = '1900' + date[2:]
-                        orig_date = False
+        with self._transaction():
+            # Delete all event entries for this contact
+            self.deletelike(href + '%', calendar=calendar)
+            window = self.get_window(calendar)
+            ical = cal_from_ics(vevent_str)
+            vcard = ical.walk()[0]
+            for key in vcard.keys():
+                if key in ['BDAY', 'X-ANNIVERSARY', 'ANNIVERSARY'] or key.endswith('X-ABDATE'):
+                    date = vcard[key]
+                    if isinstance(date, list):
+                        logger.warning(
+                            'Vcard {0} in collection {1} has more than one '
+                            '{2}, will be skipped and not be available '
+                            'in khal.'.format(href, calendar, key)
+                        )
+                        continue
+                    try:
+                        if date[0:2] == '--' and date[3] != '-':
+                            date = '1900' + date[2:]
+                            orig_date = False
+                        else:
+                            orig_date = True
+                        date = parser.parse(date).date()
+                    except ValueError:
+                        logger.warning(
+                            'cannot parse {0} in {1} in collection {2}'.format(key, href, calendar))
+                        continue
+                    if 'FN' in vcard:
+                        name = vcard['FN']
                     else:
-                        orig_date = True
-                    date = parser.parse(date).date()
-                except ValueError:
-                    logger.warning(
-                        'cannot parse {0} in {1} in collection {2}'.format(key, href, calendar))
-                    continue
-                if 'FN' in vcard:
-                    name = vcard['FN']
-                else:
-                    n = vcard['N'].split(';')
-                    name = ' '.join([n[1], n[2], n[0]])
-                vevent = icalendar.Event()
-                vevent.add('dtstart', date)
-                vevent.add('dtend', date + dt.timedelta(days=1))
-                if date.month == 2 and date.day == 29:  # leap year
-                    vevent.add('rrule', {'freq': 'YEARLY', 'BYYEARDAY': 60})
-                else:
-                    vevent.add('rrule', {'freq': 'YEARLY'})
-                description = get_vcard_event_description(vcard, key)
-                if orig_date:
-                    if key == 'BDAY':
-                        xtag = 'x-birthday'
-                    elif key.endswith('ANNIVERSARY'):
-                        xtag = 'x-anniversary'
+                        n = vcard['N'].split(';')
+                        name = ' '.join([n[1], n[2], n[0]])
+                    vevent = icalendar.Event()
+                    vevent.add('dtstart', date)
+                    vevent.add('dtend', date + dt.timedelta(days=1))
+                    if date.month == 2 and date.day == 29:  # leap year
+                        vevent.add('rrule', {'freq': 'YEARLY', 'BYYEARDAY': 60})
                     else:
-                        xtag = 'x-abdate'
-                        vevent.add('x-ablabel', description)
-                    vevent.add(xtag,
-                               '{:04}{:02}{:02}'.format(date.year, date.month, date.day))
-                    vevent.add('x-fname', name)
-                vevent.add('summary',
-                           '{0}\'s {1}'.format(name, description))
-                vevent.add('uid', href + key)
-                vevent_str = vevent.to_ical().decode('utf-8')
-                self._update_impl(vevent, href + key, calendar)
-                sql_s = ('INSERT INTO events (item, etag, href, calendar)'
-                         ' VALUES (?, ?, ?, ?);')
-                stuple = (vevent_str, etag, href + key, calendar)
-                self.sql_ex(sql_s, stuple)
-
-    def _update_impl(self, vevent: icalendar.cal.Event, href: str, calendar: str) -> None:
-        """insert `vevent` into the database
-
-        expand `vevent`'s recurrence rules (if needed) and insert all instance
-        in the respective tables
-        than insert non-recurring and original recurring (those with an RRULE
-        property) events into table `events`
+                        vevent.add('rrule', {'freq': 'YEARLY'})
+                    description = get_vcard_event_description(vcard, key)
+                    if orig_date:
+                        if key == 'BDAY':
+                            xtag = 'x-birthday'
+                        elif key.endswith('ANNIVERSARY'):
+                            xtag = 'x-anniversary'
+                        else:
+                            xtag = 'x-abdate'
+                            vevent.add('x-ablabel', description)
+                        vevent.add(xtag,
+                                   '{:04}{:02}{:02}'.format(date.year, date.month, date.day))
+                        vevent.add('x-fname', name)
+                    vevent.add('summary',
+                               '{0}\'s {1}'.format(name, description))
+                    vevent.add('uid', href + key)
+                    vevent_str = vevent.to_ical().decode('utf-8')
+                    sql_s = ('INSERT INTO events (item, etag, href, calendar_id, recurring)'
+                             ' VALUES (?, ?, ?, ?, 1);')
+                    stuple = (vevent_str, etag, href + key, self._calendar_id(calendar))
+                    self.sql_ex(sql_s, stuple)
+                    event_id = self.cursor.lastrowid
+                    assert event_id is not None
+                    self._update_impl(vevent, event_id, href + key, window)
+                    self._update_search(vevent, event_id)
+
+    def _update_impl(self, vevent: icalendar.cal.Event, event_id: int, href: str,
+                     window: Tuple[int, int]) -> None:
+        """insert the instances of `vevent` into the database
+
+        :param event_id: id of the row in table `events` the instances belong to
+        :param window: only instances of RRULEs which overlap this time range
+            (given as unix timestamps) are inserted
         """
-        # TODO FIXME this function is a steaming pile of shit
-        rec_id = vevent.get(RECURRENCE_ID)
-        if rec_id is None:
-            rrange = None
-        else:
-            rrange = rec_id.params.get('RANGE')
-
-        # testing on datetime.date won't work as datetime is a child of date
-        if not isinstance(vevent['DTSTART'].dt, dt.datetime):
-            dtype = EventType.DATE
-        else:
-            dtype = EventType.DATETIME
-        if ('TZID' in vevent['DTSTART'].params and dtype == EventType.DATETIME) or \
-                getattr(vevent['DTSTART'].dt, 'tzinfo', None):
-            recs_table = 'recs_loc'
-        else:
-            recs_table = 'recs_float'
-
-        thisandfuture = (rrange == THISANDFUTURE)
-        if thisandfuture:
-            start_shift, duration = calc_shift_deltas(vevent)
-            start_shift_seconds = start_shift.days * 3600 * 24 + start_shift.seconds
-            duration_seconds = duration.days * 3600 * 24 + duration.seconds
-
-        dtstartend = expand_vevent(vevent, href)
-        if not dtstartend:
-            # Does this event even have dates? Technically it is possible for
-            # events to be empty/non-existent by deleting all their recurrences
-            # through EXDATE.
+        self._insert_instances(event_id, *get_instances(vevent, href, window))
+
+    def _insert_instances(self, event_id: int, instances: List[tuple],
+                          shift: Optional[tuple]) -> None:
+        """insert the instances returned by `get_instances()` for the event
+        `event_id`"""
+        if shift is not None:
+            # all instances from RECURRENCE-ID on are shifted by the same
+            # amount, which is done with one statement
+            recs_sql_s = (
+                'UPDATE recs SET dtstart = rec_inst + ?, dtend = rec_inst + ?, ref = ? '
+                'WHERE rec_inst >= ? AND event_id = ? AND floating = ?;')
+            start_shift, end_shift, ref, rec_inst, floating = shift
+            self.sql_ex(recs_sql_s, (start_shift, end_shift, ref, rec_inst, event_id, floating))
             return
-
-        for dtstart, dtend in dtstartend:
-            if dtype == EventType.DATE:
-                dbstart = utils.to_unix_time(dtstart)
-                dbend = utils.to_unix_time(dtend)
-            else:
-                dbstart = utils.to_unix_time(dtstart)
-                dbend = utils.to_unix_time(dtend)
-
-            if rec_id is not None:
-                ref = rec_inst = str(utils.to_unix_time(rec_id.dt))
-            else:
-                rec_inst = str(dbstart)
-                ref = PROTO
-
-            if thisandfuture:
-                recs_sql_s = (
-                    'UPDATE {0} SET dtstart = rec_inst + ?, dtend = rec_inst + ?, ref = ? '
-                    'WHERE rec_inst >= ? AND href = ? AND calendar = ?;'.format(recs_table))
-                stuple_f = (
-                    start_shift_seconds, start_shift_seconds + duration_seconds,
-                    ref, rec_inst, href, calendar,
-                )
-                self.sql_ex(recs_sql_s, stuple_f)
-            else:
-                recs_sql_s = (
-                    'INSERT OR REPLACE INTO {0} '
-                    '(dtstart, dtend, href, ref, dtype, rec_inst, calendar)'
-                    'VALUES (?, ?, ?, ?, ?, ?, ?);'.format(recs_table))
-                stuple_n = (dbstart, dbend, href, ref, dtype, rec_inst, calendar)
-                self.sql_ex(recs_sql_s, stuple_n)
+        if not instances:
+            return
+        recs_sql_s = (
+            'INSERT OR REPLACE INTO recs '
+            '(dtstart, dtend, event_id, ref, dtype, rec_inst, floating)'
+            'VALUES (?, ?, ?, ?, ?, ?, ?);')
+        self.sql_many(recs_sql_s, [
+            (dbstart, dbend, event_id, ref, dtype, rec_inst, floating)
+            for dbstart, dbend, ref, dtype, rec_inst, floating in instances])
+
+    def _update_search(self, vevent: icalendar.cal.Event, event_id: int) -> None:
+        """insert `vevent`'s searchable properties into the `search` table"""
+        self._insert_search(event_id, get_search_row(vevent))
+
+    def _insert_search(self, event_id: int, search_row: tuple) -> None:
+        """insert a row returned by `get_search_row()` into the `search` table"""
+        sql_s = ('INSERT INTO search (event_id, ref, {0}) VALUES (?, ?, {1});'
+                 ''.format(', '.join(SEARCH_COLUMNS), ', '.join(['?'] * len(SEARCH_COLUMNS))))
+        self.sql_ex(sql_s, (event_id, ) + search_row)
 
     def get_ctag(self, calendar=str) -> Optional[str]:
-        stuple = (calendar, )
-        sql_s = 'SELECT ctag FROM calendars WHERE calendar = ?;'
+        stuple = (self._calendar_id(calendar), )
+        sql_s = 'SELECT ctag FROM calendars WHERE id = ?;'
         try:
             ctag = self.sql_ex(sql_s, stuple)[0][0]
             return ctag
@@ -401,8 +680,8 @@ class SQLiteDb(object):
             return None
 
     def set_ctag(self, ctag: str, calendar: str):
-        stuple = (ctag, calendar, )
-        sql_s = 'UPDATE calendars SET ctag = ? WHERE calendar = ?;'
+        stuple = (ctag, self._calendar_id(calendar), )
+        sql_s = 'UPDATE calendars SET ctag = ? WHERE id = ?;'
         self.sql_ex(sql_s, stuple)
         self.conn.commit()
 
@@ -413,27 +692,58 @@ class SQLiteDb(object):
         return: etag
         rtype: str()
         """
-        sql_s = 'SELECT etag FROM events WHERE href = ? AND calendar = ?;'
+        sql_s = 'SELECT etag FROM events WHERE href = ? AND calendar_id = ?;'
         try:
-            etag = self.sql_ex(sql_s, (href, calendar))[0][0]
+            etag = self.sql_ex(sql_s, (href, self._calendar_id(calendar)))[0][0]
             return etag
         except IndexError:
             return None
 
-    def delete(self, href: str, etag: Any=None, calendar: str=None):
+    def delete(self, href: str, etag: Any=None, calendar: Optional[str]=None) -> Set[dt.date]:
         """
         removes the event from the db,
 
         :param etag: only there for compatibility with vdirsyncer's Storage,
                      we always delete
-        :returns: None
+        :returns: the (local) days on which instances of the event were shown
         """
         assert calendar is not None
-        for table in ['recs_loc', 'recs_float']:
-            sql_s = 'DELETE FROM {0} WHERE href = ? AND calendar = ?;'.format(table)
-            self.sql_ex(sql_s, (href, calendar))
-        sql_s = 'DELETE FROM events WHERE href = ? AND calendar = ?;'
-        self.sql_ex(sql_s, (href, calendar))
+        stuple = (href, self._calendar_id(calendar))
+        with self._transaction():
+            days = self._instance_days('href = ? AND calendar_id = ?', stuple)
+            self._delete_where('href = ? AND calendar_id = ?', [stuple])
+        return days
+
+    def _instance_days(self, condition: str, stuple: tuple) -> Set[dt.date]:
+        """return the (local) days on which the stored instances of the events
+        matching `condition` (on table `events`) are shown"""
+        sql_s = ('SELECT dtstart, dtend, dtype, floating FROM recs WHERE event_id IN '
+                 '(SELECT id FROM events WHERE {0});'.format(condition))
+        timezone = self.locale['local_timezone']  # type: dt.tzinfo
+        days = set()  # type: Set[dt.date]
+        for dtstart, dtend, dtype, floating in self.sql_ex(sql_s, stuple):
+            day, last = get_instance_days(dtstart, dtend, dtype, floating, timezone)
+            while day <= last:
+                days.add(day)
+                day += dt.timedelta(days=1)
+        return days
+
+    def delete_many(self, hrefs: Iterable[str], calendar: str) -> None:
+        """removes all events with one of `hrefs` from the db"""
+        calendar_id = self._calendar_id(calendar)
+        stuples = [(href, calendar_id) for href in hrefs]
+        if stuples:
+            self._delete_where('href = ? AND calendar_id = ?', stuples)
+
+    def _delete_where(self, condition: str, stuples: List[tuple]) -> None:
+        """remove all events matching `condition` (on table `events`, for any
+        of `stuples`) together with their instances"""
+        with self._transaction():
+            for table in ['recs', 'search']:
+                sql_s = ('DELETE FROM {0} WHERE event_id IN '
+                         '(SELECT id FROM events WHERE {1});'.format(table, condition))
+                self.sql_many(sql_s, stuples)
+            self.sql_many('DELETE FROM events WHERE {0};'.format(condition), stuples)
 
     def deletelike(self, href: str, etag: Any=None, calendar: str=None):
         """
@@ -446,11 +756,8 @@ class SQLiteDb(object):
         :returns: None
         """
         assert calendar is not None
-        for table in ['recs_loc', 'recs_float']:
-            sql_s = 'DELETE FROM {0} WHERE href LIKE ? AND calendar = ?;'.format(table)
-            self.sql_ex(sql_s, (href, calendar))
-        sql_s = 'DELETE FROM events WHERE href LIKE ? AND calendar = ?;'
-        self.sql_ex(sql_s, (href, calendar))
+        self._delete_where('href LIKE ? AND calendar_id = ?',
+                           [(href, self._calendar_id(calendar))])
 
     def list(self, calendar):
         """ list all events in `calendar`
@@ -458,31 +765,51 @@ class SQLiteDb(object):
         used for testing
         :returns: list of (href, etag)
         """
-        sql_s = 'SELECT href, etag FROM events WHERE calendar = ?;'
-        return list(set(self.sql_ex(sql_s, (calendar, ))))
+        sql_s = 'SELECT href, etag FROM events WHERE calendar_id = ?;'
+        return list(set(self.sql_ex(sql_s, (self._calendar_id(calendar), ))))
+
+    def list_etags(self, calendar: str) -> Dict[str, str]:
+        """return the etags of all events in `calendar`, keyed by href"""
+        sql_s = 'SELECT href, etag FROM events WHERE calendar_id = ?;'
+        return dict(self.sql_ex(sql_s, (self._calendar_id(calendar), )))
 
     def get_localized_calendars(self, start: dt.datetime, end: dt.datetime) -> Iterable[str]:
         assert start.tzinfo is not None
         assert end.tzinfo is not None
-        start_u = utils.to_unix_time(start)
-        end_u = utils.to_unix_time(end)
-        sql_s = (
-            'SELECT events.calendar FROM '
-            'recs_loc JOIN events ON '
-            'recs_loc.href = events.href AND '
-            'recs_loc.calendar = events.calendar WHERE '
-            '(dtstart >= ? AND dtstart <= ? OR '
-            'dtend > ? AND dtend <= ? OR '
-            'dtstart <= ? AND dtend >= ?) AND events.calendar in ({0}) '
-            'ORDER BY dtstart')
-        stuple = tuple(
-            [start_u, end_u, start_u, end_u, start_u, end_u] + list(self.calendars))  # type: ignore
-        result = self.sql_ex(sql_s.format(','.join(["?"] * len(self.calendars))), stuple)
-        for calendar in result:
-            yield calendar[0]  # result is always an iterable, even if getting only one item
+        return self._get_calendars(
+            localized=(utils.to_unix_time(start), utils.to_unix_time(end)))
+
+    def get_floating_calendars(self, start: dt.datetime, end: dt.datetime) -> Iterable[str]:
+        assert start.tzinfo is None
+        assert end.tzinfo is None
+        return self._get_calendars(floating=(utils.to_unix_time(start), utils.to_unix_time(end)))
+
+    def get_calendars(self, start: dt.datetime, end: dt.datetime) -> Iterable[str]:
+        """return the calendars of all events between `start` and `end`
+        (naive datetimes in local time)"""
+        localized, floating = self._local_ranges(start, end)
+        return self._get_calendars(localized, floating)
+
+    def get_calendars_by_day(self, start: dt.date, end: dt.date) -> Dict[dt.date, Set[str]]:
+        """return the calendars of all events on each day between `start` and
+        `end` (both inclusive), with one query for the whole range"""
+        localized, floating = self._local_ranges(
+            dt.datetime.combine(start, dt.time.min), dt.datetime.combine(end, dt.time.max))
+        days = {start + dt.timedelta(days=offset): set()
+                for offset in range((end - start).days + 1)}  # type: Dict[dt.date, Set[str]]
+        columns = 'events.calendar_id, recs.dtstart, recs.dtend, recs.dtype, recs.floating'
+        timezone = self.locale['local_timezone']  # type: dt.tzinfo
+        for calendar_id, dtstart, dtend, dtype, floating in self._select_instances(
+                columns, localized, floating):
+            first, last = get_instance_days(dtstart, dtend, dtype, floating, timezone)
+            day = max(first, start)
+            while day <= min(last, end):
+                days[day].add(self._calendar_names[calendar_id])
+                day += dt.timedelta(days=1)
+        return days
 
     def get_localized(self, start, end) \
-            -> Iterable[Tuple[str, str, dt.datetime, dt.datetime, str, str, str]]:
+            -> Iterable[EventTuple]:
         """returns
         :type start: datetime.datetime
         :type end: datetime.datetime
@@ -491,46 +818,11 @@ class SQLiteDb(object):
         """
         assert start.tzinfo is not None
         assert end.tzinfo is not None
-        start = utils.to_unix_time(start)
-        end = utils.to_unix_time(end)
-        sql_s = (
-            'SELECT item, recs_loc.href, dtstart, dtend, ref, etag, dtype, events.calendar '
-            'FROM recs_loc JOIN events ON '
-            'recs_loc.href = events.href AND '
-            'recs_loc.calendar = events.calendar WHERE '
-            '(dtstart >= ? AND dtstart <= ? OR '
-            'dtend > ? AND dtend <= ? OR '
-            'dtstart <= ? AND dtend >= ?) AND events.calendar in ({0}) '
-            'ORDER BY dtstart')
-        stuple = tuple([start, end, start, end, start, end] + list(self.calendars))
-        result = self.sql_ex(sql_s.format(','.join(["?"] * len(self.calendars))), stuple)
-        for item, href, start, end, ref, etag, dtype, calendar in result:
-            start = pytz.UTC.localize(dt.datetime.utcfromtimestamp(start))
-            end = pytz.UTC.localize(dt.datetime.utcfromtimestamp(end))
-            yield item, href, start, end, ref, etag, calendar
-
-    def get_floating_calendars(self, start: dt.datetime, end: dt.datetime) -> Iterable[str]:
-        assert start.tzinfo is None
-        assert end.tzinfo is None
-        start_u = utils.to_unix_time(start)
-        end_u = utils.to_unix_time(end)
-        sql_s = (
-            'SELECT events.calendar FROM '
-            'recs_float JOIN events ON '
-            'recs_float.href = events.href AND '
-            'recs_float.calendar = events.calendar WHERE '
-            '(dtstart >= ? AND dtstart < ? OR '
-            'dtend > ? AND dtend <= ? OR '
-            'dtstart <= ? AND dtend > ? ) AND events.calendar in ({0}) '
-            'ORDER BY dtstart')
-        stuple = tuple(
-            [start_u, end_u, start_u, end_u, start_u, end_u] + list(self.calendars))  # type: ignore
-        result = self.sql_ex(sql_s.format(','.join(["?"] * len(self.calendars))), stuple)
-        for calendar in result:
-            yield calendar[0]
+        return self._get_instances(
+            localized=(utils.to_unix_time(start), utils.to_unix_time(end)))
 
     def get_floating(self, start, end) \
-            -> Iterable[Tuple[str, str, dt.datetime, dt.datetime, str, str, str]]:
+            -> Iterable[EventTuple]:
         """return floating events between `start` and `end`
 
         :type start: datetime.datetime
@@ -538,71 +830,602 @@ class SQLiteDb(object):
         """
         assert start.tzinfo is None
         assert end.tzinfo is None
-        start_u = utils.to_unix_time(start)
-        end_u = utils.to_unix_time(end)
+        return self._get_instances(floating=(utils.to_unix_time(start), utils.to_unix_time(end)))
+
+    def get_range(self, start: dt.datetime, end: dt.datetime) -> Iterable[EventTuple]:
+        """return localized and floating events between `start` and `end`
+        (naive datetimes in local time), ordered by their start
+        """
+        localized, floating = self._local_ranges(start, end)
+        offsets = get_utc_offsets(self.locale['local_timezone'], *floating)
+        return self._get_instances(localized, floating, offsets)
+
+    def _local_ranges(self, start: dt.datetime, end: dt.datetime) \
+            -> Tuple[Tuple[float, float], Tuple[float, float]]:
+        """return the time range between `start` and `end` (naive datetimes in
+        local time) as unix timestamps, for localized and for floating events
+        """
+        assert start.tzinfo is None
+        assert end.tzinfo is None
+        localize = self.locale['local_timezone'].localize
+        return (
+            (utils.to_unix_time(localize(start)), utils.to_unix_time(localize(end))),
+            (utils.to_unix_time(start), utils.to_unix_time(end)),
+        )
+
+    def _select_instances(self, columns: str,
+                          localized: Optional[Tuple[float, float]]=None,
+                          floating: Optional[Tuple[float, float]]=None,
+                          offsets: Optional[List[Tuple[float, int]]]=None) -> Iterable[tuple]:
+        """select `columns` of all instances (joined with their events) of
+        localized events overlapping `localized` and of floating events
+        overlapping `floating` (time ranges as unix timestamps)
+
+        The result is ordered by the instances' start, the start of floating
+        instances is converted to UTC with `offsets` (see get_utc_offsets())
+        for this. Rows are fetched from a cursor of their own as they are
+        consumed, so long ranges don't have to be held in memory.
+        """
+        ranges = [time_range for time_range in [localized, floating] if time_range is not None]
+        start = min(time_range[0] for time_range in ranges)
+        end = max(time_range[1] for time_range in ranges)
+        self._ensure_window(int(start), int(end))
+        conditions = []
+        stuple = [end, start]
+        if localized is not None:
+            conditions.append(
+                'recs.floating = 0 AND '
+                '(recs.dtstart >= ? AND recs.dtstart <= ? OR '
+                'recs.dtend > ? AND recs.dtend <= ? OR '
+                'recs.dtstart <= ? AND recs.dtend >= ?)')
+            stuple.extend(localized * 3)
+        if floating is not None:
+            conditions.append(
+                'recs.floating = 1 AND '
+                '(recs.dtstart >= ? AND recs.dtstart < ? OR '
+                'recs.dtend > ? AND recs.dtend <= ? OR '
+                'recs.dtstart <= ? AND recs.dtend > ?)')
+            stuple.extend(floating * 3)
+        calendar_ids = self._calendars_ids()
+        if not offsets:
+            offsets = [(start, 0)]
+        # the offset of a floating instance is the one of the last transition
+        # before its start
+        utc_offset = '?'
+        if len(offsets) > 1:
+            utc_offset = 'CASE {0}ELSE ? END'.format(
+                'WHEN recs.dtstart < ? THEN ? ' * (len(offsets) - 1))
+        order_stuple = []
+        for (_, offset), (transition, _) in zip(offsets, offsets[1:]):
+            order_stuple.extend([transition, offset])
+        order_stuple.append(offsets[-1][1])
         sql_s = (
-            'SELECT item, recs_float.href, dtstart, dtend, ref, etag, dtype, events.calendar '
-            'FROM recs_float JOIN events ON '
-            'recs_float.href = events.href AND '
-            'recs_float.calendar = events.calendar WHERE '
-            '(dtstart >= ? AND dtstart < ? OR '
-            'dtend > ? AND dtend <= ? OR '
-            'dtstart <= ? AND dtend > ? ) AND events.calendar in ({0}) '
-            'ORDER BY dtstart')
-        stuple = tuple(
-            [start_u, end_u, start_u, end_u, start_u, end_u] + list(self.calendars))  # type: ignore
-        result = self.sql_ex(sql_s.format(','.join(["?"] * len(self.calendars))), stuple)
-        for item, href, start, end, ref, etag, dtype, calendar in result:
-            start = dt.datetime.utcfromtimestamp(start)
-            end = dt.datetime.utcfromtimestamp(end)
-            if dtype == EventType.DATE:
-                start = start.date()
-                end = end.date()
-            yield item, href, start, end, ref, etag, calendar
+            'SELECT {0} FROM {1} JOIN events ON recs.event_id = events.id '
+            'WHERE {2} AND ({3}) AND events.calendar_id in ({4}) '
+            'ORDER BY CASE WHEN recs.floating THEN recs.dtstart - {5} '
+            'ELSE recs.dtstart END, recs.dtype'
+        ).format(
+            columns, self._recs_source('recs'), self._recs_overlap('recs'),
+            ' OR '.join(conditions), ','.join(['?'] * len(calendar_ids)), utc_offset,
+        )
+        return self.conn.execute(sql_s, tuple(stuple + calendar_ids + order_stuple))
+
+    def _get_calendars(self, localized: Optional[Tuple[float, float]]=None,
+                       floating: Optional[Tuple[float, float]]=None) -> Iterable[str]:
+        """return the calendar of each instance (see `_select_instances`)"""
+        for calendar_id, in self._select_instances('events.calendar_id', localized, floating):
+            yield self._calendar_names[calendar_id]
+
+    def _get_instances(self, localized: Optional[Tuple[float, float]]=None,
+                       floating: Optional[Tuple[float, float]]=None,
+                       offsets: Optional[List[Tuple[float, int]]]=None) -> Iterable[EventTuple]:
+        """return all instances (see `_select_instances`), with the start and
+        end of localized instances in UTC
+        """
+        columns = ('item, events.href, recs.dtstart, recs.dtend, ref, etag, dtype, floating, '
+                   'events.calendar_id, ' +
+                   ', '.join('events.' + column for column in PROPERTY_COLUMNS))
+        result = self._select_instances(columns, localized, floating, offsets)
+        for item, href, start, end, ref, etag, dtype, is_floating, calendar_id, *values in result:
+            start, end = get_instance_dates(start, end, dtype, is_floating)
+            yield (item, href, start, end, ref, etag, self._calendar_names[calendar_id],
+                   get_properties(ref, values))
 
     def get(self, href: str, calendar: str) -> str:
         """returns the ical string matching href and calendar"""
         assert calendar is not None
-        sql_s = 'SELECT item, etag FROM events WHERE href = ? AND calendar = ?;'
-        item, etag = self.sql_ex(sql_s, (href, calendar))[0]
+        sql_s = 'SELECT item, etag FROM events WHERE href = ? AND calendar_id = ?;'
+        item, etag = self.sql_ex(sql_s, (href, self._calendar_id(calendar)))[0]
         return item
 
     def search(self, search_string: str) \
-            -> Iterable[Tuple[str, str, dt.datetime, dt.datetime, str, str, str]]:
-        """search for events matching `search_string`"""
+            -> Iterable[EventTuple]:
+        """search for events matching `search_string`
+
+        Only the summary, description, location, categories and attendees of
+        events are searched. For recurring events, only the master event and
+        overwritten instances are returned, each with the start and end of its
+        first stored instance (or None, if no instance lies in the expansion
+        window). If sqlite supports FTS5, results are ordered by relevance.
+        """
+        calendars = ','.join(["?"] * len(self.calendars))
         sql_s = (
-            'SELECT item, recs_loc.href, dtstart, dtend, ref, etag, dtype, events.calendar '
-            'FROM recs_loc JOIN events ON '
-            'recs_loc.href = events.href AND '
-            'recs_loc.calendar = events.calendar '
-            'WHERE item LIKE (?) and events.calendar in ({0});'
+            'SELECT events.id, events.href, search.ref, item, etag, events.calendar_id, {4} '
+            'FROM {0} JOIN events ON '
+            'search.event_id = events.id '
+            'WHERE {1} events.calendar_id in ({2}) '
+            'ORDER BY {3};'
         )
-        stuple = tuple(['%{0}%'.format(search_string)] + list(self.calendars))
-        result = self.sql_ex(sql_s.format(','.join(["?"] * len(self.calendars))), stuple)
-        for item, href, start, end, ref, etag, dtype, calendar in result:
-            start = pytz.UTC.localize(dt.datetime.utcfromtimestamp(start))
-            end = pytz.UTC.localize(dt.datetime.utcfromtimestamp(end))
-            if dtype == EventType.DATE:
-                start = start.date()
-                end = end.date()
-            yield item, href, start, end, ref, etag, calendar
+        sql_s = sql_s.replace(
+            '{4}', ', '.join('events.' + column for column in PROPERTY_COLUMNS))
+        terms = search_string.split()
+        if not terms:
+            sql_s = sql_s.format('search', '', calendars, 'search.id')
+            stuple = tuple(self._calendars_ids())  # type: Tuple[Union[int, str], ...]
+        elif self._fts:
+            # every term needs to match the beginning of a word in any column
+            query = ' '.join('"{0}"*'.format(term.replace('"', '""')) for term in terms)
+            sql_s = sql_s.format(
+                'search_fts JOIN search ON search.id = search_fts.rowid',
+                'search_fts MATCH ? AND',
+                calendars,
+                'bm25(search_fts, 10.0, 1.0, 5.0, 5.0, 2.0)',
+            )
+            stuple = (query, ) + tuple(self._calendars_ids())
+        else:
+            # all of search_string needs to be contained in one column
+            like = ' OR '.join('search.{0} LIKE ?'.format(column) for column in SEARCH_COLUMNS)
+            sql_s = sql_s.format('search', '({0}) AND'.format(like), calendars, 'search.id')
+            stuple = (('%{0}%'.format(search_string), ) * len(SEARCH_COLUMNS) +
+                      tuple(self._calendars_ids()))
+        result = self.sql_ex(sql_s, stuple)
+        for event_id, href, ref, item, etag, calendar_id, *values in result:
+            calendar = self._calendar_names[calendar_id]
+            start, end = self._get_first_instance(event_id, ref)
+            if start is None:
+                yield item, href, start, end, ref, etag, calendar, None
+            else:
+                yield item, href, start, end, ref, etag, calendar, get_properties(ref, values)
+
+    def _get_first_instance(self, event_id: int, ref: str) \
+            -> Tuple[Optional[dt.date], Optional[dt.date]]:
+        """return start and end of the first stored instance of the event (or
+        overwritten instance) `ref`"""
+        sql_s = ('SELECT dtstart, dtend, dtype, floating FROM recs '
+                 'WHERE event_id = ? AND ref = ? '
+                 'ORDER BY dtstart LIMIT 1;')
+        result = self.sql_ex(sql_s, (event_id, ref))
+        if result:
+            return get_instance_dates(*result[0])
+        return None, None
+
+
+def migration(version: int) -> Callable:
+    """register the decorated function as the migration from db layout
+    `version` to `version` + 1"""
+    def decorator(func: Callable[[SQLiteDb], None]) -> Callable[[SQLiteDb], None]:
+        MIGRATIONS[version] = func
+        return func
+    return decorator
+
+
+@migration(5)
+def _add_expansion_window(db: SQLiteDb) -> None:
+    """up to version 5 all instances of recurring events were stored, from their
+    first instance up to the end of 2037"""
+    # a day of slack for floating events
+    slack = 24 * 60 * 60
+    window_end = utils.to_unix_time(pytz.UTC.localize(dt.datetime(2037, 12, 30)))
+    # the window's bounds need to be representable as datetimes (see
+    # get_instances()), so it starts at the earliest stored instance
+    earliest = utils.to_unix_time(pytz.UTC.localize(dt.datetime(1, 1, 1))) + slack
+    default_start = utils.to_unix_time(dt.datetime.now(pytz.UTC) - EXPANSION_PAST)
+    db.sql_ex('ALTER TABLE calendars ADD COLUMN window_start INT NOT NULL DEFAULT {0};'
+              ''.format(default_start), ())
+    db.sql_ex('ALTER TABLE calendars ADD COLUMN window_end INT NOT NULL DEFAULT {0};'
+              ''.format(window_end), ())
+    # (calendars without any events keep the default window)
+    db.sql_ex(
+        'UPDATE calendars SET window_start = coalesce(max(?, ('
+        'SELECT min(dtstart) - ? FROM ('
+        'SELECT dtstart, calendar FROM recs_loc UNION ALL '
+        'SELECT dtstart, calendar FROM recs_float) AS recs '
+        'WHERE recs.calendar = calendars.calendar)), window_start);',
+        (earliest, slack))
+    db.sql_ex('ALTER TABLE events ADD COLUMN recurring INT NOT NULL DEFAULT 0;', ())
+    # flagging events that are not recurring only costs some time when the
+    # window gets extended
+    db.sql_ex("UPDATE events SET recurring = 1 "
+              "WHERE item LIKE '%RRULE%' OR item LIKE '%RDATE%';", ())
+
+
+@migration(6)
+def _add_search_table(db: SQLiteDb) -> None:
+    """fill the `search` table from all stored events (the full text index is
+    built from it later on)"""
+    db.sql_ex('''CREATE TABLE search (
+        id INTEGER PRIMARY KEY,
+        href TEXT NOT NULL,
+        calendar TEXT NOT NULL,
+        ref TEXT NOT NULL,
+        summary TEXT NOT NULL,
+        description TEXT NOT NULL,
+        location TEXT NOT NULL,
+        categories TEXT NOT NULL,
+        attendee TEXT NOT NULL
+        );''', ())
+    sql_s = ('INSERT INTO search (href, calendar, ref, {0}) VALUES (?, ?, ?, {1});'
+             ''.format(', '.join(SEARCH_COLUMNS), ', '.join(['?'] * len(SEARCH_COLUMNS))))
+    for href, calendar, item in db.sql_ex('SELECT href, calendar, item FROM events;', ()):
+        for vevent in cal_from_ics(item).walk('VEVENT'):
+            rec_id = vevent.get(RECURRENCE_ID)
+            ref = PROTO if rec_id is None else str(utils.to_unix_time(rec_id.dt))
+            stuple = (href, calendar, ref) + tuple(
+                get_search_text(vevent, column.upper()) for column in SEARCH_COLUMNS)
+            db.sql_ex(sql_s, stuple)
+
+
+@migration(7)
+def _add_event_properties(db: SQLiteDb) -> None:
+    """events without stored properties are parsed when displayed, their
+    properties are stored once they get updated"""
+    for column in PROPERTY_COLUMNS[:-1]:
+        db.sql_ex('ALTER TABLE events ADD COLUMN {0} TEXT;'.format(column), ())
+
+
+@migration(8)
+def _add_integer_ids(db: SQLiteDb) -> None:
+    """reference events and calendars by integer ids instead of by (href,
+    calendar) and store `rec_inst` as an integer
+
+    The tables are copied, their indexes are recreated (and filled) by
+    `SQLiteDb._create_default_tables()` afterwards.
+    """
+    for table in ['calendars', 'events', 'recs_loc', 'recs_float', 'search']:
+        db.sql_ex('ALTER TABLE {0} RENAME TO {0}_old;'.format(table), ())
+    for table in ['recs_loc_index', 'recs_float_index', 'search_fts']:
+        db.sql_ex('DROP TABLE IF EXISTS {0};'.format(table), ())
+
+    db.sql_ex('''CREATE TABLE calendars (
+        id INTEGER PRIMARY KEY,
+        calendar TEXT NOT NULL UNIQUE,
+        resource TEXT NOT NULL,
+        ctag TEXT,
+        window_start INT NOT NULL,
+        window_end INT NOT NULL
+        );''', ())
+    db.sql_ex('INSERT INTO calendars (calendar, resource, ctag, window_start, window_end) '
+              'SELECT calendar, resource, ctag, window_start, window_end FROM calendars_old;', ())
+
+    columns = ', '.join(['sequence', 'etag', 'item'] + PROPERTY_COLUMNS)
+    db.sql_ex('''CREATE TABLE events (
+        id INTEGER PRIMARY KEY,
+        href TEXT NOT NULL,
+        calendar_id INT NOT NULL REFERENCES calendars( id ),
+        sequence INT,
+        etag TEXT,
+        item TEXT,
+        uid TEXT,
+        summary TEXT,
+        location TEXT,
+        description TEXT,
+        status TEXT,
+        categories TEXT,
+        organizer TEXT,
+        rrule TEXT,
+        recurring INT NOT NULL DEFAULT 0,
+        UNIQUE (href, calendar_id)
+        );''', ())
+    db.sql_ex('INSERT INTO events (href, calendar_id, {0}) '
+              'SELECT e.href, c.id, {1} FROM events_old AS e '
+              'JOIN calendars AS c ON e.calendar = c.calendar;'.format(
+                  columns, ', '.join('e.' + column for column in columns.split(', '))), ())
+    # maps the old (href, calendar) pairs to the new event ids
+    event_ids = ('(SELECT events.id FROM events JOIN calendars '
+                 'ON events.calendar_id = calendars.id '
+                 'WHERE events.href = old.href AND calendars.calendar = old.calendar)')
+
+    for table in ['recs_loc', 'recs_float']:
+        db.sql_ex('''CREATE TABLE {0} (
+            dtstart INT NOT NULL,
+            dtend INT NOT NULL,
+            event_id INT NOT NULL REFERENCES events( id ),
+            rec_inst INT NOT NULL,
+            ref TEXT NOT NULL,
+            dtype INT NOT NULL,
+            primary key (event_id, rec_inst)
+            );'''.format(table), ())
+        db.sql_ex('INSERT INTO {0} (dtstart, dtend, event_id, rec_inst, ref, dtype) '
+                  'SELECT * FROM (SELECT dtstart, dtend, {1} AS event_id, '
+                  'CAST(rec_inst AS INTEGER), ref, dtype FROM {0}_old AS old) '
+                  'WHERE event_id IS NOT NULL;'.format(table, event_ids), ())
+
+    db.sql_ex('''CREATE TABLE search (
+        id INTEGER PRIMARY KEY,
+        event_id INT NOT NULL REFERENCES events( id ),
+        ref TEXT NOT NULL,
+        summary TEXT NOT NULL,
+        description TEXT NOT NULL,
+        location TEXT NOT NULL,
+        categories TEXT NOT NULL,
+        attendee TEXT NOT NULL
+        );''', ())
+    columns = ', '.join(['ref'] + SEARCH_COLUMNS)
+    db.sql_ex('INSERT INTO search (event_id, {0}) '
+              'SELECT * FROM (SELECT {1} AS event_id, {0} FROM search_old AS old) '
+              'WHERE event_id IS NOT NULL;'.format(columns, event_ids), ())
+
+    for table in ['calendars', 'events', 'recs_loc', 'recs_float', 'search']:
+        db.sql_ex('DROP TABLE {0}_old;'.format(table), ())
+
+
+@migration(9)
+def _merge_instance_tables(db: SQLiteDb) -> None:
+    """merge `recs_loc` and `recs_float` into `recs`"""
+    db.sql_ex('''CREATE TABLE recs (
+        dtstart INT NOT NULL,
+        dtend INT NOT NULL,
+        event_id INT NOT NULL REFERENCES events( id ),
+        rec_inst INT NOT NULL,
+        ref TEXT NOT NULL,
+        dtype INT NOT NULL,
+        floating INT NOT NULL,
+        primary key (event_id, rec_inst)
+        );''', ())
+    for table, floating in [('recs_loc', 0), ('recs_float', 1)]:
+        db.sql_ex('INSERT OR REPLACE INTO recs '
+                  '(dtstart, dtend, event_id, rec_inst, ref, dtype, floating) '
+                  'SELECT dtstart, dtend, event_id, rec_inst, ref, dtype, ? FROM {0};'
+                  ''.format(table), (floating, ))
+        db.sql_ex('DROP TABLE {0};'.format(table), ())
+        db.sql_ex('DROP TABLE IF EXISTS {0}_index;'.format(table), ())
+
+
+def has_module(conn: sqlite3.Connection, module: str) -> bool:
+    """check if the sqlite library used by `conn` supports virtual tables of
+    type `module` (e.g. `rtree`, which is an optional compile time feature)"""
+    try:
+        conn.execute('CREATE VIRTUAL TABLE temp.khal_{0}_test USING {0}(id, a, b);'.format(module))
+    except sqlite3.OperationalError:
+        return False
+    conn.execute('DROP TABLE temp.khal_{0}_test;'.format(module))
+    return True
 
-        sql_s = (
-            'SELECT item, recs_float.href, dtstart, dtend, ref, etag, dtype, events.calendar '
-            'FROM recs_float JOIN events ON '
-            'recs_float.href = events.href AND '
-            'recs_float.calendar = events.calendar '
-            'WHERE item LIKE (?) and events.calendar in ({0});'
+
+def parse_event(vevent_str: str, href: str, calendar: str,
+                default_timezone: dt.tzinfo, window: Tuple[int, int]) -> ParsedEvent:
+    """parse, check and expand an event for SQLiteDb.update_parsed()
+
+    This does all the work of inserting an event that does not need the db, so
+    it can be done in other processes.
+
+    :param window: the expansion window of `calendar` (see SQLiteDb.get_window())
+    """
+    ical = cal_from_ics(vevent_str)
+    check_for_errors(ical, calendar, href)
+    if not assert_only_one_uid(ical):
+        logger.warning(
+            "The .ics file at {}/{} contains multiple UIDs.\n"
+            "This should not occur in vdir .ics files.\n"
+            "If you didn't edit the file by hand, please report a bug "
+            "at https://github.com/pimutils/khal/issues .\n"
+            "If you want to import it, please use `khal import FILE`."
+            "".format(calendar, href)
         )
-        stuple = tuple(['%{0}%'.format(search_string)] + list(self.calendars))
-        result = self.sql_ex(sql_s.format(','.join(["?"] * len(self.calendars))), stuple)
-        for item, href, start, end, ref, etag, dtype, calendar in result:
-            start = dt.datetime.utcfromtimestamp(start)
-            end = dt.datetime.utcfromtimestamp(end)
-            if dtype == EventType.DATE:
-                start = start.date()
-                end = end.date()
-            yield item, href, start, end, ref, etag, calendar
+        raise NonUniqueUID
+    vevents = [sanitize_vevent(c, default_timezone, href, calendar) for
+               c in ical.walk() if c.name == 'VEVENT']
+    vevents.sort(key=sort_vevent_key)
+    masters = [vevent for vevent in vevents if RECURRENCE_ID not in vevent]
+    if masters:
+        # if there are several, the last one wins (see Event.fromVEvents)
+        properties = get_event_properties(masters[-1])
+        recurring = 'RRULE' in masters[-1] or 'RDATE' in masters[-1]
+        sequence = masters[-1].get('SEQUENCE')
+    else:
+        properties, recurring, sequence = None, False, None
+    for vevent in vevents:
+        check_for_errors(vevent, calendar, href)
+        check_support(vevent, href, calendar)
+    return ParsedEvent(
+        vevent_str, href, calendar, window, properties, recurring, sequence,
+        [get_instances(vevent, href, window) + (get_search_row(vevent), ) for vevent in vevents],
+    )
+
+
+def get_instances(vevent: icalendar.cal.Event, href: str, window: Tuple[int, int]) \
+        -> Tuple[List[tuple], Optional[tuple]]:
+    """expand `vevent`'s recurrence rules (if needed) into rows for the `recs`
+    table
+
+    Returns the rows (without the event's id) and, for an event with
+    RANGE=THISANDFUTURE, by how much the instances from its RECURRENCE-ID on
+    are shifted instead (the rows are empty then).
+
+    :param window: only instances of RRULEs which overlap this time range
+        (given as unix timestamps) are returned
+    """
+    # TODO FIXME this function is a steaming pile of shit
+    rec_id = vevent.get(RECURRENCE_ID)
+    if rec_id is None:
+        rrange = None
+    else:
+        rrange = rec_id.params.get('RANGE')
+
+    # testing on datetime.date won't work as datetime is a child of date
+    if not isinstance(vevent['DTSTART'].dt, dt.datetime):
+        dtype = EventType.DATE
+    else:
+        dtype = EventType.DATETIME
+    floating = not (
+        ('TZID' in vevent['DTSTART'].params and dtype == EventType.DATETIME) or
+        getattr(vevent['DTSTART'].dt, 'tzinfo', None))
+
+    dtstartend = expand_vevent(
+        vevent, href,
+        pytz.UTC.localize(dt.datetime.utcfromtimestamp(window[0])),
+        pytz.UTC.localize(dt.datetime.utcfromtimestamp(window[1])),
+    )
+    if not dtstartend:
+        # Does this event even have dates? Technically it is possible for
+        # events to be empty/non-existent by deleting all their recurrences
+        # through EXDATE.
+        return [], None
+
+    if rrange == THISANDFUTURE:
+        start_shift, duration = calc_shift_deltas(vevent)
+        start_shift_seconds = start_shift.days * 3600 * 24 + start_shift.seconds
+        duration_seconds = duration.days * 3600 * 24 + duration.seconds
+        rec_inst = utils.to_unix_time(rec_id.dt)
+        return [], (start_shift_seconds, start_shift_seconds + duration_seconds,
+                    str(rec_inst), rec_inst, floating)
+
+    instances = []
+    for dtstart, dtend in dtstartend:
+        dbstart = utils.to_unix_time(dtstart)
+        dbend = utils.to_unix_time(dtend)
+        if rec_id is not None:
+            rec_inst = utils.to_unix_time(rec_id.dt)
+            ref = str(rec_inst)
+        else:
+            rec_inst = dbstart
+            ref = PROTO
+        instances.append((dbstart, dbend, ref, dtype, rec_inst, floating))
+    return instances, None
+
+
+def get_search_row(vevent: icalendar.cal.Event) -> tuple:
+    """return the ref and the SEARCH_COLUMNS of `vevent` for the `search`
+    table"""
+    rec_id = vevent.get(RECURRENCE_ID)
+    if rec_id is None:
+        ref = PROTO
+    else:
+        ref = str(utils.to_unix_time(rec_id.dt))
+    return (ref, ) + tuple(get_search_text(vevent, column.upper()) for column in SEARCH_COLUMNS)
+
+
+def get_event_properties(vevent: icalendar.cal.Event) -> Optional[Dict[str, str]]:
+    """return the properties of the master `vevent` to be stored in the
+    events table
+
+    The values need to be the same as the ones of the respective properties of
+    khal.khalendar.event.Event. Events which need special treatment (birthdays
+    and the like and those with a DURATION) are not stored, None is returned
+    for them.
+    """
+    if any(prop in vevent for prop in ['DURATION', 'X-BIRTHDAY', 'X-ANNIVERSARY', 'X-ABDATE']):
+        return None
+    organizer = vevent.get('ORGANIZER')
+    if organizer is None:
+        organizer = ''
+    elif organizer.params.get('CN', ''):
+        organizer = '{} ({})'.format(organizer.params['CN'], organizer.split(':')[-1])
+    else:
+        organizer = organizer.split(':')[-1]
+    try:
+        categories = vevent.get('CATEGORIES', '').to_ical().decode('utf-8')
+    except AttributeError:
+        categories = ''
+    if 'RRULE' in vevent:
+        rrule = vevent['RRULE'].to_ical().decode('utf-8')
+    else:
+        rrule = ''
+    return {
+        'uid': str(vevent.get('UID', '')),
+        'summary': str(vevent.get('SUMMARY', '')),
+        'location': str(vevent.get('LOCATION', '')),
+        'description': str(vevent.get('DESCRIPTION', '')),
+        'status': str(vevent.get('STATUS', '')),
+        'categories': categories,
+        'organizer': organizer,
+        'rrule': rrule,
+    }
+
+
+def get_properties(ref: str, values: List) -> Optional[Dict[str, Any]]:
+    """turn the PROPERTY_COLUMNS of a row of the events table into a dict,
+    if those properties were stored and apply to instance `ref`"""
+    if ref != PROTO or values[0] is None:
+        return None
+    properties = dict(zip(PROPERTY_COLUMNS, values))  # type: Dict[str, Any]
+    properties['recurring'] = bool(properties['recurring'])
+    return properties
+
+
+def get_instance_dates(start: int, end: int, dtype: int, floating: bool) \
+        -> Tuple[dt.date, dt.date]:
+    """convert the start and end of an instance (as stored in the db) to
+    dates, naive datetimes (for floating events) or datetimes in UTC"""
+    start_dt = dt.datetime.utcfromtimestamp(start)
+    end_dt = dt.datetime.utcfromtimestamp(end)
+    if dtype == EventType.DATE:
+        return start_dt.date(), end_dt.date()
+    if not floating:
+        return pytz.UTC.localize(start_dt), pytz.UTC.localize(end_dt)
+    return start_dt, end_dt
+
+
+def get_utc_offsets(timezone: pytz.BaseTzInfo, start: float, end: float) \
+        -> List[Tuple[float, int]]:
+    """return the UTC offsets (in seconds) of `timezone` between `start` and
+    `end` (naive local times as unix timestamps)
+
+    Returns a list of (local time, offset) tuples, each offset applies from its
+    local time on, the first one from `start` on. Like pytz's localize(),
+    ambiguous and non-existent local times get the offset of standard time.
+    """
+    first = timezone.localize(dt.datetime.utcfromtimestamp(start))
+    offsets = [(start, int(first.utcoffset().total_seconds()))]
+    transition_times = getattr(timezone, '_utc_transition_times', [])
+    num = bisect.bisect_right(
+        transition_times, dt.datetime.utcfromtimestamp(start - offsets[0][1]))
+    for num in range(num, len(transition_times)):
+        offset = int(timezone._transition_info[num][0].total_seconds())
+        transition = utils.to_unix_time(transition_times[num]) + offset
+        if transition > end:
+            break
+        offsets.append((transition, offset))
+    return offsets
+
+
+def get_instance_days(start: int, end: int, dtype: int, floating: bool,
+                      timezone: dt.tzinfo) -> Tuple[dt.date, dt.date]:
+    """return the first and the last local day an instance (as stored in the
+    db) is shown on, instances ending at midnight are not shown on that day"""
+    if dtype == EventType.DATE:
+        first, last = get_instance_dates(start, end, dtype, floating)
+        return first, max(first, last - dt.timedelta(days=1))
+    start_dt = dt.datetime.utcfromtimestamp(start)
+    end_dt = dt.datetime.utcfromtimestamp(end)
+    if not floating:
+        start_dt = pytz.UTC.localize(start_dt).astimezone(timezone)
+        end_dt = pytz.UTC.localize(end_dt).astimezone(timezone)
+    last = end_dt.date()
+    if end_dt.time() == dt.time.min:
+        last -= dt.timedelta(days=1)
+    return start_dt.date(), max(start_dt.date(), last)
+
+
+def get_search_text(vevent: icalendar.cal.Event, prop: str) -> str:
+    """return the values of all `prop` properties of `vevent` as one string
+
+    For ATTENDEEs, their common names (CN) are included as well.
+    """
+    values = vevent.get(prop)
+    if values is None:
+        return ''
+    if not isinstance(values, list):
+        values = [values]
+    texts = []  # type: List[str]
+    for value in values:
+        if hasattr(value, 'cats'):  # CATEGORIES
+            texts.extend(str(cat) for cat in value.cats)
+            continue
+        texts.append(str(value))
+        if 'CN' in getattr(value, 'params', {}):
+            texts.append(str(value.params['CN']))
+    return ' '.join(texts)
 
 
 def check_support(vevent: icalendar.cal.Event, href: str, calendar: str):
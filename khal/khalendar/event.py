@@ -22,9 +22,11 @@
 """This module contains the event model with all relevant subclasses and some
 helper functions."""
 
+import bisect
 import datetime as dt
 import logging
 import os
+from functools import lru_cache
 
 import icalendar
 import pytz
@@ -38,6 +40,22 @@ from ..parse_datetime import timedelta2str
 
 logger = logging.getLogger('khal')
 
+UNICODE_SYMBOLS = dict(
+    recurring='\N{Clockwise gapped circle arrow}',
+    range='\N{Left right arrow}',
+    range_end='\N{Rightwards arrow to bar}',
+    range_start='\N{Rightwards arrow from bar}',
+    right_arrow='\N{Rightwards arrow}'
+)
+
+ASCII_SYMBOLS = dict(
+    recurring='(R)',
+    range='<->',
+    range_end='->|',
+    range_start='|->',
+    right_arrow='->'
+)
+
 
 class Event(object):
     """base Event class for representing a *recurring instance* of an Event
@@ -53,16 +71,44 @@ class Event(object):
     """
     allday = False
 
+    # there are lots of events around (e.g. in `khal list` over a year), so
+    # they do without a __dict__, subclasses may not add further slots, as
+    # update_start_end() changes an event's class
+    __slots__ = (
+        '_event_str', '_load_vevents', '_shared', '_vevents_dict', '_properties', '_locale',
+        'readonly', 'href', 'etag', 'calendar', 'color', 'ref', '_start', '_end', '_localized',
+        '_start_local', '_end_local', '_sort_key',
+    )
+
     def __init__(self, vevents, ref=None, **kwargs):
         """
+        :param vevents: the event's VEVENTs, keyed by 'PROTO' or their
+            recurrence-id, or None, if `event_str` should only be parsed once
+            they are needed
+        :type vevents: dict
         :param start: start datetime of this event instance
         :type start: datetime.date
         :param end: end datetime of this event instance in unix time
         :type end: datetime.date
+        :param event_str: the icalendar text of this event, only used if
+            `vevents` is None
+        :type event_str: str
+        :param properties: some of the PROTO event's properties (as stored in
+            the db), these are used as long as the event is not parsed
+        :type properties: dict
+        :param load_vevents: returns the parsed `event_str`, which may be
+            shared with other instances of the same event (and is therefore
+            copied before this event is changed), `vevents` is assumed to have
+            been returned by it
+        :type load_vevents: callable
         """
         if self.__class__.__name__ == 'Event':
             raise ValueError('do not initialize this class directly')
+        self._event_str = kwargs.pop('event_str', None)
+        self._load_vevents = kwargs.pop('load_vevents', None)
+        self._shared = vevents is not None and self._load_vevents is not None
         self._vevents = vevents
+        self._properties = kwargs.pop('properties', None)
         self._locale = kwargs.pop('locale', None)
         self.readonly = kwargs.pop('readonly', None)
         self.href = kwargs.pop('href', None)
@@ -70,6 +116,8 @@ class Event(object):
         self.calendar = kwargs.pop('calendar', None)
         self.color = kwargs.pop('color', None)
         self.ref = ref
+        # only used by LocalizedEvent
+        self._localized = True
 
         start = kwargs.pop('start', None)
         end = kwargs.pop('end', None)
@@ -89,6 +137,7 @@ class Event(object):
 
         else:
             self._end = end
+        self._reset_local()
         if kwargs:
             raise TypeError('%s are invalid keyword arguments to this function' % kwargs.keys())
 
@@ -114,18 +163,18 @@ class Event(object):
             cls = AllDayEvent
         return cls
 
-    @classmethod
-    def fromVEvents(cls, events_list, ref=None, **kwargs):
-        """
-        :type events: list
-        """
-        assert isinstance(events_list, list)
+    @staticmethod
+    def _index_vevents(events_list, locale):
+        """return `events_list` as a dict, keyed by 'PROTO' or recurrence-id
 
+        :type events_list: list
+        :rtype: dict
+        """
         vevents = dict()
         for event in events_list:
             if 'RECURRENCE-ID' in event:
                 if invalid_timezone(event['RECURRENCE-ID']):
-                    default_timezone = kwargs['locale']['default_timezone']
+                    default_timezone = locale['default_timezone']
                     recur_id = default_timezone.localize(event['RECURRENCE-ID'].dt)
                     ident = str(to_unix_time(recur_id))
                 else:
@@ -133,7 +182,24 @@ class Event(object):
                 vevents[ident] = event
             else:
                 vevents['PROTO'] = event
+        return vevents
+
+    @classmethod
+    def fromVEvents(cls, events_list, ref=None, **kwargs):
+        """
+        :type events: list
+        """
+        assert isinstance(events_list, list)
+
+        vevents = cls._index_vevents(events_list, kwargs.get('locale'))
+        return cls._fromVEventsDict(vevents, ref, **kwargs)
 
+    @classmethod
+    def _fromVEventsDict(cls, vevents, ref=None, **kwargs):
+        """
+        :param vevents: VEVENTs as returned by _index_vevents()
+        :type vevents: dict
+        """
         if ref is None:
             ref = 'PROTO' if ref in vevents.keys() else list(vevents.keys())[0]
         try:
@@ -149,26 +215,84 @@ class Event(object):
         return instcls(vevents, ref=ref, **kwargs)
 
     @classmethod
-    def fromString(cls, event_str, ref=None, **kwargs):
+    def fromString(cls, event_str, ref=None, properties=None, **kwargs):
+        """
+        :param properties: if given (only possible for the PROTO event and
+            together with `start`), `event_str` is only parsed when a property
+            not contained in `properties` is accessed
+        :type properties: dict
+        """
+        if properties is not None and ref == 'PROTO' and kwargs.get('start') is not None:
+            instcls = cls._get_type_from_date(kwargs['start'])
+            return instcls(None, ref=ref, event_str=event_str, properties=properties, **kwargs)
+        if kwargs.get('load_vevents') is not None:
+            return cls._fromVEventsDict(
+                kwargs['load_vevents'](), ref, event_str=event_str, **kwargs)
         calendar_collection = cal_from_ics(event_str)
         events = [item for item in calendar_collection.walk() if item.name == 'VEVENT']
         return cls.fromVEvents(events, ref, **kwargs)
 
-    def __lt__(self, other):
-        start = self.start_local
-        other_start = other.start_local
-        if isinstance(start, dt.date) and not isinstance(start, dt.datetime):
-            start = dt.datetime.combine(start, dt.time.min)
+    @classmethod
+    def parse_vevents(cls, event_str, locale):
+        """parse `event_str` into VEVENTs as expected by __init__()
 
-        if isinstance(other_start, dt.date) and not isinstance(other_start, dt.datetime):
-            other_start = dt.datetime.combine(other_start, dt.time.max)
+        :rtype: dict
+        """
+        calendar_collection = cal_from_ics(event_str)
+        events = [item for item in calendar_collection.walk() if item.name == 'VEVENT']
+        return cls._index_vevents(events, locale)
 
-        start = start.replace(tzinfo=None)
-        other_start = other_start.replace(tzinfo=None)
-        try:
-            return start <= other_start
-        except TypeError:
-            raise ValueError('Cannot compare events {} and {}'.format(start, other_start))
+    @property
+    def _vevents(self):
+        if self._vevents_dict is None:
+            if self._load_vevents is not None:
+                self._vevents_dict = self._load_vevents()
+                self._shared = True
+            else:
+                self._vevents_dict = self.parse_vevents(self._event_str, self._locale)
+        # the vevents might get changed, from now on we cannot rely on the
+        # properties from the db anymore
+        self._properties = None
+        return self._vevents_dict
+
+    @_vevents.setter
+    def _vevents(self, vevents):
+        self._vevents_dict = vevents
+        self._properties = None
+
+    def _own_vevents(self):
+        """make sure this event's VEVENTs are not shared with other instances
+        of the same event, call before changing them"""
+        if self._vevents_dict is None or self._shared:
+            self._vevents = self.parse_vevents(self._event_str, self._locale)
+            self._shared = False
+
+    def _reset_local(self):
+        """forget start_local, end_local and sort_key, call whenever start or
+        end change"""
+        self._start_local = None
+        self._end_local = None
+        self._sort_key = None
+
+    @property
+    def sort_key(self):
+        """key for sorting events by their local start
+
+        a tuple of the local start in seconds (as if local time was UTC) and a
+        flag sorting all-day events before events starting at midnight of the
+        same day, this is computed only once, so sorting lots of events
+        compares integers instead of timezone aware datetimes
+        """
+        if self._sort_key is None:
+            start = self.start_local
+            seconds = start.toordinal() * 86400
+            if isinstance(start, dt.datetime):
+                seconds += start.hour * 3600 + start.minute * 60 + start.second
+            self._sort_key = (seconds, not self.allday)
+        return self._sort_key
+
+    def __lt__(self, other):
+        return self.sort_key < other.sort_key
 
     def update_start_end(self, start, end):
         """update start and end time of this event
@@ -182,12 +306,14 @@ class Event(object):
             raise ValueError('DTSTART and DTEND should be of the same type (datetime or date)')
         self.__class__ = self._get_type_from_date(start)
 
+        self._own_vevents()
         self._vevents[self.ref].pop('DTSTART')
         self._vevents[self.ref].add('DTSTART', start)
         self._start = start
         if not isinstance(end, dt.datetime):
             end = end + dt.timedelta(days=1)
         self._end = end
+        self._reset_local()
         if 'DTEND' in self._vevents[self.ref]:
             self._vevents[self.ref].pop('DTEND')
             self._vevents[self.ref].add('DTEND', end)
@@ -197,12 +323,16 @@ class Event(object):
 
     @property
     def recurring(self):
+        if self._properties is not None:
+            return self._properties['recurring']
         return 'RRULE' in self._vevents[self.ref] or \
             'RECURRENCE-ID' in self._vevents[self.ref] or \
             'RDATE' in self._vevents[self.ref]
 
     @property
     def recurpattern(self):
+        if self._properties is not None:
+            return self._properties['rrule']
         if 'RRULE' in self._vevents[self.ref]:
             return self._vevents[self.ref]['RRULE'].to_ical().decode('utf-8')
         else:
@@ -216,6 +346,7 @@ class Event(object):
             return icalendar.vRecur()
 
     def update_rrule(self, rrule):
+        self._own_vevents()
         self._vevents['PROTO'].pop('RRULE')
         if rrule is not None:
             self._vevents['PROTO'].add('RRULE', rrule)
@@ -233,6 +364,7 @@ class Event(object):
         """update the SEQUENCE number, call before saving this event"""
         # TODO we might want to do this automatically in raw() everytime
         # the event has changed, this will f*ck up the tests though
+        self._own_vevents()
         try:
             self._vevents[self.ref]['SEQUENCE'] += 1
         except KeyError:
@@ -241,21 +373,9 @@ class Event(object):
     @property
     def symbol_strings(self):
         if self._locale['unicode_symbols']:
-            return dict(
-                recurring='\N{Clockwise gapped circle arrow}',
-                range='\N{Left right arrow}',
-                range_end='\N{Rightwards arrow to bar}',
-                range_start='\N{Rightwards arrow from bar}',
-                right_arrow='\N{Rightwards arrow}'
-            )
+            return UNICODE_SYMBOLS
         else:
-            return dict(
-                recurring='(R)',
-                range='<->',
-                range_end='->|',
-                range_start='|->',
-                right_arrow='->'
-            )
+            return ASCII_SYMBOLS
 
     @property
     def start_local(self):
@@ -280,6 +400,11 @@ class Event(object):
 
     @property
     def duration(self):
+        if self._properties is not None:
+            # events with a DURATION property are never stored with properties,
+            # start and end of localized events are not converted to their
+            # timezones yet, but that does not change their difference
+            return self._end - self._start
         try:
             return self._vevents[self.ref]['DURATION'].dt
         except KeyError:
@@ -287,10 +412,14 @@ class Event(object):
 
     @property
     def uid(self):
+        if self._properties is not None:
+            return self._properties['uid']
         return self._vevents[self.ref]['UID']
 
     @property
     def organizer(self):
+        if self._properties is not None:
+            return self._properties['organizer']
         if 'ORGANIZER' not in self._vevents[self.ref]:
             return ''
         organizer = self._vevents[self.ref]['ORGANIZER']
@@ -351,6 +480,9 @@ class Event(object):
 
     @property
     def summary(self):
+        if self._properties is not None:
+            # birthdays and the like are never stored with properties
+            return self._properties['summary']
         description = None
         date = self._vevents[self.ref].get('x-birthday', None)
         if date:
@@ -386,6 +518,7 @@ class Event(object):
             return self._vevents[self.ref].get('SUMMARY', '')
 
     def update_summary(self, summary):
+        self._own_vevents()
         self._vevents[self.ref]['SUMMARY'] = summary
 
     @staticmethod
@@ -410,6 +543,7 @@ class Event(object):
         """
         Replaces all alarms in the event that can be handled with the ones provided.
         """
+        self._own_vevents()
         components = self._vevents[self.ref].subcomponents
         # remove all alarms that we can handle from the subcomponents
         components = [c for c in components
@@ -425,9 +559,12 @@ class Event(object):
 
     @property
     def location(self):
+        if self._properties is not None:
+            return self._properties['location']
         return self._vevents[self.ref].get('LOCATION', '')
 
     def update_location(self, location):
+        self._own_vevents()
         if location:
             self._vevents[self.ref]['LOCATION'] = location
         else:
@@ -435,6 +572,8 @@ class Event(object):
 
     @property
     def categories(self):
+        if self._properties is not None:
+            return self._properties['categories']
         try:
             return self._vevents[self.ref].get('CATEGORIES', '').to_ical().decode('utf-8')
         except AttributeError:
@@ -442,15 +581,19 @@ class Event(object):
 
     def update_categories(self, categories):
         assert isinstance(categories, list)
+        self._own_vevents()
         self._vevents[self.ref].pop('CATEGORIES', False)
         if categories:
             self._vevents[self.ref].add('CATEGORIES', categories)
 
     @property
     def description(self):
+        if self._properties is not None:
+            return self._properties['description']
         return self._vevents[self.ref].get('DESCRIPTION', '')
 
     def update_description(self, description):
+        self._own_vevents()
         if description:
             self._vevents[self.ref]['DESCRIPTION'] = description
         else:
@@ -469,159 +612,8 @@ class Event(object):
         :param colors: determines if colors codes should be printed or not
         :type colors: bool
         """
-        attributes = dict()
-        try:
-            relative_to_start, relative_to_end = relative_to
-        except TypeError:
-            relative_to_start = relative_to_end = relative_to
-
-        if isinstance(relative_to_end, dt.datetime):
-            relative_to_end = relative_to_end.date()
-        if isinstance(relative_to_start, dt.datetime):
-            relative_to_start = relative_to_start.date()
-
-        if isinstance(self.start_local, dt.datetime):
-            start_local_datetime = self.start_local
-            end_local_datetime = self.end_local
-        else:
-            start_local_datetime = self._locale['local_timezone'].localize(
-                dt.datetime.combine(self.start, dt.time.min))
-            end_local_datetime = self._locale['local_timezone'].localize(
-                dt.datetime.combine(self.end, dt.time.min))
-
-        day_start = self._locale['local_timezone'].localize(
-            dt.datetime.combine(relative_to_start, dt.time.min),
-        )
-        day_end = self._locale['local_timezone'].localize(
-            dt.datetime.combine(relative_to_end, dt.time.max),
-        )
-        next_day_start = day_start + dt.timedelta(days=1)
-
-        allday = isinstance(self, AllDayEvent)
-
-        attributes["start"] = self.start_local.strftime(self._locale['datetimeformat'])
-        attributes["start-long"] = self.start_local.strftime(self._locale['longdatetimeformat'])
-        attributes["start-date"] = self.start_local.strftime(self._locale['dateformat'])
-        attributes["start-date-long"] = self.start_local.strftime(self._locale['longdateformat'])
-        attributes["start-time"] = self.start_local.strftime(self._locale['timeformat'])
-
-        attributes["end"] = self.end_local.strftime(self._locale['datetimeformat'])
-        attributes["end-long"] = self.end_local.strftime(self._locale['longdatetimeformat'])
-        attributes["end-date"] = self.end_local.strftime(self._locale['dateformat'])
-        attributes["end-date-long"] = self.end_local.strftime(self._locale['longdateformat'])
-        attributes["end-time"] = self.end_local.strftime(self._locale['timeformat'])
-
-        attributes["duration"] = timedelta2str(self.duration)
-
-        # should only have time attributes at this point (start/end)
-        full = {}
-        for attr in attributes:
-            full[attr + "-full"] = attributes[attr]
-        attributes.update(full)
-
-        if allday:
-            attributes["start"] = attributes["start-date"]
-            attributes["start-long"] = attributes["start-date-long"]
-            attributes["start-time"] = ""
-            attributes["end"] = attributes["end-date"]
-            attributes["end-long"] = attributes["end-date-long"]
-            attributes["end-time"] = ""
-
-        tostr = ""
-        if self.start_local.timetuple() < relative_to_start.timetuple():
-            attributes["start-style"] = self.symbol_strings["right_arrow"]
-        elif self.start_local.timetuple() == relative_to_start.timetuple():
-            attributes["start-style"] = self.symbol_strings['range_start']
-        else:
-            attributes["start-style"] = attributes["start-time"]
-            tostr = "-"
-
-        if end_local_datetime in [day_end, next_day_start]:
-            if self._locale["timeformat"] == '%H:%M':
-                attributes["end-style"] = '24:00'
-                tostr = '-'
-            else:
-                attributes["end-style"] = self.symbol_strings["range_end"]
-                tostr = ""
-        elif end_local_datetime > day_end:
-            attributes["end-style"] = self.symbol_strings["right_arrow"]
-            tostr = ""
-        else:
-            attributes["end-style"] = attributes["end-time"]
-
-        if self.start < self.end:
-            attributes["to-style"] = '-'
-        else:
-            attributes["to-style"] = ''
-
-        if start_local_datetime < day_start and end_local_datetime > day_end:
-            attributes["start-end-time-style"] = self.symbol_strings["range"]
-        else:
-            attributes["start-end-time-style"] = attributes["start-style"] + \
-                tostr + attributes["end-style"]
-
-        if allday:
-            if self.start == self.end:
-                attributes['start-end-time-style'] = ''
-            elif self.start == relative_to_start and self.end > relative_to_end:
-                attributes['start-end-time-style'] = self.symbol_strings['range_start']
-            elif self.start < relative_to_start and self.end > relative_to_end:
-                attributes['start-end-time-style'] = self.symbol_strings['range']
-            elif self.start < relative_to_start and self.end == relative_to_end:
-                attributes['start-end-time-style'] = self.symbol_strings['range_end']
-            else:
-                attributes['start-end-time-style'] = ''
-
-        if allday:
-            attributes['end-necessary'] = ''
-            attributes['end-necessary-long'] = ''
-            if self.start_local != self.end_local:
-                attributes['end-necessary'] = attributes['end-date']
-                attributes['end-necessary-long'] = attributes['end-date-long']
-        else:
-            attributes['end-necessary'] = attributes['end-time']
-            attributes['end-necessary-long'] = attributes['end-time']
-            if self.start_local.date() != self.end_local.date():
-                attributes['end-necessary'] = attributes['end']
-                attributes['end-necessary-long'] = attributes['end-long']
-
-        attributes["repeat-symbol"] = self._recur_str
-        attributes["repeat-pattern"] = self.recurpattern
-        attributes["title"] = self.summary
-        attributes["organizer"] = self.organizer.strip()
-        attributes["description"] = self.description.strip()
-        attributes["description-separator"] = ""
-        if attributes["description"]:
-            attributes["description-separator"] = " :: "
-        attributes["location"] = self.location.strip()
-        attributes["all-day"] = allday
-        attributes["categories"] = self.categories
-
-        if "calendars" in env and self.calendar in env["calendars"]:
-            cal = env["calendars"][self.calendar]
-            attributes["calendar-color"] = get_color(cal.get('color', ''))
-            attributes["calendar"] = cal.get("displayname", self.calendar)
-        else:
-            attributes["calendar-color"] = attributes["calendar"] = ''
-
-        if colors:
-            attributes['reset'] = style('', reset=True)
-            attributes['bold'] = style('', bold=True, reset=False)
-            for c in ["black", "red", "green", "yellow", "blue", "magenta", "cyan", "white"]:
-                attributes[c] = style("", reset=False, fg=c)
-                attributes[c + "-bold"] = style("", reset=False, fg=c, bold=True)
-        else:
-            attributes['reset'] = attributes['bold'] = ''
-            for c in ["black", "red", "green", "yellow", "blue", "magenta", "cyan", "white"]:
-                attributes[c] = attributes[c + '-bold'] = ''
-
-        attributes['nl'] = '\n'
-        attributes['tab'] = '\t'
-        attributes['bell'] = '\a'
-
-        attributes['status'] = self.status + ' ' if self.status else ''
-        attributes['cancelled'] = 'CANCELLED ' if self.status == 'CANCELLED' else ''
-        return format_string.format(**dict(attributes)) + attributes["reset"]
+        attributes = FormatAttributes(self, relative_to, env, colors)
+        return format_string.format_map(attributes) + attributes["reset"]
 
     def duplicate(self):
         """duplicate this event's PROTO event
@@ -641,6 +633,7 @@ class Event(object):
     def delete_instance(self, instance):
         """delete an instance from this event"""
         assert self.recurring
+        self._own_vevents()
         delete_instance(self._vevents['PROTO'], instance)
 
         # in case the instance we want to delete is specified as a RECURRENCE-ID
@@ -659,19 +652,33 @@ class Event(object):
 
     @property
     def status(self):
+        if self._properties is not None:
+            return self._properties['status']
         return self._vevents[self.ref].get('STATUS', '')
 
 
 class DatetimeEvent(Event):
-    pass
+    __slots__ = ()
 
 
 class LocalizedEvent(DatetimeEvent):
     """
     see parent
     """
+    __slots__ = ()
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
+        if self._vevents_dict is None and is_aware(self._start) and is_aware(self._end):
+            # converting start and end to the event's timezones needs the
+            # vevent, we only do that if they are actually accessed
+            self._localized = False
+        else:
+            self._localize()
+
+    def _localize(self):
+        """convert start and end to the timezones of DTSTART and DTEND"""
+        self._localized = True
         try:
             starttz = getattr(self._vevents[self.ref]['DTSTART'].dt, 'tzinfo', None)
         except KeyError:
@@ -679,7 +686,7 @@ class LocalizedEvent(DatetimeEvent):
                 "Cannot understand event {} from "
                 "calendar {}, you might want to file an issue at "
                 "https://github.com/pimutils/khal/issues"
-                .format(kwargs.get('href'), kwargs.get('calendar'))
+                .format(self.href, self.calendar)
             )
             logger.fatal(msg)
             raise FatalError(  # because in ikhal you won't see the logger's output
@@ -705,37 +712,65 @@ class LocalizedEvent(DatetimeEvent):
         else:
             self._end = endtz.localize(self._end)
 
+    @property
+    def start(self):
+        """
+        see parent
+        """
+        if not self._localized:
+            self._localize()
+        return self._start
+
+    @property
+    def end(self):
+        """
+        see parent
+        """
+        if not self._localized:
+            self._localize()
+        return self._end
+
     @property
     def start_local(self):
         """
         see parent
         """
-        return self.start.astimezone(self._locale['local_timezone'])
+        if self._start_local is None:
+            self._start_local = self._start.astimezone(self._locale['local_timezone'])
+        return self._start_local
 
     @property
     def end_local(self):
         """
         see parent
         """
-        return self.end.astimezone(self._locale['local_timezone'])
+        if self._end_local is None:
+            self._end_local = self._end.astimezone(self._locale['local_timezone'])
+        return self._end_local
 
 
 class FloatingEvent(DatetimeEvent):
     """
     """
     allday = False
+    __slots__ = ()
 
     @property
     def start_local(self):
-        return self._locale['local_timezone'].localize(self.start)
+        if self._start_local is None:
+            self._start_local = self._locale['local_timezone'].localize(self.start)
+        return self._start_local
 
     @property
     def end_local(self):
-        return self._locale['local_timezone'].localize(self.end)
+        if self._end_local is None:
+            self._end_local = self._locale['local_timezone'].localize(self.end)
+        return self._end_local
 
 
 class AllDayEvent(Event):
     allday = True
+    __slots__ = ()
 
     @property
     def end(self):
@@ -752,12 +787,282 @@ class AllDayEvent(Event):
 
     @property
     def duration(self):
+        if self._properties is not None:
+            return self.end - self.start + dt.timedelta(days=1)
         try:
             return self._vevents[self.ref]['DURATION'].dt
         except KeyError:
             return self.end - self.start + dt.timedelta(days=1)
 
 
+def _get_datetime_attributes():
+    """return the attributes showing an event's start or end, mapped to the
+    property they format and the locale's formats for datetime and all-day
+    events (None meaning an empty string)"""
+    attributes = dict()
+    for which in ['start', 'end']:
+        for suffix, fmt, allday_fmt in [
+                ('', 'datetimeformat', 'dateformat'),
+                ('-long', 'longdatetimeformat', 'longdateformat'),
+                ('-date', 'dateformat', 'dateformat'),
+                ('-date-long', 'longdateformat', 'longdateformat'),
+                ('-time', 'timeformat', None)]:
+            attributes[which + suffix] = (which + '_local', fmt, allday_fmt)
+            attributes[which + suffix + '-full'] = (which + '_local', fmt, fmt)
+    return attributes
+
+
+DATETIME_ATTRIBUTES = _get_datetime_attributes()
+
+COLOR_NAMES = ["black", "red", "green", "yellow", "blue", "magenta", "cyan", "white"]
+
+
+@lru_cache(maxsize=2)
+def _get_constant_attributes(colors):
+    """return the attributes which are the same for all events, i.e. color
+    codes and some special characters"""
+    attributes = {'nl': '\n', 'tab': '\t', 'bell': '\a'}
+    if colors:
+        attributes['reset'] = style('', reset=True)
+        attributes['bold'] = style('', bold=True, reset=False)
+        for c in COLOR_NAMES:
+            attributes[c] = style("", reset=False, fg=c)
+            attributes[c + "-bold"] = style("", reset=False, fg=c, bold=True)
+    else:
+        attributes['reset'] = attributes['bold'] = ''
+        for c in COLOR_NAMES:
+            attributes[c] = attributes[c + '-bold'] = ''
+    return attributes
+
+
+@lru_cache(maxsize=64)
+def _get_relative_bounds(relative_to, local_timezone):
+    """return first and last day of `relative_to` (a date(time) or a tuple of
+    two), the localized start and end of that period and the start of the day
+    after its first day, memoized as all events of a day (or of an agenda)
+    are formatted relative to the same dates"""
+    try:
+        relative_to_start, relative_to_end = relative_to
+    except TypeError:
+        relative_to_start = relative_to_end = relative_to
+
+    if isinstance(relative_to_end, dt.datetime):
+        relative_to_end = relative_to_end.date()
+    if isinstance(relative_to_start, dt.datetime):
+        relative_to_start = relative_to_start.date()
+
+    day_start = local_timezone.localize(dt.datetime.combine(relative_to_start, dt.time.min))
+    day_end = local_timezone.localize(dt.datetime.combine(relative_to_end, dt.time.max))
+    next_day_start = day_start + dt.timedelta(days=1)
+    return relative_to_start, relative_to_end, day_start, day_end, next_day_start
+
+
+@lru_cache(maxsize=64)
+def _get_calendar_color(color):
+    return get_color(color)
+
+
+class FormatAttributes(dict):
+    """the attributes of an event available in format strings
+
+    Each attribute is only computed once it is looked up (as str.format_map()
+    does for the fields of a format string), so formatting an event costs only
+    as much as the attributes the format string actually uses.
+    """
+
+    def __init__(self, event, relative_to, env, colors):
+        super().__init__()
+        self.event = event
+        self.relative_to = relative_to
+        self.env = env
+        self.constants = _get_constant_attributes(colors)
+        self._bounds = None
+        self._local_datetimes = None
+        self._styles = None
+
+    def __missing__(self, key):
+        if key in self.constants:
+            return self.constants[key]
+        if key in DATETIME_ATTRIBUTES:
+            attr, fmt, allday_fmt = DATETIME_ATTRIBUTES[key]
+            if self.event.allday:
+                fmt = allday_fmt
+            if fmt is None:
+                value = ''
+            else:
+                value = getattr(self.event, attr).strftime(self.event._locale[fmt])
+        else:
+            try:
+                method = getattr(self, 'attr_' + key.replace('-', '_'))
+            except AttributeError:
+                raise KeyError(key)
+            value = method()
+        self[key] = value
+        return value
+
+    @property
+    def bounds(self):
+        """see _get_relative_bounds()"""
+        if self._bounds is None:
+            self._bounds = _get_relative_bounds(
+                self.relative_to, self.event._locale['local_timezone'])
+        return self._bounds
+
+    @property
+    def local_datetimes(self):
+        """the event's start and end as localized datetimes, even for all-day
+        events"""
+        if self._local_datetimes is None:
+            event = self.event
+            if isinstance(event.start_local, dt.datetime):
+                self._local_datetimes = event.start_local, event.end_local
+            else:
+                local_timezone = event._locale['local_timezone']
+                self._local_datetimes = (
+                    local_timezone.localize(dt.datetime.combine(event.start, dt.time.min)),
+                    local_timezone.localize(dt.datetime.combine(event.end, dt.time.min)),
+                )
+        return self._local_datetimes
+
+    @property
+    def styles(self):
+        """start-style, the string between start-style and end-style and
+        end-style"""
+        if self._styles is None:
+            event = self.event
+            relative_to_start, _, _, day_end, next_day_start = self.bounds
+            end_local_datetime = self.local_datetimes[1]
+
+            tostr = ""
+            if event.start_local.timetuple() < relative_to_start.timetuple():
+                start_style = event.symbol_strings["right_arrow"]
+            elif event.start_local.timetuple() == relative_to_start.timetuple():
+                start_style = event.symbol_strings['range_start']
+            else:
+                start_style = self["start-time"]
+                tostr = "-"
+
+            if end_local_datetime in [day_end, next_day_start]:
+                if event._locale["timeformat"] == '%H:%M':
+                    end_style = '24:00'
+                    tostr = '-'
+                else:
+                    end_style = event.symbol_strings["range_end"]
+                    tostr = ""
+            elif end_local_datetime > day_end:
+                end_style = event.symbol_strings["right_arrow"]
+                tostr = ""
+            else:
+                end_style = self["end-time"]
+            self._styles = start_style, tostr, end_style
+        return self._styles
+
+    def attr_duration(self):
+        return timedelta2str(self.event.duration)
+
+    attr_duration_full = attr_duration
+
+    def attr_start_style(self):
+        return self.styles[0]
+
+    def attr_end_style(self):
+        return self.styles[2]
+
+    def attr_to_style(self):
+        if self.event.start_local < self.event.end_local:
+            return '-'
+        else:
+            return ''
+
+    def attr_start_end_time_style(self):
+        event = self.event
+        relative_to_start, relative_to_end, day_start, day_end, _ = self.bounds
+        if event.allday:
+            if event.start == event.end:
+                return ''
+            elif event.start == relative_to_start and event.end > relative_to_end:
+                return event.symbol_strings['range_start']
+            elif event.start < relative_to_start and event.end > relative_to_end:
+                return event.symbol_strings['range']
+            elif event.start < relative_to_start and event.end == relative_to_end:
+                return event.symbol_strings['range_end']
+            else:
+                return ''
+
+        start_local_datetime, end_local_datetime = self.local_datetimes
+        if start_local_datetime < day_start and end_local_datetime > day_end:
+            return event.symbol_strings["range"]
+        else:
+            return ''.join(self.styles)
+
+    def attr_end_necessary(self):
+        event = self.event
+        if event.allday:
+            if event.start_local != event.end_local:
+                return self['end-date']
+            return ''
+        if event.start_local.date() != event.end_local.date():
+            return self['end']
+        return self['end-time']
+
+    def attr_end_necessary_long(self):
+        event = self.event
+        if event.allday:
+            if event.start_local != event.end_local:
+                return self['end-date-long']
+            return ''
+        if event.start_local.date() != event.end_local.date():
+            return self['end-long']
+        return self['end-time']
+
+    def attr_repeat_symbol(self):
+        return self.event._recur_str
+
+    def attr_repeat_pattern(self):
+        return self.event.recurpattern
+
+    def attr_title(self):
+        return self.event.summary
+
+    def attr_organizer(self):
+        return self.event.organizer.strip()
+
+    def attr_description(self):
+        return self.event.description.strip()
+
+    def attr_description_separator(self):
+        if self['description']:
+            return " :: "
+        return ""
+
+    def attr_location(self):
+        return self.event.location.strip()
+
+    def attr_all_day(self):
+        return self.event.allday
+
+    def attr_categories(self):
+        return self.event.categories
+
+    def attr_calendar_color(self):
+        if "calendars" in self.env and self.event.calendar in self.env["calendars"]:
+            cal = self.env["calendars"][self.event.calendar]
+            return _get_calendar_color(cal.get('color', ''))
+        return ''
+
+    def attr_calendar(self):
+        if "calendars" in self.env and self.event.calendar in self.env["calendars"]:
+            cal = self.env["calendars"][self.event.calendar]
+            return cal.get("displayname", self.event.calendar)
+        return ''
+
+    def attr_status(self):
+        return self.event.status + ' ' if self.event.status else ''
+
+    def attr_cancelled(self):
+        return 'CANCELLED ' if self.event.status == 'CANCELLED' else ''
+
+
 def create_timezone(tz, first_date=None, last_date=None):
     """
     create an icalendar vtimezone from a pytz.tzinfo object
@@ -786,6 +1091,9 @@ def create_timezone(tz, first_date=None, last_date=None):
     As this information is not provided by pytz at all, there is no
     easy solution, we'd really need to ship another version of the OLSON DB.
 
+    The returned VTIMEZONEs are cached and shared between callers (saving
+    lots of events in the same timezone would otherwise generate the same
+    VTIMEZONE over and over again), they must therefore not be changed.
     """
     if isinstance(tz, pytz.tzinfo.StaticTzInfo):
         return _create_timezone_static(tz)
@@ -794,6 +1102,25 @@ def create_timezone(tz, first_date=None, last_date=None):
 
     first_date = dt.datetime.today() if not first_date else to_naive_utc(first_date)
     last_date = dt.datetime.today() if not last_date else to_naive_utc(last_date)
+
+    # looking for the first and last transition time we need to include, i.e.
+    # the last one before first_date and the first one after last_date
+    transition_times = tz._utc_transition_times
+    first_num = max(bisect.bisect_left(transition_times, first_date) - 1, 0)
+    last_num = min(bisect.bisect_right(transition_times, last_date), len(transition_times) - 1)
+    return _create_timezone(tz, first_num, last_num)
+
+
+@lru_cache(maxsize=128)
+def _create_timezone(tz, first_num, last_num):
+    """create an icalendar vtimezone from a pytz.tzinfo.DstTzInfo, including
+    its transitions `first_num` to `last_num`, see create_timezone()
+
+    :type tz: pytz.tzinfo.DstTzInfo
+    :type first_num: int
+    :type last_num: int
+    :rtype: icalendar.Timezone()
+    """
     timezone = icalendar.Timezone()
     timezone.add('TZID', tz)
 
@@ -806,18 +1133,6 @@ def create_timezone(tz, first_date=None, last_date=None):
         for one, two in iter(tz._tzinfos.items())
     }
 
-    # looking for the first and last transition time we need to include
-    first_num, last_num = 0, len(tz._utc_transition_times) - 1
-    first_tt = tz._utc_transition_times[0]
-    last_tt = tz._utc_transition_times[-1]
-    for num, transtime in enumerate(tz._utc_transition_times):
-        if transtime > first_tt and transtime < first_date:
-            first_num = num
-            first_tt = transtime
-        if transtime < last_tt and transtime > last_date:
-            last_num = num
-            last_tt = transtime
-
     timezones = dict()
     for num in range(first_num, last_num + 1):
         name = tz._transition_info[num][2]
@@ -849,6 +1164,7 @@ def create_timezone(tz, first_date=None, last_date=None):
     return timezone
 
 
+@lru_cache(maxsize=128)
 def _create_timezone_static(tz):
     """create an icalendar vtimezone from a pytz.tzinfo.StaticTzInfo
 
@@ -26,22 +26,88 @@ calendars. Each calendar is defined by the contents of a vdir, but uses an
 SQLite db for caching (see backend if you're interested).
 """
 import datetime as dt
-import itertools
 import logging
 import os
 import os.path
-from typing import Any, Dict, Iterable, List, Optional, Tuple, Union  # noqa
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from concurrent.futures.process import BrokenProcessPool
+from typing import (Any, Container, Dict, FrozenSet, Iterable, Iterator, List,  # noqa
+                    Optional, Set, Tuple, Union)
 
 from . import backend
 from .event import Event
 from .exceptions import (CouldNotCreateDbDir, DuplicateUid, NonUniqueUID,
                          ReadOnlyCalendarError, UnsupportedFeatureError,
                          UpdateFailed)
-from .vdir import (AlreadyExistingError, CollectionNotFoundError, Vdir,
-                   get_etag_from_file)
+from .vdir import (AlreadyExistingError, CollectionNotFoundError, NotFoundError,
+                   Vdir, get_etag_from_file, get_etag_from_stat)
+from .watcher import Watcher, get_watcher  # noqa
 
 logger = logging.getLogger('khal')
 
+# events are only parsed by several processes if at least this many need to
+# be updated, the processes are sent PARSE_CHUNKSIZE events at a time
+PARALLEL_MIN_UPDATES = 100
+PARSE_CHUNKSIZE = 50
+
+# copies of a collection update the db this many events at a time, see copy()
+REFRESH_BATCHSIZE = 20
+
+# the number of parsed events kept around, all instances of a recurring event
+# share the same parsed VEVENTs (see CalendarCollection._load_vevents())
+PARSED_CACHE_SIZE = 256
+
+
+class _RecordCollector(logging.Handler):
+    """collects log records, so that records emitted in another process can be
+    handled by this one"""
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.records = []  # type: List[logging.LogRecord]
+
+    def emit(self, record: logging.LogRecord) -> None:
+        # the record's arguments and traceback might not be picklable
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        self.records.append(record)
+
+
+def _parse_files(args: Tuple[str, str, List[str], str, dt.tzinfo, Tuple[int, int], int]) \
+        -> List[Tuple[str, Optional[str], Any, List[logging.LogRecord]]]:
+    """read and parse the events `hrefs` of a vdir, run in other processes by
+    CalendarCollection._update_vevents()
+
+    Returns the href, the etag, the parsed event (see backend.parse_event())
+    or the exception raised while reading or parsing it and the records logged
+    meanwhile (with at least the given level) for each href.
+    """
+    path, fileext, hrefs, calendar, default_timezone, window, level = args
+    storage = Vdir(path, fileext)
+    results = []  # type: List[Tuple[str, Optional[str], Any, List[logging.LogRecord]]]
+    collector = _RecordCollector()
+    handlers, propagate, old_level = logger.handlers, logger.propagate, logger.level
+    logger.handlers, logger.propagate = [collector], False
+    logger.setLevel(level)
+    try:
+        for href in hrefs:
+            try:
+                item, etag = storage.get(href)
+                event = backend.parse_event(item.raw, href, calendar, default_timezone, window)
+                results.append((href, etag, event, collector.records))
+            except Exception as error:
+                results.append((href, None, error, collector.records))
+            collector.records = []
+    finally:
+        logger.handlers, logger.propagate = handlers, propagate
+        logger.setLevel(old_level)
+    return results
+
 
 def create_directory(path: str):
     if not os.path.isdir(path):
@@ -69,7 +135,17 @@ class CalendarCollection(object):
                  highlight_event_days: bool=False,
                  locale: Dict[str, Any]=dict(),
                  dbpath: Optional[str]=None,
+                 journal_mode: str='wal',
+                 processes: int=1,
+                 batch_size: Optional[int]=None,
                  ) -> None:
+        """
+        :param processes: the number of processes used to parse events when
+            many of them need to be updated at once, 0 means one per CPU
+        :param batch_size: if set, events are read and parsed while the db is
+            unlocked and written this many at a time, so that other connections
+            do not have to wait for the whole update
+        """
         assert dbpath is not None
         assert calendars is not None
         self._calendars = calendars
@@ -97,9 +173,54 @@ class CalendarCollection(object):
         self.priority = priority
         self.highlight_event_days = highlight_event_days
         self._locale = locale
-        self._backend = backend.SQLiteDb(self.names, dbpath, self._locale)
+        self._dbpath = dbpath
+        self._journal_mode = journal_mode
+        self._processes = processes
+        self._batch_size = batch_size
+        self._backend = backend.SQLiteDb(self.names, dbpath, self._locale, journal_mode)
         self._last_ctags = dict()  # type: Dict[str, str]
-        self.update_db()
+        # the calendars of all events on each day, filled a month at a time
+        self._day_calendars = dict()  # type: Dict[dt.date, List[str]]
+        # the colors shown for a set of calendars and a default color, see
+        # calendar_display.get_color_list()
+        self._color_lists = dict()  # type: Dict[Tuple[FrozenSet[str], str], Tuple[str, ...]]
+        self._watcher = None  # type: Optional[Watcher]
+        # the files changed per calendar according to the watcher, None if
+        # the whole vdir needs to be rescanned
+        self._changes = dict()  # type: Dict[str, Optional[Set[str]]]
+        # calendars are only synced with their vdirs once they are first
+        # needed, see _sync()
+        self._unsynced = set(self._calendars)  # type: Set[str]
+        # parsed VEVENTs keyed by calendar, href and etag, least recently used
+        # first
+        self._parsed = OrderedDict()  # type: OrderedDict
+
+    def copy(self) -> 'CalendarCollection':
+        """return a new collection of the same calendars and db
+
+        The copy has a database connection of its own, so it can be used from
+        another thread. Unlike other new collections, it updates the db from
+        all vdirs right away. As forking a process with several threads is not
+        safe, it parses all events in its own process. It writes them in
+        batches, so that the original collection can still write to the db in
+        the mean time.
+        """
+        collection = CalendarCollection(
+            calendars=self._calendars,
+            hmethod=self.hmethod,
+            default_color=self.default_color,
+            multiple=self.multiple,
+            color=self.color,
+            priority=self.priority,
+            highlight_event_days=self.highlight_event_days,
+            locale=self._locale,
+            dbpath=self._dbpath,
+            journal_mode=self._journal_mode,
+            processes=1,
+            batch_size=REFRESH_BATCHSIZE,
+        )
+        collection.update_db()
+        return collection
 
     @property
     def writable_names(self) -> List[str]:
@@ -132,45 +253,125 @@ class CalendarCollection(object):
             raise ValueError(
                 'Calendar "{0}" is read-only and cannot be used as default'.format(default))
 
-    def _local_ctag(self, calendar: str) -> str:
+    def _local_ctag(self, calendar: str, sync: bool=True) -> str:
+        """return the ctag of `calendar`'s vdir
+
+        only set `sync` to False if the ctag is just checked for changes, after
+        writing to the vdir the synced ctag must be used
+        """
+        if not sync:
+            return get_etag_from_stat(os.stat(self._calendars[calendar]['path']))
         return get_etag_from_file(self._calendars[calendar]['path'])
 
+    def _sync(self, calendars: Optional[Iterable[str]]=None) -> None:
+        """update the db from the vdirs of `calendars` (all by default), if
+        they have not been synced yet
+
+        Calendars are synced when they are first queried or written to, so
+        that commands do not pay for calendars they do not use.
+        """
+        for calendar in self.names if calendars is None else calendars:
+            if calendar in self._unsynced:
+                self._unsynced.discard(calendar)
+                if self._needs_update(calendar, remember=True):
+                    self._db_update(calendar)
+
     def get_floating(self, start: dt.datetime, end: dt.datetime) -> Iterable[Event]:
+        self._sync()
         for args in self._backend.get_floating(start, end):
             yield self._construct_event(*args)
 
     def get_localized(self, start: dt.datetime, end: dt.datetime) -> Iterable[Event]:
+        self._sync()
         for args in self._backend.get_localized(start, end):
             yield self._construct_event(*args)
 
+    def get_range(self, start: dt.datetime, end: dt.datetime) -> Iterable[Event]:
+        """return all events between `start` and `end` (naive datetimes in
+        local time), ordered by their start"""
+        self._sync()
+        for args in self._backend.get_range(start, end):
+            yield self._construct_event(*args)
+
+    def get_events_per_day(self, start: dt.datetime, end: dt.datetime) \
+            -> Iterator[Tuple[dt.date, List[Event]]]:
+        """yields each day between `start` and `end` (naive datetimes in local
+        time) together with the events shown on it, ordered by their start
+
+        All events are fetched with one query, they are ordered by their start
+        in UTC. As UTC offsets change, their local days might be slightly out of
+        order, though, a day is therefore only yielded once an event starting
+        more than a day later arrives. Only those events and events spanning
+        several days need to be kept around. The latter are included for each
+        of their days, events ending at midnight are not shown on the day they
+        end on.
+        """
+        day = start.date()
+        # (first day, last day, event)
+        current = []  # type: List[Tuple[dt.date, dt.date, Event]]
+        for event in self.get_range(start, end):
+            if event.allday:
+                first, last = event.start, event.end
+            else:
+                first, last = event.start_local.date(), event.end_local.date()
+                if event.end_local.time() == dt.time.min:
+                    last -= dt.timedelta(days=1)
+            while day < first - dt.timedelta(days=1) and day <= end.date():
+                yield day, [event for first_day, _, event in current if first_day <= day]
+                current = [item for item in current if item[1] > day]
+                day += dt.timedelta(days=1)
+            current.append((first, max(first, last), event))
+        while day <= end.date():
+            yield day, [event for first_day, _, event in current if first_day <= day]
+            current = [item for item in current if item[1] > day]
+            day += dt.timedelta(days=1)
+
     def get_events_on(self, day: dt.date) -> Iterable[Event]:
         """return all events on `day`"""
         start = dt.datetime.combine(day, dt.time.min)
         end = dt.datetime.combine(day, dt.time.max)
-        floating_events = self.get_floating(start, end)
-        localize = self._locale['local_timezone'].localize
-        localized_events = self.get_localized(localize(start), localize(end))
-        return itertools.chain(floating_events, localized_events)
+        return self.get_range(start, end)
 
     def get_calendars_on(self, day: dt.date) -> List[str]:
-        start = dt.datetime.combine(day, dt.time.min)
-        end = dt.datetime.combine(day, dt.time.max)
-        localize = self._locale['local_timezone'].localize
-        calendars = itertools.chain(
-            self._backend.get_floating_calendars(start, end),
-            self._backend.get_localized_calendars(localize(start), localize(end)),
-        )
-        return list(set(calendars))
+        """return the calendars of all events on `day`
 
-    def update(self, event: Event):
-        """update `event` in vdir and db"""
+        The calendars of the whole month are fetched (and cached) at once, as
+        this is called for every day of a month anyway.
+        """
+        if day not in self._day_calendars:
+            start = day.replace(day=1)
+            end = (start + dt.timedelta(days=31)).replace(day=1) - dt.timedelta(days=1)
+            self.get_calendars_in(start, end)
+        return self._day_calendars[day]
+
+    def get_calendars_in(self, start: dt.date, end: dt.date) -> Dict[dt.date, List[str]]:
+        """return the calendars of all events on each day between `start` and
+        `end` (both inclusive)"""
+        self._sync()
+        days = {
+            day: sorted(calendars)
+            for day, calendars in self._backend.get_calendars_by_day(start, end).items()
+        }
+        self._day_calendars.update(days)
+        return days
+
+    def update(self, event: Event) -> Set[dt.date]:
+        """update `event` in vdir and db
+
+        :returns: the days on which the event was or is now shown
+        """
         assert event.etag
         if self._calendars[event.calendar]['readonly']:
             raise ReadOnlyCalendarError()
+        self._sync([event.calendar])
+        self._day_calendars.clear()
+        self._forget_parsed(event.href, event.calendar)
         with self._backend.at_once():
             event.etag = self._storages[event.calendar].update(event.href, event, event.etag)
-            self._backend.update(event.raw, event.href, event.etag, calendar=event.calendar)
+            days = self._backend.update(
+                event.raw, event.href, event.etag, calendar=event.calendar)
             self._backend.set_ctag(self._local_ctag(event.calendar), calendar=event.calendar)
+        return days
 
     def force_update(self, event: Event, collection: Optional[str]=None):
         """update `event` even if an event with the same uid/href already exists"""
@@ -178,22 +379,27 @@ class CalendarCollection(object):
         if self._calendars[calendar]['readonly']:
             raise ReadOnlyCalendarError()
 
+        self._sync([calendar])
+        self._day_calendars.clear()
         with self._backend.at_once():
             try:
                 href, etag = self._storages[calendar].upload(event)
             except AlreadyExistingError as error:
                 href = error.existing_href
+                assert href is not None
                 _, etag = self._storages[calendar].get(href)
                 etag = self._storages[calendar].update(href, event, etag)
+                self._forget_parsed(href, calendar)
             self._backend.update(event.raw, href, etag, calendar=calendar)
             self._backend.set_ctag(self._local_ctag(calendar), calendar=calendar)
 
-    def new(self, event: Event, collection: Optional[str]=None):
+    def new(self, event: Event, collection: Optional[str]=None) -> Set[dt.date]:
         """save a new event to the vdir and the database
 
         param event: the event that should be updated, will get a new href and
             etag properties
         type event: event.Event
+        :returns: the days on which the event is shown
         """
         calendar = collection if collection is not None else event.calendar
         if hasattr(event, 'etag'):
@@ -201,6 +407,8 @@ class CalendarCollection(object):
         if self._calendars[calendar]['readonly']:
             raise ReadOnlyCalendarError()
 
+        self._sync([calendar])
+        self._day_calendars.clear()
         with self._backend.at_once():
 
             try:
@@ -208,17 +416,26 @@ class CalendarCollection(object):
             except AlreadyExistingError as Error:
                 href = getattr(Error, 'existing_href', None)
                 raise DuplicateUid(href)
-            self._backend.update(event.raw, event.href, event.etag, calendar=calendar)
+            days = self._backend.update(event.raw, event.href, event.etag, calendar=calendar)
             self._backend.set_ctag(self._local_ctag(calendar), calendar=calendar)
+        return days
+
+    def delete(self, href: str, etag: str, calendar: str) -> Set[dt.date]:
+        """delete an event from vdir and db
 
-    def delete(self, href: str, etag: str, calendar: str):
+        :returns: the days on which the event was shown
+        """
         if self._calendars[calendar]['readonly']:
             raise ReadOnlyCalendarError()
+        self._sync([calendar])
+        self._day_calendars.clear()
+        self._forget_parsed(href, calendar)
         self._storages[calendar].delete(href, etag)
-        self._backend.delete(href, calendar=calendar)
+        return self._backend.delete(href, calendar=calendar)
 
     def get_event(self, href: str, calendar: str) -> Event:
         """get an event by its href from the datatbase"""
+        self._sync([calendar])
         return self._construct_event(
             self._backend.get(href, calendar), href=href, calendar=calendar,
         )
@@ -226,12 +443,14 @@ class CalendarCollection(object):
     def _construct_event(self,
                          item: str,
                          href: str,
-                         start: dt.datetime = None,
-                         end: dt.datetime = None,
+                         start: Optional[dt.date] = None,
+                         end: Optional[dt.date] = None,
                          ref: str='PROTO',
-                         etag: str=None,
-                         calendar: str=None,
+                         etag: Optional[str]=None,
+                         calendar: Optional[str]=None,
+                         properties: Optional[Dict[str, Any]]=None,
                          ) -> Event:
+        assert calendar is not None
         event = Event.fromString(
             item,
             locale=self._locale,
@@ -241,16 +460,41 @@ class CalendarCollection(object):
             start=start,
             end=end,
             ref=ref,
+            properties=properties,
             color=self._calendars[calendar]['color'],
             readonly=self._calendars[calendar]['readonly'],
+            load_vevents=None if not etag else
+            partial(self._load_vevents, item, href, etag, calendar),
         )
         return event
 
-    def change_collection(self, event: Event, new_collection: str):
+    def _load_vevents(self, item: str, href: str, etag: str, calendar: str) -> Dict[str, Any]:
+        """return the parsed VEVENTs of `item`
+
+        The last PARSED_CACHE_SIZE parsed events are cached, so that the
+        instances of a recurring event are only parsed once. Events copy the
+        VEVENTs before changing them.
+        """
+        key = (calendar, href, etag)
+        if key in self._parsed:
+            self._parsed.move_to_end(key)
+            return self._parsed[key]
+        vevents = Event.parse_vevents(item, self._locale)
+        self._parsed[key] = vevents
+        if len(self._parsed) > PARSED_CACHE_SIZE:
+            self._parsed.popitem(last=False)
+        return vevents
+
+    def _forget_parsed(self, href: str, calendar: str) -> None:
+        """remove all versions of `href` from the cache of parsed events"""
+        for key in [key for key in self._parsed if key[:2] == (calendar, href)]:
+            del self._parsed[key]
+
+    def change_collection(self, event: Event, new_collection: str) -> Set[dt.date]:
         href, etag, calendar = event.href, event.etag, event.calendar
         event.etag = None
-        self.new(event, new_collection)
-        self.delete(href, etag, calendar=calendar)
+        days = self.new(event, new_collection)
+        return days | self.delete(href, etag, calendar=calendar)
 
     def new_event(self, ical: str, collection: str):
         """creates and returns (but does not insert) new event from ical
@@ -263,10 +507,67 @@ class CalendarCollection(object):
 
         should be called after every change to the vdir
         """
+        # another instance of khal might have updated the db as well
+        self._day_calendars.clear()
+        self._unsynced.clear()
+        if self._watcher is not None:
+            self._collect_changes()
+            changes, self._changes = self._changes, dict()
+            for calendar, hrefs in changes.items():
+                if hrefs is None or self._calendars[calendar].get('ctype') == 'birthdays':
+                    self._db_update(calendar)
+                else:
+                    self._db_update_hrefs(calendar, hrefs)
+            return
         for calendar in self._calendars:
             if self._needs_update(calendar, remember=True):
                 self._db_update(calendar)
 
+    def watch(self) -> Optional[int]:
+        """watch the vdirs for changes
+
+        Afterwards, needs_update() and update_db() only look at the files
+        which were changed instead of checking all vdirs. Returns a file
+        descriptor, which becomes readable when the vdirs change, or None if
+        the vdirs cannot be watched (currently, this needs inotify) and need to
+        be polled with needs_update().
+        """
+        if self._watcher is None:
+            self._watcher = get_watcher(
+                {name: calendar['path'] for name, calendar in self._calendars.items()})
+            if self._watcher is None:
+                return None
+            # catch changes from before the watcher was started
+            for calendar in self._calendars:
+                if self._needs_update(calendar):
+                    self._changes[calendar] = None
+        return self._watcher.fileno()
+
+    def _collect_changes(self) -> None:
+        """add the changes reported by the watcher to self._changes, ignoring
+        files which are not events (e.g., metadata) and those already up to
+        date in the db (e.g., because khal itself wrote them)"""
+        assert self._watcher is not None
+        for calendar, hrefs in self._watcher.changes().items():
+            known = self._changes.get(calendar, set())
+            if hrefs is None or known is None:
+                self._changes[calendar] = None
+                continue
+            fileext = self._storages[calendar].fileext
+            hrefs = {href for href in hrefs if href.endswith(fileext)}
+            if self._calendars[calendar].get('ctype') != 'birthdays':
+                hrefs = {href for href in hrefs if self._href_changed(calendar, href)}
+            if hrefs:
+                self._changes[calendar] = known | hrefs
+
+    def _href_changed(self, calendar: str, href: str) -> bool:
+        """checks if the file `href` differs from its version in the db"""
+        try:
+            etag = self._storages[calendar].get_etag(href)
+        except NotFoundError:
+            etag = None
+        return etag != self._backend.get_etag(href, calendar)
+
     def needs_update(self) -> bool:
         """Check if you need to call update_db.
 
@@ -287,15 +588,21 @@ class CalendarCollection(object):
         #   do_the_update()
         #
         # and the API would be made even uglier than it already is...
+        if self._watcher is not None:
+            self._collect_changes()
+            return bool(self._changes)
         for calendar in self._calendars:
+            if calendar in self._unsynced:
+                # will be synced once it is needed
+                continue
             if self._needs_update(calendar) or \
-                    self._last_ctags[calendar] != self._local_ctag(calendar):
+                    self._last_ctags[calendar] != self._local_ctag(calendar, sync=False):
                 return True
         return False
 
     def _needs_update(self, calendar: str, remember: bool=False) -> bool:
         """checks if the db for the given calendar needs an update"""
-        local_ctag = self._local_ctag(calendar)
+        local_ctag = self._local_ctag(calendar, sync=False)
         if remember:
             self._last_ctags[calendar] = local_ctag
         return local_ctag != self._backend.get_ctag(calendar)
@@ -303,50 +610,160 @@ class CalendarCollection(object):
     def _db_update(self, calendar: str):
         """implements the actual db update on a per calendar base"""
         local_ctag = self._local_ctag(calendar)
-        db_hrefs = set(href for href, etag in self._backend.list(calendar))
-        storage_hrefs = set()
-        bdays = self._calendars[calendar].get('ctype') == 'birthdays'
-
+        storage_etags = dict(self._storages[calendar].list())
+        # the etags are only read once we hold the db's write lock, so if
+        # another khal instance just synced the same changes, we do nothing
         with self._backend.at_once():
-            for href, etag in self._storages[calendar].list():
-                storage_hrefs.add(href)
-                db_etag = self._backend.get_etag(href, calendar=calendar)
+            db_etags = self._backend.list_etags(calendar)
+            if self._calendars[calendar].get('ctype') == 'birthdays':
+                # every date of a vcard is saved with the vcard's href plus the
+                # date's key (e.g. `BDAY`) as href
+                storage_hrefs = {href: _storage_href(href, storage_etags) for href in db_etags}
+                removed = [href for href, storage_href in storage_hrefs.items()
+                           if storage_href is None]
+                db_etags = {storage_href: db_etags[href]
+                            for href, storage_href in storage_hrefs.items()
+                            if storage_href is not None}
+            else:
+                removed = [href for href in db_etags if href not in storage_etags]
+
+            changed = []
+            for href, etag in storage_etags.items():
+                db_etag = db_etags.get(href)
                 if etag != db_etag:
                     logger.debug('Updating {0} because {1} != {2}'.format(href, etag, db_etag))
-                    self._update_vevent(href, calendar=calendar)
-            for href in db_hrefs - storage_hrefs:
-                if bdays:
-                    for sh in storage_hrefs:
-                        if href.startswith(sh):
-                            break
-                    else:
-                        self._backend.delete(href, calendar=calendar)
-                else:
-                    self._backend.delete(href, calendar=calendar)
+                    changed.append(href)
+            self._update_vevents(changed, calendar=calendar)
+            self._backend.delete_many(removed, calendar=calendar)
             self._backend.set_ctag(local_ctag, calendar=calendar)
             self._last_ctags[calendar] = local_ctag
 
+    def _db_update_hrefs(self, calendar: str, hrefs: Iterable[str]):
+        """like _db_update(), but only for the files `hrefs` of `calendar`"""
+        local_ctag = self._local_ctag(calendar)
+        with self._backend.at_once():
+            removed, changed = [], []
+            for href in hrefs:
+                if not os.path.isfile(self._storages[calendar]._get_filepath(href)):
+                    removed.append(href)
+                elif self._href_changed(calendar, href):
+                    logger.debug('Updating {0}'.format(href))
+                    changed.append(href)
+            self._update_vevents(changed, calendar=calendar)
+            self._backend.delete_many(removed, calendar=calendar)
+            self._backend.set_ctag(local_ctag, calendar=calendar)
+            self._last_ctags[calendar] = local_ctag
+
+    def _update_vevents(self, hrefs: List[str], calendar: str) -> None:
+        """should only be called during db_update, updates `hrefs` in the db
+
+        If there are enough of them, they are read and parsed by several
+        processes, only the db is written to by this one.
+        """
+        processes = self._processes or os.cpu_count() or 1
+        if processes > 1 and len(hrefs) >= PARALLEL_MIN_UPDATES and \
+                self._calendars[calendar].get('ctype') != 'birthdays':
+            try:
+                hrefs = self._update_vevents_parallel(hrefs, calendar, processes)
+            except (OSError, NotImplementedError) as error:
+                logger.warning(
+                    'Cannot parse events in parallel, parsing them one by one: {}'.format(error))
+        if self._batch_size is not None and self._calendars[calendar].get('ctype') != 'birthdays':
+            self._update_vevents_batched(hrefs, calendar, self._batch_size)
+            return
+        for href in hrefs:
+            self._update_vevent(href, calendar=calendar)
+
+    def _update_vevents_batched(self, hrefs: List[str], calendar: str, batch_size: int) -> None:
+        """update `hrefs` in the db, `batch_size` at a time
+
+        The events are read and parsed while the db is unlocked. Events which
+        were changed or deleted in the mean time are left alone, they were
+        either written to the db by whoever changed them or will be updated
+        by the next update.
+        """
+        storage = self._storages[calendar]
+        for start in range(0, len(hrefs), batch_size):
+            parsed = []
+            with self._backend.released():
+                window = self._backend.get_window(calendar)
+                for href in hrefs[start:start + batch_size]:
+                    try:
+                        item, etag = storage.get(href)
+                        parsed.append((href, etag, backend.parse_event(
+                            item.raw, href, calendar, self._locale['default_timezone'], window)))
+                    except NotFoundError:
+                        continue
+                    except Exception as error:
+                        self._skip_vevent(href, calendar, error)
+            for href, etag, event in parsed:
+                try:
+                    if storage.get_etag(href) != etag:
+                        continue
+                except NotFoundError:
+                    continue
+                try:
+                    self._backend.update_parsed(event, etag=etag)
+                except Exception as error:
+                    self._skip_vevent(href, calendar, error)
+
+    def _update_vevents_parallel(self, hrefs: List[str], calendar: str,
+                                 processes: int) -> List[str]:
+        """update `hrefs` in the db, reading and parsing them in `processes`
+        processes, returns the hrefs which have not been updated yet (if the
+        processes failed)"""
+        storage = self._storages[calendar]
+        window = self._backend.get_window(calendar)
+        chunks = [hrefs[i:i + PARSE_CHUNKSIZE] for i in range(0, len(hrefs), PARSE_CHUNKSIZE)]
+        args = [(storage.path, storage.fileext, chunk, calendar,
+                 self._locale['default_timezone'], window, logger.getEffectiveLevel())
+                for chunk in chunks]
+        updated = set()  # type: Set[str]
+        with ProcessPoolExecutor(min(processes, len(chunks))) as executor:
+            try:
+                for results in executor.map(_parse_files, args):
+                    for href, etag, event, records in results:
+                        for record in records:
+                            logger.handle(record)
+                        updated.add(href)
+                        if isinstance(event, Exception):
+                            self._skip_vevent(href, calendar, event)
+                            continue
+                        assert etag is not None
+                        try:
+                            self._backend.update_parsed(event, etag=etag)
+                        except Exception as error:
+                            self._skip_vevent(href, calendar, error)
+            except BrokenProcessPool as error:
+                logger.warning(
+                    'Cannot parse events in parallel, parsing them one by one: {}'.format(error))
+        return [href for href in hrefs if href not in updated]
+
     def _update_vevent(self, href: str, calendar: str) -> bool:
         """should only be called during db_update, only updates the db,
         does not check for readonly"""
         event, etag = self._storages[calendar].get(href)
         try:
             if self._calendars[calendar].get('ctype') == 'birthdays':
-                update = self._backend.update_vcf_dates
+                self._backend.update_vcf_dates(event.raw, href=href, etag=etag, calendar=calendar)
             else:
-                update = self._backend.update
-            update(event.raw, href=href, etag=etag, calendar=calendar)
+                self._backend.update(event.raw, href=href, etag=etag, calendar=calendar)
             return True
         except Exception as e:
-            if not isinstance(e, (UpdateFailed, UnsupportedFeatureError, NonUniqueUID)):
-                logger.exception('Unknown exception happened.')
-            logger.warning(
-                'Skipping {0}/{1}: {2}\n'
-                'This event will not be available in khal.'.format(calendar, href, str(e)))
+            self._skip_vevent(href, calendar, e)
             return False
 
+    def _skip_vevent(self, href: str, calendar: str, error: Exception) -> None:
+        """log that `href` could not be added to the db because of `error`"""
+        if not isinstance(error, (UpdateFailed, UnsupportedFeatureError, NonUniqueUID)):
+            logger.error('Unknown exception happened.', exc_info=error)
+        logger.warning(
+            'Skipping {0}/{1}: {2}\n'
+            'This event will not be available in khal.'.format(calendar, href, str(error)))
+
     def search(self, search_string: str) -> Iterable[Event]:
         """search for the db for events matching `search_string`"""
+        self._sync()
         return (self._construct_event(*args) for args in self._backend.search(search_string))
 
     def get_day_styles(self, day: dt.date, focus: bool) -> Optional[Union[str, Tuple[str, str]]]:
@@ -375,3 +792,11 @@ class CalendarCollection(object):
                     return self.get_day_styles(date, focus)
                 else:
                     return None
+
+
+def _storage_href(href: str, storage_hrefs: Container[str]) -> Optional[str]:
+    """return the longest prefix of `href` in `storage_hrefs` (or None)"""
+    for end in range(len(href), 0, -1):
+        if href[:end] in storage_hrefs:
+            return href[:end]
+    return None
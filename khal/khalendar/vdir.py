@@ -84,12 +84,34 @@ def get_etag_from_file(f):
         if close_f:
             os.close(f)
 
+    return get_etag_from_stat(stat)
+
+
+def get_etag_from_stat(stat):
+    '''Get mtime-based etag from the result of `os.stat()`.
+
+    Nothing is synced, so this should only be used for files which are not
+    written to by this process (or have been synced already).
+    '''
     mtime = getattr(stat, 'st_mtime_ns', None)
     if mtime is None:
         mtime = stat.st_mtime
     return '{:.9f}'.format(mtime)
 
 
+def _scandir(path):
+    '''yield the name and `os.stat()` of each regular file in `path`'''
+    if not hasattr(os, 'scandir'):  # python < 3.5
+        for fname in os.listdir(path):
+            fpath = os.path.join(path, fname)
+            if os.path.isfile(fpath):
+                yield fname, os.stat(fpath)
+        return
+    for entry in os.scandir(path):
+        if entry.is_file():
+            yield entry.name, entry.stat()
+
+
 class VdirError(IOError):
     def __init__(self, *args, **kwargs):
         for key, value in kwargs.items():
@@ -188,10 +210,19 @@ class VdirBase:
         return _generate_href(uid) + self.fileext
 
     def list(self):
-        for fname in os.listdir(self.path):
-            fpath = os.path.join(self.path, fname)
-            if os.path.isfile(fpath) and fname.endswith(self.fileext):
-                yield fname, get_etag_from_file(fpath)
+        for fname, stat in _scandir(self.path):
+            if fname.endswith(self.fileext):
+                yield fname, get_etag_from_stat(stat)
+
+    def get_etag(self, href):
+        '''return the etag of `href`, without syncing the file'''
+        try:
+            return get_etag_from_stat(os.stat(self._get_filepath(href)))
+        except OSError as e:
+            if e.errno == errno.ENOENT:
+                raise NotFoundError(href)
+            else:
+                raise
 
     def get(self, href):
         fpath = self._get_filepath(href)
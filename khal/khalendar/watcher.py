@@ -0,0 +1,143 @@
+# Copyright (c) 2013-2017 Christian Geier et al.
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject to
+# the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE
+# LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+# OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION
+# WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+Watching vdirs for changes with Linux's inotify.
+
+inotify is used through ctypes, on systems without it (or if it cannot be
+used for other reasons), get_watcher() returns None and the vdirs need to be
+polled for changes instead.
+"""
+
+import ctypes
+import ctypes.util
+import logging
+import os
+import struct
+from typing import Dict, Optional, Set  # noqa
+
+logger = logging.getLogger('khal')
+
+# from <sys/inotify.h>
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = os.O_CLOEXEC
+
+# the events changing a file's content, mtime (and therefore its etag) or
+# existence, atomic writes show up as IN_MOVED_TO of the final file
+WATCH_MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO |
+              IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF)
+# after these, the directory is not watched anymore (or events were lost)
+RESCAN_MASK = IN_DELETE_SELF | IN_MOVE_SELF | IN_IGNORED | IN_Q_OVERFLOW
+
+# struct inotify_event {int wd; uint32_t mask; uint32_t cookie; uint32_t len;}
+EVENT_HEADER = struct.Struct('iIII')
+
+
+class Watcher(object):
+    """watches the directories of several vdirs for changed files"""
+
+    def __init__(self, paths: Dict[str, str]) -> None:
+        """
+        :param paths: the paths of the vdirs to watch, keyed by calendar name
+        :raises OSError: if inotify is not available
+        """
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        try:
+            init, add_watch = libc.inotify_init1, libc.inotify_add_watch
+        except AttributeError:
+            raise OSError('inotify is not available')
+        add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self._fd = init(IN_NONBLOCK | IN_CLOEXEC)
+        if self._fd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno))
+        self._calendars = dict()  # type: Dict[int, str]
+        for calendar, path in paths.items():
+            wd = add_watch(self._fd, os.fsencode(path), WATCH_MASK)
+            if wd < 0:
+                errno = ctypes.get_errno()
+                self.close()
+                raise OSError(errno, os.strerror(errno), path)
+            self._calendars[wd] = calendar
+
+    def fileno(self) -> int:
+        """the file descriptor of the watcher, it is readable once there are
+        new changes"""
+        return self._fd
+
+    def changes(self) -> Dict[str, Optional[Set[str]]]:
+        """return the names of the files changed since the last call
+
+        Returns a set of file names per changed calendar. Instead of a set,
+        None means that any file of the calendar might have changed (e.g.,
+        because inotify's queue overflowed), the whole vdir needs to be
+        rescanned. Never blocks.
+        """
+        changes = dict()  # type: Dict[str, Optional[Set[str]]]
+        while True:
+            try:
+                data = os.read(self._fd, 64 * 1024)
+            except BlockingIOError:
+                break
+            if not data:
+                break
+            offset = 0
+            while offset < len(data):
+                wd, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+                offset += EVENT_HEADER.size
+                name = os.fsdecode(data[offset:offset + length].rstrip(b'\0'))
+                offset += length
+                if mask & IN_Q_OVERFLOW:
+                    changes.update(dict.fromkeys(self._calendars.values()))
+                    continue
+                calendar = self._calendars.get(wd)
+                if calendar is None:
+                    continue
+                if mask & RESCAN_MASK or not name:
+                    changes[calendar] = None
+                    continue
+                names = changes.setdefault(calendar, set())
+                if names is not None:
+                    names.add(name)
+        return changes
+
+    def close(self) -> None:
+        os.close(self._fd)
+
+
+def get_watcher(paths: Dict[str, str]) -> Optional[Watcher]:
+    """return a Watcher for the vdirs at `paths`, or None if they cannot be
+    watched"""
+    try:
+        return Watcher(paths)
+    except OSError as error:
+        logger.debug('Cannot watch vdirs for changes: {}'.format(error))
+        return None
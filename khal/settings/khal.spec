@@ -74,6 +74,19 @@ type = option('calendar', 'birthdays', 'discover', default='calendar')
 # khal stores its internal caching database here, by default this will be in the *$XDG_DATA_HOME/khal/khal.db* (this will most likely be *~/.local/share/khal/khal.db*).
 path = expand_db_path(default=None)
 
+# The journal mode of the database. With `wal` (write-ahead logging), any number
+# of khal instances (e.g. ikhal and `khal list` run from a status bar) can read
+# from the database while another one writes to it. WAL does not work on
+# network file systems, use `delete` (sqlite's default) if the database is
+# stored on one.
+journal_mode = option('wal', 'delete', default='wal')
+
+# The number of processes khal uses to parse events when many of them need to
+# be added to the database at once (e.g. when it is first created or after a
+# large sync). `0` means one process per CPU core, `1` parses all events in
+# khal's own process.
+update_processes = integer(default=0, min=0)
+
 # It is mandatory to set (long)date-, time-, and datetimeformat options, all others options in the **[locale]** section are optional and have (sensible) defaults.
 [locale]
 
@@ -22,7 +22,6 @@
 """all functions related to terminal display are collected here"""
 
 from collections import namedtuple
-from itertools import zip_longest
 
 NamedColor = namedtuple('NamedColor', ['index', 'light'])
 
@@ -138,11 +137,15 @@ def merge_columns(lcolumn, rcolumn, width=25):
     out its (real) width automatically since it might contain ANSI
     escape sequences.
     """
+    return list(iter_merge_columns(lcolumn, rcolumn, width))
 
-    missing = len(rcolumn) - len(lcolumn)
-    if missing > 0:
-        lcolumn = lcolumn + missing * [width * ' ']
 
-    rows = ['    '.join(one) for one in zip_longest(
-        lcolumn, rcolumn, fillvalue='')]
-    return rows
+def iter_merge_columns(lcolumn, rcolumn, width=25):
+    """like merge_columns, but yields the merged rows one by one, `rcolumn`
+    can be any iterable and is only consumed as far as needed
+    """
+    rcolumn = iter(rcolumn)
+    for left in lcolumn:
+        yield '    '.join((left, next(rcolumn, '')))
+    for right in rcolumn:
+        yield '    '.join((width * ' ', right))
@@ -21,8 +21,11 @@
 
 import datetime as dt
 import logging
+import os
 import signal
 import sys
+import threading
+from operator import attrgetter
 
 import click
 import urwid
@@ -286,7 +289,8 @@ class DListBox(EventListBox):
 
     def clean(self):
         """reset event most recently in focus"""
-        if self._old_focus is not None:
+        # the day might have been dropped from the DayWalker in the meantime
+        if self._old_focus is not None and self._old_focus < len(self.body):
             self.body[self._old_focus].body[0].set_attr_map({None: 'date'})
 
     def ensure_date(self, day):
@@ -343,7 +347,14 @@ class DListBox(EventListBox):
 
 class DayWalker(urwid.SimpleFocusListWalker):
     """A list Walker that contains a list of DateListBox objects, each representing
-    one day and associated events"""
+    one day and associated events
+
+    At most `max_days` days are kept, those farthest away from the focus are
+    dropped when more are loaded. The events of the days next to the loaded
+    ones are fetched `prefetch_days` at a time.
+    """
+    max_days = 150
+    prefetch_days = 30
 
     def __init__(self, this_date, eventcolumn, conf, collection, delete_status):
         self.eventcolumn = eventcolumn
@@ -353,6 +364,8 @@ class DayWalker(urwid.SimpleFocusListWalker):
         self._last_day = this_date
         self._first_day = this_date
         self._collection = collection
+        # events of days which are not loaded yet
+        self._prefetched = dict()
 
         super().__init__(list())
         self.ensure_date(this_date)
@@ -363,6 +376,11 @@ class DayWalker(urwid.SimpleFocusListWalker):
         # isn't very costly either
         item_no = None
 
+        if len(self) > 0 and not (
+                self[0].date - dt.timedelta(days=self.max_days // 2) <= day <=
+                self[-1].date + dt.timedelta(days=self.max_days // 2)):
+            # start over instead of loading all the days in between
+            del self[:]
         if len(self) == 0:
             pile = self._get_events(day)
             self.append(pile)
@@ -386,6 +404,7 @@ class DayWalker(urwid.SimpleFocusListWalker):
         """refresh the contents of the day's DateListBox"""
         offset = (day - self[0].date).days
         assert self[offset].date == day
+        self._prefetched.pop(day, None)
         self[offset] = self._get_events(day)
 
     def refresh_titles(self, start, end, everything):
@@ -429,11 +448,23 @@ class DayWalker(urwid.SimpleFocusListWalker):
             start = max(self[0].date, start)
             end = min(self[-1].date, end)
 
+        # the db has changed, prefetched events might be outdated
+        self._prefetched.clear()
         day = start
         while day <= end:
             self.update_events_ondate(day)
             day += dt.timedelta(days=1)
 
+    def update_days(self, days):
+        """refresh contents of all loaded days in `days`
+
+        :type days: set(datetime.date)
+        """
+        self._prefetched.clear()
+        for day in days:
+            if self[0].date <= day <= self[-1].date:
+                self.update_events_ondate(day)
+
     def update_date_line(self):
         for one in self:
             one.update_date_line()
@@ -445,11 +476,31 @@ class DayWalker(urwid.SimpleFocusListWalker):
         while position <= 0:
             self._autoprepend()
             position += 1
-        return super().set_focus(position)
+        rval = super().set_focus(position)
+        self._drop_days()
+        return rval
+
+    def _drop_days(self):
+        """drop the days farthest away from the focus, if there are more than
+        `max_days`"""
+        while len(self) > self.max_days:
+            if self.focus > len(self) // 2:
+                del self[0]
+            else:
+                del self[-1]
+        self._first_day = self[0].date
+        self._last_day = self[-1].date
+        keep_from = self._first_day - dt.timedelta(days=self.prefetch_days)
+        keep_until = self._last_day + dt.timedelta(days=self.prefetch_days)
+        for day in [day for day in self._prefetched if not keep_from <= day <= keep_until]:
+            del self._prefetched[day]
 
     def _autoextend(self):
         self._last_day += dt.timedelta(days=1)
-        pile = self._get_events(self._last_day)
+        if self._last_day not in self._prefetched:
+            self._prefetch(
+                self._last_day, self._last_day + dt.timedelta(days=self.prefetch_days - 1))
+        pile = self._get_events(self._last_day, self._prefetched.pop(self._last_day))
         self.append(pile)
 
     def _autoprepend(self):
@@ -459,13 +510,35 @@ class DayWalker(urwid.SimpleFocusListWalker):
         # be indicated as the currently selected date
         self[self.focus or 0].reset_style()
         self._first_day -= dt.timedelta(days=1)
-        pile = self._get_events(self._first_day)
+        if self._first_day not in self._prefetched:
+            self._prefetch(
+                self._first_day - dt.timedelta(days=self.prefetch_days - 1), self._first_day)
+        pile = self._get_events(self._first_day, self._prefetched.pop(self._first_day))
         self.insert(0, pile)
 
-    def _get_events(self, day):
+    def _prefetch(self, start, end):
+        """fetch the events of all days between start and end (inclusive)
+        with one query"""
+        for day, events in self._collection.get_events_per_day(
+                dt.datetime.combine(start, dt.time.min), dt.datetime.combine(end, dt.time.max)):
+            self._prefetched[day] = events
+
+    def prefetch(self):
+        """fetch the events of the days before and after the loaded ones, if
+        not done yet, meant to be called while idle"""
+        after = self._last_day + dt.timedelta(days=1)
+        if after not in self._prefetched:
+            self._prefetch(after, self._last_day + dt.timedelta(days=self.prefetch_days))
+        before = self._first_day - dt.timedelta(days=1)
+        if before not in self._prefetched:
+            self._prefetch(self._first_day - dt.timedelta(days=self.prefetch_days), before)
+
+    def _get_events(self, day, events=None):
         """get all events on day, return a DateListBox of `U_Event()`s
 
         :type day: datetime.date
+        :param events: the events on `day`, if already fetched
+        :type events: list(khal.khalendar.event.Event)
         """
         event_list = list()
         date_header = DateHeader(
@@ -474,7 +547,9 @@ class DayWalker(urwid.SimpleFocusListWalker):
             conf=self._conf,
         )
         event_list.append(urwid.AttrMap(date_header, 'date'))
-        self.events = sorted(self._collection.get_events_on(day))
+        if events is None:
+            events = self._collection.get_events_on(day)
+        self.events = list(events)
         event_list.extend([
             urwid.AttrMap(
                 U_Event(event, conf=self._conf, this_date=day, delete_status=self.delete_status),
@@ -547,6 +622,17 @@ class StaticDayWalker(DayWalker):
         if update:
             self.ensure_date(self[0].date)
 
+    def update_days(self, days):
+        """refresh contents of all loaded days in `days`
+
+        :type days: set(datetime.date)
+        """
+        if any(one.date in days for one in self):
+            self.ensure_date(self[0].date)
+
+    def prefetch(self):
+        """all days are fetched anew in ensure_date() anyway"""
+
     def set_focus(self, position):
         """set focus by item number"""
         return urwid.SimpleFocusListWalker.set_focus(self, position)
@@ -671,6 +757,14 @@ class EventColumn(urwid.WidgetWrap):
         self.pane.base_widget.calendar.base_widget.reset_styles_range(min_date, max_date)
         self.dlistbox.body.update_range(min_date, max_date)
 
+    def update_days(self, days):
+        """update DateListBoxes and calendar styles of all displayed `days`
+
+        :type days: set(datetime.date)
+        """
+        self.pane.base_widget.calendar.base_widget.reset_styles_days(days)
+        self.dlistbox.body.update_days(days)
+
     def refresh_titles(self, min_date, max_date, everything):
         """refresh titles in DateListBoxes
 
@@ -683,6 +777,10 @@ class EventColumn(urwid.WidgetWrap):
         """refresh titles in DateListBoxes"""
         self.dlistbox.update_date_line()
 
+    def prefetch(self):
+        """fetch the events of the days next to the loaded ones"""
+        self.dlistbox.body.prefetch()
+
     def edit(self, event, always_save=False, external_edit=False):
         """create an EventEditor and display it
 
@@ -696,33 +794,16 @@ class EventColumn(urwid.WidgetWrap):
                 ('alert', 'Calendar `{}` is read-only.'.format(event.calendar)))
             return
 
-        if isinstance(event.start_local, dt.datetime):
-            original_start = event.start_local.date()
-        else:
-            original_start = event.start_local
-        if isinstance(event.end_local, dt.datetime):
-            original_end = event.end_local.date()
-        else:
-            original_end = event.end_local
-
-        def update_colors(new_start, new_end, everything=False):
-            """reset colors in the calendar widget and dates in DayWalker
-            between min(new_start, original_start)
+        def update_colors(new_start, days):
+            """reset colors in the calendar widget and dates in DayWalker on
+            all `days` the original or the edited event are shown on
 
             :type new_start: datetime.date
-            :type new_end: datetime.date
-            :param everything: set to True if event is a recurring one, than everything
-                  gets reseted
+            :type days: set(datetime.date)
             """
-            # TODO cleverer support for recurring events, where more than start and
-            # end dates are affected (complicated)
             if isinstance(new_start, dt.datetime):
                 new_start = new_start.date()
-            if isinstance(new_end, dt.datetime):
-                new_end = new_end.date()
-            start = min(original_start, new_start)
-            end = max(original_end, new_end)
-            self.pane.eventscolumn.base_widget.update(start, end, everything)
+            self.pane.eventscolumn.base_widget.update_days(days)
 
             # set original focus date
             self.pane.calendar.original_widget.set_focus_date(new_start)
@@ -747,12 +828,8 @@ class EventColumn(urwid.WidgetWrap):
                 calendar=event.calendar,
                 etag=event.etag,
             )
-            self.pane.collection.update(new_event)
-            update_colors(
-                new_event.start_local,
-                new_event.end_local,
-                (event.recurring or new_event.recurring)
-            )
+            days = self.pane.collection.update(new_event)
+            update_colors(new_event.start_local, days)
         else:
             self.editor = True
             editor = EventEditor(self.pane, event, update_colors, always_save=always_save)
@@ -844,17 +921,13 @@ class EventColumn(urwid.WidgetWrap):
         # up on disk but not be displayed in khal
         event = self.focus_event.event.duplicate()
         try:
-            self.pane.collection.new(event)
+            days = self.pane.collection.new(event)
         except ReadOnlyCalendarError:
             event.calendar = self.pane.collection.default_calendar_name or \
                 self.pane.collection.writable_names[0]
             self.edit(event, always_save=True)
-        start_date, end_date = event.start_local, event.end_local
-        if isinstance(start_date, dt.datetime):
-            start_date = start_date.date()
-        if isinstance(end_date, dt.datetime):
-            end_date = end_date.date()
-        self.pane.eventscolumn.base_widget.update(start_date, end_date, event.recurring)
+        else:
+            self.pane.eventscolumn.base_widget.update_days(days)
         try:
             self._old_focus = self.focus_position
         except IndexError:
@@ -1120,7 +1193,7 @@ class ClassicView(Pane):
     def _search(self, search_term):
         """search for events matching `search_term"""
         self.window.backtrack()
-        events = sorted(self.collection.search(search_term))
+        events = sorted(self.collection.search(search_term), key=attrgetter('sort_key'))
         event_list = []
         event_list.extend([
             urwid.AttrMap(
@@ -1286,12 +1359,22 @@ def start_pane(pane, callback, program_info='', quit_keys=['q']):
                 '[Press `{}` to view log]'.format(pane._conf['keybindings']['log'][0])
             )
 
+    # records logged by other threads, urwid's widgets may only be touched
+    # from the main loop, they are emitted once the background refresh is done
+    deferred_records = []
+
     class LogPaneHandler(logging.Handler):
         def emit(self, record):
+            if threading.current_thread() is not threading.main_thread():
+                deferred_records.append((self, record))
+                return
             frame.log(self.format(record))
 
     class LogHeaderHandler(logging.Handler):
         def emit(self, record):
+            if threading.current_thread() is not threading.main_thread():
+                deferred_records.append((self, record))
+                return
             frame.alert(self.format(record))
 
     if len(logger.handlers) > 0 and not isinstance(logger.handlers[-1], logging.FileHandler):
@@ -1325,15 +1408,46 @@ def start_pane(pane, callback, program_info='', quit_keys=['q']):
 
     loop.set_alarm_in(60, redraw_today, pane)
 
-    def check_for_updates(loop, pane):
-        if pane.collection.needs_update():
+    refresh = {'running': False}
+
+    def update_db():
+        """update the db in a thread of its own, with a new connection"""
+        try:
+            pane.collection.copy()
+        except Exception:
+            logger.exception('Updating the database failed.')
+        os.write(refresh_pipe, b'done')
+
+    def db_updated(data):
+        """called in the main loop, once update_db() is done"""
+        for handler, record in deferred_records:
+            handler.emit(record)
+        del deferred_records[:]
+        # the db is up to date by now, this only catches up with its state
+        pane.collection.update_db()
+        pane.eventscolumn.base_widget.update(None, None, everything=True)
+        pane.window.alert('detected external vdir modification, updated.')
+        refresh['running'] = False
+
+    def vdirs_changed():
+        # needs_update() also consumes the watcher's events, it must be called
+        # even while a refresh is running
+        if pane.collection.needs_update() and not refresh['running']:
             pane.window.alert('detected external vdir modification, updating...')
-            pane.collection.update_db()
-            pane.eventscolumn.base_widget.update(None, None, everything=True)
-            pane.window.alert('detected external vdir modification, updated.')
+            refresh['running'] = True
+            threading.Thread(target=update_db, daemon=True).start()
+
+    def check_for_updates(loop, pane):
+        vdirs_changed()
         loop.set_alarm_in(60, check_for_updates, pane)
 
-    loop.set_alarm_in(60, check_for_updates, pane)
+    refresh_pipe = loop.watch_pipe(db_updated)
+    watcher = pane.collection.watch()
+    if watcher is not None:
+        loop.watch_file(watcher, vdirs_changed)
+    else:
+        loop.set_alarm_in(60, check_for_updates, pane)
+    loop.event_loop.enter_idle(pane.eventscolumn.original_widget.prefetch)
     # Make urwid use 256 color mode.
     loop.screen.set_terminal_properties(
         colors=256, bright_is_bold=pane._conf['view']['bold_for_light_color'])
@@ -409,6 +409,14 @@ class CalendarWalker(urwid.SimpleFocusListWalker):
                 focus = ((row, column) == focus_pos)
                 self[row][column].reset_styles(focus)
 
+    def reset_styles_days(self, days):
+        """reset styles for all (displayed) dates in `days`"""
+        focus_pos = self.focus, self[self.focus].focus_col
+        for day in days:
+            if self.earliest_date <= day <= self.latest_date:
+                row, column = self.get_date_pos(day)
+                self[row][column].reset_styles((row, column) == focus_pos)
+
     def get_date_pos(self, a_day):
         """get row and column where `a_day` is located
 
@@ -643,6 +651,9 @@ class CalendarWidget(urwid.WidgetWrap):
     def reset_styles_range(self, min_date, max_date):
         self.walker.reset_styles_range(min_date, max_date)
 
+    def reset_styles_days(self, days):
+        self.walker.reset_styles_days(days)
+
     @property
     def focus_date(self):
         return self.walker.focus_date
@@ -1,10 +1,13 @@
 
 import datetime as dt
+import sqlite3
 from operator import itemgetter
 
 import icalendar
 import pkg_resources
 import pytest
+from freezegun import freeze_time
+from khal import utils
 from khal.khalendar import backend
 from khal.khalendar.exceptions import OutdatedDbVersionError, UpdateFailed
 
@@ -13,13 +16,87 @@ from .utils import BERLIN, LOCALE_BERLIN, _get_text
 calname = 'home'
 
 
-def test_new_db_version():
+def test_new_db_version(monkeypatch):
     dbi = backend.SQLiteDb(calname, ':memory:', locale=LOCALE_BERLIN)
-    backend.DB_VERSION += 1
+    monkeypatch.setattr(backend, 'DB_VERSION', backend.DB_VERSION + 1)
     with pytest.raises(OutdatedDbVersionError):
         dbi._check_table_version()
 
 
+def test_migration(tmpdir):
+    """a database of khal 0.10.1 (version 5) gets migrated"""
+    dbpath = str(tmpdir) + '/khal.db'
+    conn = sqlite3.connect(dbpath)
+    conn.executescript('''
+        CREATE TABLE version (version INTEGER);
+        CREATE TABLE calendars (
+            calendar TEXT NOT NULL UNIQUE, resource TEXT NOT NULL, ctag TEXT);
+        CREATE TABLE events (
+            href TEXT NOT NULL, calendar TEXT NOT NULL, sequence INT, etag TEXT, item TEXT,
+            primary key (href, calendar));
+        CREATE TABLE recs_loc (
+            dtstart INT NOT NULL, dtend INT NOT NULL, href TEXT NOT NULL REFERENCES events( href ),
+            rec_inst TEXT NOT NULL, ref TEXT NOT NULL, dtype INT NOT NULL,
+            calendar TEXT NOT NULL, primary key (href, rec_inst, calendar));
+        CREATE TABLE recs_float (
+            dtstart INT NOT NULL, dtend INT NOT NULL, href TEXT NOT NULL REFERENCES events( href ),
+            rec_inst TEXT NOT NULL, ref TEXT NOT NULL, dtype INT NOT NULL,
+            calendar TEXT NOT NULL, primary key (href, rec_inst, calendar));
+        INSERT INTO version (version) VALUES (5);
+    ''')
+    conn.execute("INSERT INTO calendars (calendar, resource) VALUES (?, '');", (calname, ))
+    conn.execute('INSERT INTO events (href, calendar, etag, item) VALUES (?, ?, ?, ?);',
+                 ('simple.ics', calname, 'abcd', _get_text('event_dt_simple')))
+    conn.execute('INSERT INTO events (href, calendar, etag, item) VALUES (?, ?, ?, ?);',
+                 ('rr.ics', calname, 'efgh', _get_text('event_dt_rr')))
+    start = utils.to_unix_time(BERLIN.localize(dt.datetime(2014, 4, 9, 9, 30)))
+    conn.execute("INSERT INTO recs_loc VALUES (?, ?, 'simple.ics', ?, 'PROTO', 1, ?);",
+                 (start, start + 3600, str(start), calname))
+    for day in range(10):
+        start = utils.to_unix_time(dt.datetime(2014, 4, 9 + day, 9, 30))
+        conn.execute("INSERT INTO recs_float VALUES (?, ?, 'rr.ics', ?, 'PROTO', 1, ?);",
+                     (start, start + 3600, str(start), calname))
+    conn.commit()
+    conn.close()
+
+    dbi = backend.SQLiteDb([calname], dbpath, locale=LOCALE_BERLIN)
+    assert dbi.sql_ex('SELECT version FROM version;', ()) == [(backend.DB_VERSION, )]
+    # the expansion window starts (a day) before the earliest stored instance
+    assert dbi.get_window(calname)[0] == \
+        utils.to_unix_time(BERLIN.localize(dt.datetime(2014, 4, 8, 9, 30)))
+    assert sorted(dbi.sql_ex('SELECT href, recurring, uid FROM events;', ())) == [
+        ('rr.ics', 1, None), ('simple.ics', 0, None)]
+    assert sorted(dbi.list(calname)) == [('rr.ics', 'efgh'), ('simple.ics', 'abcd')]
+    events = list(dbi.get_localized(
+        BERLIN.localize(dt.datetime(2014, 4, 9, 0, 0)),
+        BERLIN.localize(dt.datetime(2014, 4, 10, 0, 0)),
+    ))
+    assert [event[1] for event in events] == ['simple.ics']
+    # properties of migrated events are not known yet
+    assert events[0][7] is None
+    events = list(dbi.get_floating(dt.datetime(2014, 4, 1), dt.datetime(2014, 5, 1)))
+    assert len(events) == 10
+    assert len(list(dbi.search('Event'))) == 2
+
+    window_start = dbi.get_window(calname)[0]
+    dbi.update(_get_text('event_dt_simple'), 'simple.ics', 'ijkl', calendar=calname)
+    assert dbi.get_etag('simple.ics', calname) == 'ijkl'
+    events = list(dbi.get_localized(
+        BERLIN.localize(dt.datetime(2014, 4, 9, 0, 0)),
+        BERLIN.localize(dt.datetime(2014, 4, 10, 0, 0)),
+    ))
+    assert [event[1] for event in events] == ['simple.ics']
+    # querying before the window extends it
+    assert list(dbi.get_floating(dt.datetime(2013, 1, 1), dt.datetime(2013, 2, 1))) == []
+    assert dbi.get_window(calname)[0] < window_start
+    events = list(dbi.get_floating(dt.datetime(2014, 4, 1), dt.datetime(2014, 5, 1)))
+    assert len(events) == 10
+
+    dbi.sql_ex('UPDATE version SET version = 4;', ())
+    with pytest.raises(OutdatedDbVersionError):
+        backend.SQLiteDb([calname], dbpath, locale=LOCALE_BERLIN)
+
+
 def test_event_rrule_recurrence_id():
     dbi = backend.SQLiteDb([calname], ':memory:', locale=LOCALE_BERLIN)
     assert dbi.list(calname) == list()
@@ -174,7 +251,7 @@ def test_event_recuid_rrule_no_master():
     assert events[0][3] == dt.datetime(2014, 6, 30, 12, 0)
     assert events[1][2] == dt.datetime(2014, 7, 7, 8, 30)
     assert events[1][3] == dt.datetime(2014, 7, 7, 12, 0)
-    events = dbi.search('VEVENT')
+    events = dbi.search('Arbeit')
     assert len(list(events)) == 2
 
 
@@ -208,6 +285,213 @@ def test_event_delete():
     assert len(list(events)) == 0
 
 
+@pytest.mark.parametrize('rtree', [True, False])
+def test_interval_index(monkeypatch, rtree):
+    """the interval index needs to stay in sync with the recurrence instances"""
+    if not rtree:
+        monkeypatch.setattr(backend, 'has_module', lambda conn, module: False)
+    dbi = backend.SQLiteDb([calname], ':memory:', locale=LOCALE_BERLIN)
+    assert dbi._rtree is (rtree and backend.has_module(dbi.conn, 'rtree'))
+    dbi.update(event_rrule_recurrence_id_reverse, href='12345.ics', etag='abcd', calendar=calname)
+    # a point in time inside of one instance (2014-07-07 09:00 - 14:00)
+    events = list(dbi.get_localized(BERLIN.localize(dt.datetime(2014, 7, 7, 10, 0)),
+                                    BERLIN.localize(dt.datetime(2014, 7, 7, 10, 0))))
+    assert len(events) == 1
+    assert events[0][2] == BERLIN.localize(dt.datetime(2014, 7, 7, 9, 0))
+    # updating the event replaces all instances
+    dbi.update(event_rrule_recurrence_id_reverse, href='12345.ics', etag='efgh', calendar=calname)
+    events = dbi.get_localized(BERLIN.localize(dt.datetime(2014, 6, 30, 0, 0)),
+                               BERLIN.localize(dt.datetime(2014, 9, 26, 0, 0)))
+    assert len(list(events)) == 6
+    if dbi._rtree:
+        dbi.cursor.execute('SELECT count(*) FROM recs_index')
+        assert dbi.cursor.fetchone()[0] == 6
+    dbi.delete('12345.ics', calendar=calname)
+    events = dbi.get_localized(BERLIN.localize(dt.datetime(2014, 6, 30, 0, 0)),
+                               BERLIN.localize(dt.datetime(2014, 9, 26, 0, 0)))
+    assert len(list(events)) == 0
+    if dbi._rtree:
+        dbi.cursor.execute('SELECT count(*) FROM recs_index')
+        assert dbi.cursor.fetchone()[0] == 0
+
+
+def test_get_range():
+    """floating and localized events are returned in one list, ordered by
+    their start in local time"""
+    dbi = backend.SQLiteDb([calname], ':memory:', locale=LOCALE_BERLIN)
+    dbi.update(_get_text('event_dt_simple').replace('T093000', 'T100000').replace(
+        'T103000', 'T110000'), href='localized.ics', calendar=calname)
+    dbi.update(_get_text('event_dt_floating'), href='floating.ics', calendar=calname)
+    dbi.update(_get_text('event_d'), href='allday.ics', calendar=calname)
+    events = list(dbi.get_range(dt.datetime(2014, 4, 9), dt.datetime(2014, 4, 9, 23, 59)))
+    assert [event[1] for event in events] == ['allday.ics', 'floating.ics', 'localized.ics']
+    assert events[0][2] == dt.date(2014, 4, 9)
+    assert events[1][2] == dt.datetime(2014, 4, 9, 9, 30)
+    assert events[2][2] == BERLIN.localize(dt.datetime(2014, 4, 9, 10))
+    assert sorted(dbi.get_calendars(dt.datetime(2014, 4, 9), dt.datetime(2014, 4, 9, 23, 59))) \
+        == [calname] * 3
+    assert list(dbi.get_range(dt.datetime(2014, 4, 10), dt.datetime(2014, 4, 10, 23, 59))) == []
+
+
+def test_get_range_dst():
+    """floating events are ordered by the UTC offset at their start, not at
+    the start of the range"""
+    dbi = backend.SQLiteDb([calname], ':memory:', locale=LOCALE_BERLIN)
+    dbi.update(_get_text('event_dt_floating').replace('20140409T093000', '20140405T233000')
+               .replace('20140409T103000', '20140406T003000'),
+               href='floating.ics', calendar=calname)
+    dbi.update(_get_text('event_dt_simple').replace('20140409T093000', '20140406T001500')
+               .replace('20140409T103000', '20140406T011500'),
+               href='localized.ics', calendar=calname)
+    events = list(dbi.get_range(dt.datetime(2014, 3, 20), dt.datetime(2014, 11, 8)))
+    assert [event[1] for event in events] == ['floating.ics', 'localized.ics']
+    assert backend.get_utc_offsets(
+        BERLIN, utils.to_unix_time(dt.datetime(2014, 3, 20)),
+        utils.to_unix_time(dt.datetime(2014, 11, 8)),
+    ) == [
+        (utils.to_unix_time(dt.datetime(2014, 3, 20)), 3600),
+        (utils.to_unix_time(dt.datetime(2014, 3, 30, 3)), 7200),
+        (utils.to_unix_time(dt.datetime(2014, 10, 26, 2)), 3600),
+    ]
+
+
+@freeze_time('2014-04-01')
+def test_update_days():
+    """update and delete return the days on which the event was or is shown"""
+    dbi = backend.SQLiteDb([calname], ':memory:', locale=LOCALE_BERLIN)
+    rrule = _get_text('event_dt_rr').replace('COUNT=10', 'COUNT=3')
+    days = dbi.update(rrule, href='rr.ics', calendar=calname)
+    assert days == {dt.date(2014, 4, 9), dt.date(2014, 4, 10), dt.date(2014, 4, 11)}
+    days = dbi.update(rrule.replace('COUNT=3', 'COUNT=2'), href='rr.ics', calendar=calname)
+    assert days == {dt.date(2014, 4, 9), dt.date(2014, 4, 10), dt.date(2014, 4, 11)}
+    assert dbi.delete('rr.ics', calendar=calname) == {dt.date(2014, 4, 9), dt.date(2014, 4, 10)}
+
+    simple = _get_text('event_dt_simple')
+    assert dbi.update(simple, href='simple.ics', calendar=calname) == {dt.date(2014, 4, 9)}
+    days = dbi.update(simple.replace('20140409T', '20140412T'), href='simple.ics',
+                      calendar=calname)
+    assert days == {dt.date(2014, 4, 9), dt.date(2014, 4, 12)}
+    assert dbi.delete('unknown.ics', calendar=calname) == set()
+
+
+def test_get_calendars_by_day():
+    """the calendars of all days in a range are returned at once, on the same
+    days the events are returned by get_range"""
+    dbi = backend.SQLiteDb(['home', 'work'], ':memory:', locale=LOCALE_BERLIN)
+    # localized, ending at midnight
+    dbi.update(_get_text('event_dt_simple').replace('T093000', 'T220000').replace(
+        '20140409T103000', '20140410T000000'), href='localized.ics', calendar='home')
+    # localized, spanning three days
+    dbi.update(_get_text('event_dt_simple').replace('20140409T093000', '20140410T220000').replace(
+        '20140409T103000', '20140412T010000'), href='long.ics', calendar='home')
+    dbi.update(_get_text('event_dt_floating'), href='floating.ics', calendar='work')
+    dbi.update(_get_text('event_d'), href='allday.ics', calendar='work')
+    days = dbi.get_calendars_by_day(dt.date(2014, 4, 8), dt.date(2014, 4, 13))
+    assert days == {
+        dt.date(2014, 4, 8): set(),
+        dt.date(2014, 4, 9): {'home', 'work'},
+        dt.date(2014, 4, 10): {'home'},
+        dt.date(2014, 4, 11): {'home'},
+        dt.date(2014, 4, 12): {'home'},
+        dt.date(2014, 4, 13): set(),
+    }
+    for day, calendars in days.items():
+        start = dt.datetime.combine(day, dt.time.min)
+        end = dt.datetime.combine(day, dt.time.max)
+        assert set(dbi.get_calendars(start, end)) == calendars
+
+
+@freeze_time('2017-06-01')
+def test_expansion_window():
+    """instances of recurring events are only stored around now, until
+    events outside of this window are requested"""
+    dbi = backend.SQLiteDb([calname], ':memory:', locale=LOCALE_BERLIN)
+    dbi.update(_get_text('event_r_past'), href='12345.ics', etag='abcd', calendar=calname)
+    dbi.cursor.execute('SELECT count(*) FROM recs')
+    assert dbi.cursor.fetchone()[0] <= 5
+    events = list(dbi.get_floating(dt.datetime(2045, 4, 1), dt.datetime(2045, 5, 1)))
+    assert len(events) == 1
+    assert events[0][2] == dt.date(2045, 4, 23)
+    events = list(dbi.get_floating(dt.datetime(1965, 4, 1), dt.datetime(1966, 5, 1)))
+    assert [event[2] for event in events] == [dt.date(1965, 4, 23), dt.date(1966, 4, 23)]
+    window_start, window_end = dbi.get_window(calname)
+    assert window_start <= utils.to_unix_time(dt.datetime(1965, 4, 1))
+    assert window_end >= utils.to_unix_time(dt.datetime(2045, 5, 1))
+
+    # updating the event keeps the extended window
+    dbi.update(_get_text('event_r_past'), href='12345.ics', etag='efgh', calendar=calname)
+    events = list(dbi.get_floating(dt.datetime(2045, 4, 1), dt.datetime(2045, 5, 1)))
+    assert len(events) == 1
+
+
+@freeze_time('2017-06-01')
+def test_expansion_window_limits():
+    """the window can be extended up to the years 1 and 9999"""
+    dbi = backend.SQLiteDb([calname], ':memory:', locale=LOCALE_BERLIN)
+    dbi.update(_get_text('event_r_past'), href='12345.ics', etag='abcd', calendar=calname)
+    events = list(dbi.get_floating(dt.datetime(9998, 1, 1), dt.datetime(9998, 12, 31)))
+    assert [event[2] for event in events] == [dt.date(9998, 4, 23)]
+    events = list(dbi.get_floating(dt.datetime(9999, 1, 1), dt.datetime(9999, 12, 31)))
+    assert [event[2] for event in events] == [dt.date(9999, 4, 23)]
+    # event_r_past starts in 1965
+    assert list(dbi.get_floating(dt.datetime(2, 1, 1), dt.datetime(2, 12, 31))) == []
+    assert list(dbi.get_floating(dt.datetime(1, 1, 1), dt.datetime(1, 12, 31))) == []
+
+
+event_search = """BEGIN:VCALENDAR
+BEGIN:VEVENT
+UID:search
+SUMMARY:Lunch
+DESCRIPTION:with the whole team
+LOCATION:Kantine
+CATEGORIES:food,social
+ATTENDEE;CN=Frida Kahlo:mailto:frida@example.com
+RRULE:FREQ=WEEKLY;COUNT=10
+DTSTART;TZID=Europe/Berlin:20140630T120000
+DTEND;TZID=Europe/Berlin:20140630T130000
+END:VEVENT
+END:VCALENDAR
+"""
+
+event_search_team = """BEGIN:VCALENDAR
+BEGIN:VEVENT
+UID:search_team
+SUMMARY:Team meeting
+DTSTART;TZID=Europe/Berlin:20140701T120000
+DTEND;TZID=Europe/Berlin:20140701T130000
+END:VEVENT
+END:VCALENDAR
+"""
+
+
+@freeze_time('2014-06-01')
+@pytest.mark.parametrize('fts', [True, False])
+def test_search(monkeypatch, fts):
+    if not fts:
+        monkeypatch.setattr(backend, 'has_module', lambda conn, module: False)
+    dbi = backend.SQLiteDb([calname], ':memory:', locale=LOCALE_BERLIN)
+    dbi.update(event_search, href='search.ics', etag='abcd', calendar=calname)
+    dbi.update(event_search_team, href='team.ics', etag='abcd', calendar=calname)
+    # one result per event, not per instance
+    events = list(dbi.search('Kantine'))
+    assert len(events) == 1
+    assert events[0][1] == 'search.ics'
+    assert events[0][2] == BERLIN.localize(dt.datetime(2014, 6, 30, 12, 0))
+    for term in ['lunch', 'social', 'Frida', 'frida@example.com']:
+        assert [event[1] for event in dbi.search(term)] == ['search.ics']
+    # property names and other noise are not searched
+    assert list(dbi.search('VEVENT')) == []
+    assert list(dbi.search('Europe')) == []
+    assert len(list(dbi.search('team'))) == 2
+    if dbi._fts:
+        # a match in the summary ranks higher than one in the description
+        assert [event[1] for event in dbi.search('team')] == ['team.ics', 'search.ics']
+        assert [event[1] for event in dbi.search('Fri Kah')] == ['search.ics']
+    dbi.delete('search.ics', calendar=calname)
+    assert list(dbi.search('Kantine')) == []
+    assert [event[1] for event in dbi.search('team')] == ['team.ics']
+
+
 event_rrule_this_and_prior = """
 BEGIN:VCALENDAR
 BEGIN:VEVENT
@@ -796,3 +1080,22 @@ def test_birthday_v3():
             dt.datetime(2016, 3, 11, 0, 0),
             dt.datetime(2016, 3, 11, 23, 59, 59, 999)))
     assert 'SUMMARY:Unix\'s birthday' in events[0][0]
+
+
+def test_concurrent_access(tmpdir):
+    dbpath = str(tmpdir) + '/khal.db'
+    writer = backend.SQLiteDb([calname], dbpath, locale=LOCALE_BERLIN)
+    reader = backend.SQLiteDb([calname], dbpath, locale=LOCALE_BERLIN)
+    assert writer.sql_ex('PRAGMA journal_mode;', ()) == [('wal', )]
+    with writer.at_once():
+        writer.update(_get_text('event_dt_simple'), href='12345.ics', etag='abcd',
+                      calendar=calname)
+        # reading does not wait for the writer, uncommitted changes are not seen
+        assert reader.list(calname) == []
+    assert reader.list(calname) == [('12345.ics', 'abcd')]
+
+    with pytest.raises(ValueError):
+        with writer.at_once():
+            writer.delete('12345.ics', calendar=calname)
+            raise ValueError
+    assert reader.list(calname) == [('12345.ics', 'abcd')]
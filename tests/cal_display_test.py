@@ -1,7 +1,9 @@
 import datetime as dt
+import gc
 import locale
 import platform
 import unicodedata
+import weakref
 
 import pytest
 from khal.calendar_display import (getweeknumber, str_week, vertical_month,
@@ -37,6 +39,7 @@ def test_str_week():
 class testCollection():
     def __init__(self):
         self._calendars = {}
+        self._color_lists = {}
 
     def addCalendar(self, name, color, priority):
         self._calendars[name] = {'color': color, 'priority': priority}
@@ -96,6 +99,19 @@ def test_get_color_list():
     assert testList3[0] == 'dark red'
 
 
+def test_get_color_list_memoized_per_collection():
+    collection = testCollection()
+    collection.addCalendar('testCalendar1', 'dark red', 20)
+    assert get_color_list(['testCalendar1'], 'light_blue', collection) == ['dark red']
+    assert collection._color_lists == {
+        (frozenset(['testCalendar1']), 'light_blue'): ('dark red', )}
+    # the collection is not kept alive by the memo
+    ref = weakref.ref(collection)
+    del collection
+    gc.collect()
+    assert ref() is None
+
+
 example1 = [
     '\x1b[1m    Mo Tu We Th Fr Sa Su \x1b[0m',
     '\x1b[1mDec \x1b[0m28 29 30  1  2  3  4 ',
@@ -21,6 +21,7 @@ def coll_vdirs(tmpdir):
                            'readonly': readonly, 'unicode_symbols': True}
         vdirs[name] = Vdir(path, '.ics')
     coll = CalendarCollection(calendars=calendars, dbpath=':memory:', locale=LOCALE_BERLIN)
+    coll.update_db()
     coll.default_calendar_name = cal1
     return coll, vdirs
 
@@ -36,6 +37,7 @@ def coll_vdirs_birthday(tmpdir):
                            'readonly': readonly, 'unicode_symbols': True, 'ctype': 'birthdays'}
         vdirs[name] = Vdir(path, '.vcf')
     coll = CalendarCollection(calendars=calendars, dbpath=':memory:', locale=LOCALE_BERLIN)
+    coll.update_db()
     coll.default_calendar_name = cal1
     return coll, vdirs
 
@@ -42,7 +42,7 @@ class TestGetAgenda:
         event = coll.new_event(event_today, utils.cal1)
         coll.new(event)
         assert ['                 a meeting :: short description\x1b[0m'] == \
-            khal_list(coll, [], conf, agenda_format=event_format, day_format="")
+            list(khal_list(coll, [], conf, agenda_format=event_format, day_format=""))
 
     def test_new_event_day_format(self, coll_vdirs):
         coll, vdirs = coll_vdirs
@@ -50,7 +50,7 @@ class TestGetAgenda:
         coll.new(event)
         assert ['Today\x1b[0m',
                 '                 a meeting :: short description\x1b[0m'] == \
-            khal_list(coll, [], conf, agenda_format=event_format, day_format="{name}")
+            list(khal_list(coll, [], conf, agenda_format=event_format, day_format="{name}"))
 
     def test_agenda_default_day_format(self, coll_vdirs):
         with freeze_time('2016-04-10 12:33'):
@@ -60,8 +60,8 @@ class TestGetAgenda:
             coll, vdirs = coll_vdirs
             event = coll.new_event(event_today, utils.cal1)
             coll.new(event)
-            out = khal_list(
-                coll, conf=conf, agenda_format=event_format, datepoint=[])
+            out = list(khal_list(
+                coll, conf=conf, agenda_format=event_format, datepoint=[]))
             assert [
                 '\x1b[1m10.04.2016 12:33\x1b[0m\x1b[0m',
                 '↦                a meeting :: short description\x1b[0m'] == out
@@ -90,6 +90,67 @@ class TestGetAgenda:
         assert 'no events' in '\n'.join(
             khal_list(coll, [], conf, agenda_format=event_format, day_format="{name}")).lower()
 
+    def test_multiple_days(self, coll_vdirs, monkeypatch):
+        """events of all days are fetched at once, multi-day events are listed
+        on every day they span"""
+        coll, vdirs = coll_vdirs
+        coll.new(coll.new_event(dedent(
+            'BEGIN:VEVENT\r\n'
+            'UID:long\r\n'
+            'SUMMARY:long event\r\n'
+            'DTSTART;TZID=Europe/Berlin:20140409T140000\r\n'
+            'DTEND;TZID=Europe/Berlin:20140411T000000\r\n'
+            'END:VEVENT\r\n'
+        ), utils.cal1))
+        coll.new(coll.new_event(dedent(
+            'BEGIN:VEVENT\r\n'
+            'UID:daily\r\n'
+            'SUMMARY:daily event\r\n'
+            'RRULE:FREQ=DAILY;COUNT=2\r\n'
+            'DTSTART:20140410T090000\r\n'
+            'DTEND:20140410T100000\r\n'
+            'END:VEVENT\r\n'
+        ), utils.cal1))
+        calls = []
+        get_range = coll.get_range
+        monkeypatch.setattr(
+            coll, 'get_range', lambda start, end: calls.append(start) or get_range(start, end))
+        out = khal_list(coll, ['09.04.2014', '12.04.2014'], conf, agenda_format='{title}',
+                        day_format='{date}')
+        assert [line.replace('\x1b[0m', '') for line in out] == [
+            '09.04.', 'long event',
+            '10.04.', 'long event', 'daily event',
+            '11.04.', 'daily event',
+        ]
+        assert len(calls) == 1
+
+    def test_multiple_days_dst(self, coll_vdirs):
+        """events are listed on their days even if the range crosses a DST
+        change"""
+        coll, vdirs = coll_vdirs
+        coll.new(coll.new_event(dedent(
+            'BEGIN:VEVENT\r\n'
+            'UID:floating\r\n'
+            'SUMMARY:floating late\r\n'
+            'DTSTART:20140405T233000\r\n'
+            'DTEND:20140405T235000\r\n'
+            'END:VEVENT\r\n'
+        ), utils.cal1))
+        coll.new(coll.new_event(dedent(
+            'BEGIN:VEVENT\r\n'
+            'UID:localized\r\n'
+            'SUMMARY:localized early\r\n'
+            'DTSTART;TZID=Europe/Berlin:20140406T001500\r\n'
+            'DTEND;TZID=Europe/Berlin:20140406T003000\r\n'
+            'END:VEVENT\r\n'
+        ), utils.cal1))
+        out = khal_list(coll, ['20.03.2014', '08.04.2014'], conf, agenda_format='{title}',
+                        day_format='{date}')
+        assert [line.replace('\x1b[0m', '') for line in out] == [
+            '05.04.', 'floating late',
+            '06.04.', 'localized early',
+        ]
+
 
 class TestImport:
     def test_import(self, coll_vdirs):
@@ -5,7 +5,8 @@ import pytz
 from freezegun import freeze_time
 from icalendar import vRecur, vText
 from khal.khalendar.event import (AllDayEvent, Event, FloatingEvent,
-                                  LocalizedEvent, create_timezone)
+                                  FormatAttributes, LocalizedEvent,
+                                  create_timezone)
 
 from .utils import (BERLIN, BOGOTA, GMTPLUS3, LOCALE_BERLIN, LOCALE_BOGOTA,
                     LOCALE_MIXED, NEW_YORK, _get_text, normalize_component)
@@ -137,6 +138,29 @@ def test_transform_event():
         event.update_start_end(start, dt.date(2014, 4, 9))
 
 
+@pytest.mark.parametrize('name', ['event_d', 'event_dt_simple', 'event_dt_floating'])
+def test_events_have_no_dict(name):
+    event = Event.fromString(_get_text(name), **EVENT_KWARGS)
+    assert not hasattr(event, '__dict__')
+    with pytest.raises(AttributeError):
+        event.foo = 'bar'
+
+
+def test_sort_key():
+    event_dt = Event.fromString(_get_text('event_dt_simple'), **EVENT_KWARGS)
+    event_d = Event.fromString(_get_text('event_d'), **EVENT_KWARGS)
+    event_floating = Event.fromString(_get_text('event_dt_floating'), **EVENT_KWARGS)
+    assert sorted([event_dt, event_floating, event_d]) == [event_d, event_dt, event_floating]
+    assert event_d.sort_key < event_dt.sort_key
+
+    event_dt.update_start_end(
+        BERLIN.localize(dt.datetime(2014, 4, 8, 9, 30)),
+        BERLIN.localize(dt.datetime(2014, 4, 8, 10, 30)),
+    )
+    assert event_dt.start_local == BERLIN.localize(dt.datetime(2014, 4, 8, 9, 30))
+    assert sorted([event_floating, event_d, event_dt]) == [event_dt, event_d, event_floating]
+
+
 def test_update_event_d():
     event_d = _get_text('event_d')
     event = Event.fromString(event_d, **EVENT_KWARGS)
@@ -449,6 +473,13 @@ def test_format_colors():
     assert event.format(format_, dt.date(2014, 4, 9), colors=False) == 'An Event'
 
 
+def test_format_computes_only_used_attributes():
+    event = Event.fromString(_get_text('event_dt_simple'), **EVENT_KWARGS)
+    attributes = FormatAttributes(event, dt.date(2014, 4, 9), {}, True)
+    assert '{start-end-time-style} {title}'.format_map(attributes) == '09:30-10:30 An Event'
+    assert sorted(attributes) == ['end-time', 'start-end-time-style', 'start-time', 'title']
+
+
 def test_event_alarm():
     event = Event.fromString(_get_text('event_dt_simple'), **EVENT_KWARGS)
     assert event.alarms == []
@@ -11,7 +11,7 @@ from freezegun import freeze_time
 from khal import icalendar as icalendar_helpers
 from khal.khalendar import CalendarCollection
 from khal.khalendar.backend import CouldNotCreateDbDir
-from khal.khalendar.event import Event
+from khal.khalendar.event import Event, LocalizedEvent
 from khal.khalendar.vdir import Item
 
 from . import utils
@@ -94,6 +94,92 @@ class TestCalendar(object):
                 calendar, coll._local_ctag(calendar), coll._backend.get_ctag(calendar)))
         assert coll._needs_update(cal1) is False
 
+    def test_copy_updates_db(self, coll_vdirs, sleep_time, tmpdir):
+        coll, vdirs = coll_vdirs
+        # an in-memory db cannot be shared between connections
+        coll = CalendarCollection(
+            calendars=coll._calendars, dbpath=str(tmpdir) + '/khal.db', locale=LOCALE_BERLIN,
+            processes=0)
+        coll.update_db()
+        sleep(sleep_time)
+        vdirs[cal1].upload(item_today)
+        assert coll.needs_update() is True
+
+        copy = coll.copy()
+        assert copy._backend.conn is not coll._backend.conn
+        # copies are used from other threads, they must not fork
+        assert copy._processes == 1
+        assert coll._needs_update(cal1) is False
+        assert len(list(coll.get_events_on(today))) == 1
+
+    def test_save_during_copy(self, coll_vdirs, sleep_time, tmpdir, monkeypatch):
+        """the original collection can write to the db while the copy updates it"""
+        coll, vdirs = coll_vdirs
+        # don't wait for the lock for long, if the copy holds it
+        monkeypatch.setattr(khal.khalendar.backend, 'BUSY_TIMEOUT', 1)
+        coll = CalendarCollection(
+            calendars=coll._calendars, dbpath=str(tmpdir) + '/khal.db', locale=LOCALE_BERLIN)
+        coll.update_db()
+        sleep(sleep_time)
+        vdirs[cal1].upload(item_today)
+
+        parse_event = khal.khalendar.backend.parse_event
+        saved = []
+
+        def save_and_parse(*args):
+            if not saved:
+                saved.append(True)
+                event = coll.new_event(event_today.replace('uid3', 'uid4'), cal1)
+                coll.new(event)
+            return parse_event(*args)
+
+        monkeypatch.setattr(khal.khalendar.backend, 'parse_event', save_and_parse)
+        copy = coll.copy()
+        assert saved
+        assert len(list(copy.get_events_on(today))) == 2
+        assert len(list(coll.get_events_on(today))) == 2
+
+    def test_watch(self, coll_vdirs, sleep_time):
+        coll, vdirs = coll_vdirs
+        if coll.watch() is None:
+            pytest.skip('vdirs cannot be watched on this system')
+        assert coll.needs_update() is False
+
+        href, _ = vdirs[cal1].upload(item_today)
+        vdirs[cal1].set_meta('color', '#ff0000')
+        assert coll.needs_update() is True
+        assert coll._changes == {cal1: {href}}
+        coll.update_db()
+        assert coll.needs_update() is False
+        assert len(list(coll.get_events_on(today))) == 1
+
+        # changes made by khal itself are not reported
+        coll.new(Event.fromString(_get_text('event_d'), calendar=cal1, locale=LOCALE_BERLIN))
+        assert coll.needs_update() is False
+
+        sleep(sleep_time)
+        os.remove(os.path.join(vdirs[cal1].path, href))
+        assert coll.needs_update() is True
+        coll.update_db()
+        assert list(coll.get_events_on(today)) == []
+        assert coll._needs_update(cal1) is False
+
+    def test_sync_lazily(self, coll_vdirs):
+        coll, vdirs = coll_vdirs
+        href, _ = vdirs[cal1].upload(item_today)
+        vdirs[cal2].upload(Item(_get_text('event_d')))
+        coll = CalendarCollection(calendars=coll._calendars, dbpath=':memory:',
+                                  locale=LOCALE_BERLIN)
+        assert coll._backend.list(cal1) == []
+        assert coll._backend.list(cal2) == []
+
+        assert coll.get_event(href, cal1).uid == 'uid3@host1.com'
+        assert len(coll._backend.list(cal1)) == 1
+        assert coll._backend.list(cal2) == []
+
+        assert len(list(coll.get_events_on(aday))) == 1
+        assert len(coll._backend.list(cal2)) == 1
+
 
 class TestVdirsyncerCompat(object):
     def test_list(self, coll_vdirs):
@@ -187,6 +273,37 @@ class TestCollection(object):
         assert len(list(vdirs[cal3].list())) == 0
         assert list(coll.get_localized(self.bstart_berlin, self.bend_berlin)) == []
 
+    def test_get_calendars_on(self, coll_vdirs):
+        """the calendars of a whole month are cached, until the db changes"""
+        coll, vdirs = coll_vdirs
+        assert coll.get_calendars_on(aday) == []
+        assert dt.date(2014, 4, 30) in coll._day_calendars
+        event = Event.fromString(_get_text('event_d'), calendar=cal1, locale=LOCALE_BERLIN)
+        coll.new(event, cal1)
+        coll.new(Event.fromString(_get_text('event_dt_simple'), calendar=cal2,
+                                  locale=LOCALE_BERLIN), cal2)
+        assert coll.get_calendars_on(aday) == sorted([cal1, cal2])
+        assert coll.get_calendars_on(bday) == []
+        coll.delete(event.href, event.etag, cal1)
+        assert coll.get_calendars_on(aday) == [cal2]
+
+    def test_get_events_per_day_out_of_order(self, coll_vdirs, monkeypatch):
+        """events whose local days are slightly out of order (as UTC offsets
+        change) are still shown on their days"""
+        coll, vdirs = coll_vdirs
+        coll.new(Event.fromString(_get_text('event_d'), calendar=cal1, locale=LOCALE_BERLIN))
+        event_str = _get_text('event_dt_simple').replace('20140409T', '20140408T').replace(
+            'UID:V042MJ8B3SJNFXQOJL6P53OFMHJE8Z3VZWOU', 'UID:simple')
+        coll.new(Event.fromString(event_str, calendar=cal1, locale=LOCALE_BERLIN))
+        start = dt.datetime(2014, 4, 7)
+        end = dt.datetime(2014, 4, 10, 23, 59)
+        events = list(coll.get_range(start, end))
+        assert [event.start.day for event in events] == [8, 9]
+        monkeypatch.setattr(coll, 'get_range', lambda start, end: reversed(events))
+        assert [(day.day, [event.summary for event in events]) for day, events in
+                coll.get_events_per_day(start, end)] == [
+            (7, []), (8, ['An Event']), (9, ['An Event']), (10, [])]
+
     def test_insert_d_no_value(self, coll_vdirs):
         """insert a date event with no VALUE=DATE option"""
         coll, vdirs = coll_vdirs
@@ -288,7 +405,7 @@ class TestCollection(object):
         event = Event.fromString(
             _get_text('event_dt_recuid_no_master'), calendar=cal1, locale=LOCALE_BERLIN)
         coll.new(event, cal1)
-        assert len(list(coll.search('Event'))) == 1
+        assert len(list(coll.search('Infrastructure'))) == 1
 
     def test_search_recurrence_id_only_multi(self, coll_vdirs):
         """test searching for recurring events which only have a recuid event,
@@ -298,7 +415,7 @@ class TestCollection(object):
         event = Event.fromString(
             _get_text('event_dt_multi_recuid_no_master'), calendar=cal1, locale=LOCALE_BERLIN)
         coll.new(event, cal1)
-        events = list(sorted(coll.search('Event')))
+        events = list(sorted(coll.search('Arbeit')))
         assert len(events) == 2
         assert events[0].format(
             '{start} {end} {title}', dt.date.today()) == '30.06. 07:30 30.06. 12:00 Arbeit\x1b[0m'
@@ -502,6 +619,37 @@ def test_only_update_old_event(coll_vdirs, monkeypatch, sleep_time):
     assert updated_hrefs == [href_three]
 
 
+@freeze_time('2014-04-01')
+def test_update_db_parallel(coll_vdirs, monkeypatch, caplog):
+    coll, vdirs = coll_vdirs
+    monkeypatch.setattr(khal.khalendar.khalendar, 'PARALLEL_MIN_UPDATES', 2)
+    monkeypatch.setattr(khal.khalendar.khalendar, 'PARSE_CHUNKSIZE', 2)
+    for name in ['event_dt_simple', 'event_d', 'event_dt_rr', 'event_rrule_recuid',
+                 'event_dt_multi_uid']:
+        vdirs[cal1].upload(Item(_get_text(name).replace(SIMPLE_EVENT_UID, name)))
+
+    parallel = CalendarCollection(
+        calendars=coll._calendars, dbpath=':memory:', locale=LOCALE_BERLIN, processes=2)
+    serial = CalendarCollection(
+        calendars=coll._calendars, dbpath=':memory:', locale=LOCALE_BERLIN)
+    parallel.update_db()
+    parallel_messages = [(record.levelno, record.getMessage()) for record in caplog.records]
+    caplog.clear()
+    serial.update_db()
+    assert 'Cannot parse events in parallel' not in caplog.text
+    assert 'This event will not be available in khal' in caplog.text
+    # messages logged while parsing in the other processes are handled here
+    assert 'multiple UIDs' in caplog.text
+    assert parallel_messages == \
+        [(record.levelno, record.getMessage()) for record in caplog.records]
+    assert sorted(parallel._backend.list(cal1)) == sorted(serial._backend.list(cal1))
+    assert len(parallel._backend.list(cal1)) == 4
+    start = dt.datetime(2014, 4, 1)
+    end = dt.datetime(2014, 8, 1)
+    assert [event.summary for event in parallel.get_range(start, end)] == \
+        [event.summary for event in serial.get_range(start, end)]
+
+
 card = """BEGIN:VCARD
 VERSION:3.0
 FN:Unix
@@ -581,3 +729,86 @@ def test_birthdays_no_year(coll_vdirs_birthday):
     events = list(coll.get_floating(dt.datetime(1971, 3, 11), dt.datetime(1971, 3, 11, 23, 59, 59)))
     assert len(events) == 1
     assert 'Unix\'s birthday' == events[0].summary
+
+
+def test_birthdays_update_db(coll_vdirs_birthday, monkeypatch, sleep_time):
+    """unchanged vcards are not updated, removed vcards are deleted"""
+    coll, vdirs = coll_vdirs_birthday
+    href_unix, etag_unix = vdirs[cal1].upload(DumbItem(card, 'unix.vcf'))
+    href_leap, etag_leap = vdirs[cal1].upload(DumbItem(card_29thfeb, 'leap.vcf'))
+    coll.update_db()
+
+    old_update_vevent = coll._update_vevent
+    updated_hrefs = []
+
+    def _update_vevent(href, calendar):
+        updated_hrefs.append(href)
+        return old_update_vevent(href, calendar)
+    monkeypatch.setattr(coll, '_update_vevent', _update_vevent)
+
+    sleep(sleep_time)
+    vdirs[cal1].delete(href_leap, etag_leap)
+    sleep(sleep_time)
+    coll.update_db()
+    assert updated_hrefs == []
+    assert len(list(coll.get_floating(
+        dt.datetime(2012, 3, 11), dt.datetime(2012, 3, 11, 23, 59, 59)))) == 1
+    assert list(coll.get_floating(
+        dt.datetime(2012, 2, 29), dt.datetime(2012, 2, 29, 23, 59, 59))) == []
+
+
+@pytest.mark.parametrize('name', [
+    'event_dt_simple', 'event_dt_london', 'event_dt_floating', 'event_dt_rr', 'event_d_rr',
+    'event_d', 'event_dt_two_tz', 'event_rrule_recuid', 'event_dtr_exdatez',
+    'event_dt_duration', 'event_dt_long', 'invalid_tzoffset', 'event_dt_floating_dst',
+])
+def test_events_from_stored_properties(coll_vdirs, name):
+    """events displayed from the properties stored in the db look just like
+    parsed ones"""
+    coll, vdirs = coll_vdirs
+    coll._backend.update(_get_text(name), href=name, calendar=cal1)
+    format_ = ('{start} {end} {duration} {repeat-symbol}{repeat-pattern} {title} '
+               '{organizer} {description} {location} {categories} {status} '
+               '{start-end-time-style} {to-style} {end-necessary}')
+    events = list(coll.get_events_on(dt.date(2014, 4, 9))) + \
+        list(coll.get_events_on(dt.date(2014, 6, 30))) + \
+        list(coll.get_events_on(dt.date(2012, 12, 2))) + \
+        list(coll.get_events_on(dt.date(2014, 3, 30)))
+    assert events
+    for event in events:
+        if isinstance(event, LocalizedEvent):
+            start, end = event.start_local, event.end_local
+        else:
+            # localizing floating events would change their duration across DST
+            start, end = event.start, event.end
+        parsed = Event.fromString(
+            coll._backend.get(event.href, cal1), ref=event.ref, locale=LOCALE_BERLIN,
+            start=start, end=end, calendar=cal1)
+        assert event.format(format_, dt.date(2014, 4, 9)) == \
+            parsed.format(format_, dt.date(2014, 4, 9))
+        assert event.uid == parsed.uid
+    # events with a DURATION are always parsed
+    unparsed = all(event._vevents_dict is None for event in events)
+    assert unparsed != (name in ['event_dt_duration', 'event_dtr_exdatez'])
+
+
+@freeze_time('2014-04-01')
+def test_instances_share_parsed_vevents(coll_vdirs):
+    coll, vdirs = coll_vdirs
+    coll.new(Event.fromString(_get_text('event_dt_rr'), calendar=cal1, locale=LOCALE_BERLIN))
+    first = list(coll.get_events_on(dt.date(2014, 4, 9)))[0]
+    second = list(coll.get_events_on(dt.date(2014, 4, 10)))[0]
+    # the RRULE object is not stored in the db, the events need to be parsed
+    assert first.recurobject == second.recurobject
+    assert first._vevents is second._vevents
+    assert len(coll._parsed) == 1
+
+    # changing one instance does not change the others
+    second.update_summary('changed')
+    assert first._vevents is not second._vevents
+    assert first.summary == 'An Event'
+    assert list(coll.get_events_on(dt.date(2014, 4, 11)))[0].summary == 'An Event'
+
+    coll.update(second)
+    assert len(coll._parsed) == 0
+    assert list(coll.get_events_on(dt.date(2014, 4, 11)))[0].summary == 'changed'
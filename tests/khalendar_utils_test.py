@@ -724,6 +724,16 @@ class TestRDate(object):
         assert dtstarts[0][0] == dt.date(1965, 4, 23)
         assert dtstarts[-1][0] == dt.date(2037, 4, 23)
 
+    def test_rrule_past_window(self):
+        vevent = _get_vevent_file('event_r_past')
+        dtstarts = icalendar_helpers.expand(
+            vevent, berlin,
+            pytz.UTC.localize(dt.datetime(2040, 1, 1)),
+            pytz.UTC.localize(dt.datetime(2042, 1, 1)),
+        )
+        assert dtstarts == [(dt.date(2040, 4, 23), dt.date(2040, 4, 24)),
+                            (dt.date(2041, 4, 23), dt.date(2041, 4, 24))]
+
     def test_rdate_date(self):
         vevent = _get_vevent_file('event_d_rdate')
         dtstarts = icalendar_helpers.expand(vevent, berlin)
@@ -30,7 +30,9 @@ class TestSettings(object):
                 'work': {'path': os.path.expanduser('~/.calendars/work/'),
                          'readonly': False, 'color': None, 'priority': 10, 'type': 'calendar'},
             },
-            'sqlite': {'path': os.path.expanduser('~/.local/share/khal/khal.db')},
+            'sqlite': {'path': os.path.expanduser('~/.local/share/khal/khal.db'),
+                       'journal_mode': 'wal',
+                       'update_processes': 0},
             'locale': LOCALE_BERLIN,
             'default': {
                 'default_calendar': None,
@@ -67,7 +69,9 @@ class TestSettings(object):
                 'work': {'path': os.path.expanduser('~/.calendars/work/'),
                          'readonly': True, 'color': None, 'priority': 10,
                          'type': 'calendar'}},
-            'sqlite': {'path': os.path.expanduser('~/.local/share/khal/khal.db')},
+            'sqlite': {'path': os.path.expanduser('~/.local/share/khal/khal.db'),
+                       'journal_mode': 'wal',
+                       'update_processes': 0},
             'locale': {
                 'local_timezone': get_localzone(),
                 'default_timezone': get_localzone(),
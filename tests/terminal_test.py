@@ -1,4 +1,4 @@
-from khal.terminal import colored, merge_columns
+from khal.terminal import colored, iter_merge_columns, merge_columns
 
 
 def test_colored():
@@ -29,3 +29,16 @@ class TestMergeColumns:
         right = ['123456', '234567']
         out = ['uiae    123456', 'nrtd    234567', 'xvlc    ']
         assert merge_columns(left, right, width=4) == out
+
+    def test_lazy_right(self):
+        consumed = []
+
+        def right():
+            for row in ['123456', '234567', '345678']:
+                consumed.append(row)
+                yield row
+
+        rows = iter_merge_columns(['uiae', 'nrtd'], right(), width=4)
+        assert next(rows) == 'uiae    123456'
+        assert consumed == ['123456']
+        assert list(rows) == ['nrtd    234567', '        345678']
@@ -4,7 +4,7 @@ from freezegun import freeze_time
 
 from khal.ui import DayWalker, DListBox, StaticDayWalker
 
-from ..utils import LOCALE_BERLIN
+from ..utils import LOCALE_BERLIN, cal1
 from .canvas_render import CanvasTranslator
 
 CONF = {'locale': LOCALE_BERLIN, 'keybindings': {},
@@ -43,6 +43,61 @@ def test_daywalker(coll_vdirs):
 """
 
 
+@freeze_time('2017-6-7')
+def test_daywalker_update_days(coll_vdirs):
+    """only the days an event is shown on are rebuilt"""
+    collection, _ = coll_vdirs
+    conf = dict(CONF)
+    conf['view'] = {'agenda_event_format': '{title}', 'event_format': '{title}'}
+    daywalker = DayWalker(
+        dt.date.today(), None, conf, collection, delete_status=lambda recuid: False)
+    for _ in range(3):
+        daywalker._autoextend()
+    event = collection.new_event(
+        'BEGIN:VEVENT\r\n'
+        'UID:two_days\r\n'
+        'SUMMARY:two days\r\n'
+        'DTSTART;VALUE=DATE:20170608\r\n'
+        'DTEND;VALUE=DATE:20170610\r\n'
+        'END:VEVENT\r\n', cal1)
+    days = collection.new(event)
+    assert days == {dt.date(2017, 6, 8), dt.date(2017, 6, 9)}
+    before = {one.date: one for one in daywalker}
+    daywalker.update_days(days | {dt.date(2018, 1, 1)})
+    for one in daywalker:
+        if one.date in days:
+            assert one is not before[one.date]
+            assert len(one.original_widget.body) == 2
+        else:
+            assert one is before[one.date]
+
+
+@freeze_time('2017-6-7')
+def test_daywalker_bounded(coll_vdirs, monkeypatch):
+    """days far away from the focus are dropped, new ones fetched in blocks"""
+    collection, _ = coll_vdirs
+    daywalker = DayWalker(dt.date.today(), None, CONF, collection, delete_status=dict())
+    daywalker.max_days = 10
+    daywalker.prefetch_days = 5
+    calls = []
+    get_events_per_day = collection.get_events_per_day
+    monkeypatch.setattr(
+        collection, 'get_events_per_day',
+        lambda start, end: calls.append(start) or get_events_per_day(start, end))
+    for _ in range(20):
+        daywalker.set_focus(daywalker.focus + 1)
+    assert len(daywalker) == 10
+    assert daywalker[daywalker.focus].date == dt.date(2017, 6, 27)
+    assert [one.date for one in daywalker] == \
+        [dt.date(2017, 6, 19) + dt.timedelta(days=days) for days in range(10)]
+    assert len(calls) == 3
+    daywalker.prefetch()
+    assert calls[3:] == [dt.datetime(2017, 6, 14)]
+    daywalker.ensure_date(dt.date(2018, 6, 7))
+    assert [one.date for one in daywalker] == \
+        [dt.date(2018, 6, 6), dt.date(2018, 6, 7), dt.date(2018, 6, 8)]
+
+
 @freeze_time('2017-6-7')
 def test_staticdaywalker(coll_vdirs):
     collection, _ = coll_vdirs
@@ -86,3 +86,22 @@ def test_etag_sleep(tmpdir, sleep_time):
     new_etag = vdir.get_etag_from_file(fpath)
 
     assert old_etag != new_etag
+
+
+def test_list_etags(tmpdir):
+    path = str(tmpdir)
+    os.mkdir(os.path.join(path, 'subdir.ics'))
+    for fname in ['foo.ics', 'bar.ics', 'color']:
+        with open(os.path.join(path, fname), 'w') as file_:
+            file_.write('foo')
+
+    storage = vdir.Vdir(path, '.ics')
+    etags = dict(storage.list())
+    assert sorted(etags) == ['bar.ics', 'foo.ics']
+    for fname, etag in etags.items():
+        # listing does not sync, but returns the same etags
+        assert etag == vdir.get_etag_from_file(os.path.join(path, fname))
+        assert etag == storage.get_etag(fname)
+        assert etag == storage.get(fname)[1]
+    with pytest.raises(vdir.NotFoundError):
+        storage.get_etag('baz.ics')
@@ -62,6 +62,13 @@ def test_berlin_rdate():
     assert vberlin_dst in vberlin
 
 
+def test_cached():
+    # atime and Christmas 2014 fall between the same two transitions
+    vberlin = create_timezone(berlin, atime, atime)
+    assert create_timezone(berlin, dt.datetime(2014, 12, 24), dt.datetime(2014, 12, 24)) is vberlin
+    assert create_timezone(berlin, atime, btime) is not vberlin
+
+
 def test_bogota(pytz_version):
     vbogota = [b'BEGIN:VTIMEZONE',
                b'TZID:America/Bogota',